@@ -0,0 +1,524 @@
+"""
+backup_crypto.py
+
+Streaming, authenticated container format shared by encrypted_backup.py,
+encrypted_backup_gui.py and decrypt_backup.py.
+
+Layout of an encrypted backup (.enc):
+
+    header   MAGIC "GSBK" | version | flags | frame size | 16-byte salt |
+             KDF id | log2 N | r | p | 16-byte KDF salt
+    frame 0  4-byte length word | AES-256-GCM ciphertext + tag
+    frame 1  ...
+    frame N  the last frame has LAST_FRAME set in its length word
+    index    (FLAG_INDEX only) 4-byte length | AES-256-GCM ciphertext + tag
+    trailer  (FLAG_INDEX only) 8-byte offset of the index | "GIDX"
+
+Every frame holds exactly `frame size` plaintext bytes except the last one,
+so memory use is bounded by one frame and frame i always starts at a known
+offset. The backup key is derived from the password with scrypt; its parameters
+and salt are stored in the header, so they can be raised later without
+breaking old backups. Each frame is encrypted with a per-file key (HKDF of
+the backup key and the header salt); the nonce is the frame index plus a final-frame flag
+and the header is authenticated with every frame, so reordering, truncation
+or header tampering all fail authentication.
+
+Indexed backups append an encrypted central index after the last frame, so
+a reader can list the contents by decrypting only the index and restore one
+file by decrypting only the frames it spans (see BackupReader).
+
+Version 1 backups (no KDF fields, unsalted SHA-256 key) and backups written
+before this format (a single Fernet token) still decrypt.
+"""
+
+import base64
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# ==========================================
+# FORMAT CONSTANTS
+# ==========================================
+
+MAGIC = b"GSBK"
+VERSION = 2
+FRAME_SIZE = 1024 * 1024
+
+PREFIX = struct.Struct(">4sB")                  # magic, version
+HEADER_V1 = struct.Struct(">4sBBI16s")          # magic, version, flags, frame size, salt
+HEADER = struct.Struct(">4sBBI16sBBBB16s")      # ... + KDF id, log2 N, r, p, KDF salt
+LENGTH = struct.Struct(">I")            # ciphertext length | LAST_FRAME
+LAST_FRAME = 0x80000000
+TAG_SIZE = 16
+
+FLAG_INDEX = 0x01
+TRAILER = struct.Struct(">Q4s")         # offset of the index, INDEX_MAGIC
+INDEX_MAGIC = b"GIDX"
+# frame nonces use 0/1 in the last four bytes; the index gets its own value
+INDEX_NONCE = struct.pack(">QI", 0, 2)
+
+
+class BackupFormatError(Exception):
+    """Raised for corrupt, truncated or tampered backups (or a wrong password)."""
+
+
+# ==========================================
+# KEY DERIVATION
+# ==========================================
+
+KDF_SCRYPT = 1
+
+# scrypt cost: N = 2**log_n, memory is about 128 * r * N bytes (128 MiB here)
+KdfParams = namedtuple("KdfParams", "log_n r p")
+DEFAULT_KDF = KdfParams(log_n=17, r=8, p=1)
+
+# the highest cost encrypted_backup.py --kdf-cost writes; a header asking for
+# more scrypt memory than that (4 GiB) is rejected before any key is derived
+MAX_KDF_COST = 22
+MAX_KDF_MEMORY = 128 * DEFAULT_KDF.r << MAX_KDF_COST
+
+# derived keys are forgotten after this many seconds without use
+KEY_CACHE_SECONDS = 300
+
+
+def scrypt(password, salt, params):
+    n = 1 << params.log_n
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=params.r, p=params.p,
+                          maxmem=256 * params.r * n + (1 << 20), dklen=32)
+
+
+class KeySession:
+    """
+    A password plus a short-lived cache of the keys derived from it.
+
+    scrypt is deliberately slow, so every (salt, params) pair is derived
+    once and reused for KEY_CACHE_SECONDS: verifying or restoring many
+    backups written with the same KDF salt pays the cost once. New backups
+    written through one session share its KDF salt for the same reason;
+    every file still gets its own frame key from the per-file header salt.
+    """
+
+    def __init__(self, password, params=DEFAULT_KDF, salt=None, ttl=KEY_CACHE_SECONDS, _cache=None):
+        self.password = password
+        self.params = KdfParams(*params)
+        self.salt = salt or os.urandom(16)
+        self.ttl = ttl
+        self._cache = {} if _cache is None else _cache
+        self._lock = threading.Lock()
+
+    def with_salt(self, salt, params):
+        """A session that writes with this KDF salt/params and shares the cache."""
+        return KeySession(self.password, params, salt, self.ttl, self._cache)
+
+    def master(self, salt=None, params=None):
+        """The 32-byte backup key for a KDF salt (default: this session's)."""
+        salt = salt or self.salt
+        params = KdfParams(*(params or self.params))
+        now = time.monotonic()
+        with self._lock:
+            for k in [k for k, (_, used) in self._cache.items() if now - used > self.ttl]:
+                del self._cache[k]
+            entry = self._cache.get((salt, params))
+            if entry is None:
+                entry = (scrypt(self.password, salt, params), now)
+            self._cache[(salt, params)] = (entry[0], now)
+            return entry[0]
+
+    def legacy_master(self):
+        # version 1 backups: one unsalted SHA-256 of the password
+        return hashlib.sha256(self.password.encode()).digest()
+
+    def legacy_key(self):
+        # single-token Fernet backups
+        return base64.urlsafe_b64encode(self.legacy_master())
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def generate_key(password, params=DEFAULT_KDF):
+    """Key session for `password`; pass it wherever a backup key is expected."""
+    return KeySession(password, params)
+
+# ==========================================
+# FRAME CIPHER
+# ==========================================
+
+def subkey(master, purpose, salt=None):
+    """Derive an independent 32-byte key for `purpose` from a KeySession.master() key."""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=purpose)
+    return hkdf.derive(master)
+
+
+def _frame_key(master, salt):
+    return subkey(master, b"GSBK frame key", salt)
+
+
+def _frame_cipher(master, salt):
+    return AESGCM(_frame_key(master, salt))
+
+
+def _nonce(index, last):
+    return struct.pack(">QI", index, 1 if last else 0)
+
+
+# ==========================================
+# WRITER
+# ==========================================
+
+class FrameWriter:
+    """
+    File-like object that encrypts everything written to it into `fileobj`
+    frame by frame. It is not seekable, so zipfile can stream into it.
+    close() writes the final frame; it does not close `fileobj`.
+
+    With indexed=True, set `index_data` (bytes) before close(); it is
+    encrypted and appended after the final frame.
+    """
+
+    def __init__(self, fileobj, key, frame_size=FRAME_SIZE, indexed=False):
+        self.fileobj = fileobj
+        self.frame_size = frame_size
+        self.indexed = indexed
+        self.index_data = b""
+        salt = os.urandom(16)
+        self.header = HEADER.pack(MAGIC, VERSION, FLAG_INDEX if indexed else 0, frame_size, salt,
+                                  KDF_SCRYPT, *key.params, key.salt)
+        self.cipher = _frame_cipher(key.master(), salt)
+        self.buffer = bytearray()
+        self.index = 0
+        self.position = 0
+        self.written = len(self.header)
+        self.closed = False
+        fileobj.write(self.header)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.frame_size:
+            self._emit(bytes(self.buffer[:self.frame_size]), last=False)
+            del self.buffer[:self.frame_size]
+        return len(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def _emit(self, plaintext, last):
+        ct = self.cipher.encrypt(_nonce(self.index, last), plaintext, self.header)
+        self.fileobj.write(LENGTH.pack(len(ct) | (LAST_FRAME if last else 0)))
+        self.fileobj.write(ct)
+        self.written += LENGTH.size + len(ct)
+        self.index += 1
+
+    def close(self):
+        if self.closed:
+            return
+        # the final frame carries the remainder, possibly empty
+        self._emit(bytes(self.buffer), last=True)
+        self.buffer.clear()
+        if self.indexed:
+            ct = self.cipher.encrypt(INDEX_NONCE, self.index_data, self.header)
+            self.fileobj.write(LENGTH.pack(len(ct)) + ct + TRAILER.pack(self.written, INDEX_MAGIC))
+        self.fileobj.flush()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # a failed stream is left without its final frame, so it never reads as complete
+        if exc_type is None:
+            self.close()
+
+
+# ==========================================
+# READER
+# ==========================================
+
+def read_header(fileobj):
+    """
+    Read a backup header; returns (raw header, KDF salt, KdfParams).
+    The KDF salt is None for version 1 backups.
+    """
+    prefix = fileobj.read(PREFIX.size)
+    if len(prefix) != PREFIX.size:
+        raise BackupFormatError("Backup header is truncated.")
+    magic, version = PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise BackupFormatError("Not a framed backup.")
+    if version not in (1, VERSION):
+        raise BackupFormatError(f"Unsupported backup format version {version}.")
+    layout = HEADER_V1 if version == 1 else HEADER
+    header = prefix + fileobj.read(layout.size - PREFIX.size)
+    if len(header) != layout.size:
+        raise BackupFormatError("Backup header is truncated.")
+    if version == 1:
+        return header, None, None
+    kdf, log_n, r, p, kdf_salt = HEADER.unpack(header)[5:]
+    if kdf != KDF_SCRYPT:
+        raise BackupFormatError(f"Unsupported key derivation function {kdf}.")
+    if not (1 <= log_n <= MAX_KDF_COST and 1 <= r <= 32 and 1 <= p <= 16) or 128 * r << log_n > MAX_KDF_MEMORY:
+        raise BackupFormatError("Key derivation parameters out of range.")
+    return header, kdf_salt, KdfParams(log_n, r, p)
+
+
+class FrameReader:
+    """Decrypts a framed backup read from `fileobj`, one frame at a time."""
+
+    def __init__(self, fileobj, key):
+        self.fileobj = fileobj
+        self.header, self.kdf_salt, self.kdf_params = read_header(fileobj)
+        _, _, self.flags, self.frame_size, salt = HEADER_V1.unpack_from(self.header)
+        if self.kdf_salt is None:
+            master = key.legacy_master()
+        else:
+            master = key.master(self.kdf_salt, self.kdf_params)
+        self.frame_key = _frame_key(master, salt)
+        self.cipher = AESGCM(self.frame_key)
+
+    def frames(self):
+        """Yield the plaintext of every frame; raises BackupFormatError on tampering or truncation."""
+        index = 0
+        while True:
+            word = self.fileobj.read(LENGTH.size)
+            if len(word) != LENGTH.size:
+                raise BackupFormatError("Backup is truncated (no final frame).")
+            (length,) = LENGTH.unpack(word)
+            last = bool(length & LAST_FRAME)
+            length &= ~LAST_FRAME
+            if length > self.frame_size + TAG_SIZE:
+                raise BackupFormatError(f"Frame {index} is larger than the frame size.")
+            ct = self.fileobj.read(length)
+            if len(ct) != length:
+                raise BackupFormatError(f"Frame {index} is truncated.")
+            try:
+                yield self.cipher.decrypt(_nonce(index, last), ct, self.header)
+            except InvalidTag:
+                raise BackupFormatError(f"Frame {index} failed authentication (wrong password or corrupt backup).")
+            if last:
+                # the index of an indexed backup follows; BackupReader checks it
+                if not self.flags & FLAG_INDEX and self.fileobj.read(1):
+                    raise BackupFormatError("Unexpected data after the final frame.")
+                return
+            index += 1
+
+
+# ==========================================
+# RANDOM ACCESS
+# ==========================================
+
+def _read_frame(fileobj, cipher, header, frame_size, i, last):
+    # frame i of a backup with this header; every frame before it is full
+    fileobj.seek(len(header) + i * (LENGTH.size + frame_size + TAG_SIZE))
+    word = fileobj.read(LENGTH.size)
+    if len(word) != LENGTH.size:
+        raise BackupFormatError(f"Frame {i} is truncated.")
+    (length,) = LENGTH.unpack(word)
+    if bool(length & LAST_FRAME) != last or (length & ~LAST_FRAME) > frame_size + TAG_SIZE:
+        raise BackupFormatError(f"Frame {i} has an invalid length word.")
+    ct = fileobj.read(length & ~LAST_FRAME)
+    try:
+        return cipher.decrypt(_nonce(i, last), ct, header)
+    except InvalidTag:
+        raise BackupFormatError(f"Frame {i} failed authentication (wrong password or corrupt backup).")
+
+
+class BackupReader(FrameReader):
+    """
+    Random access to a framed backup in a seekable `fileobj`.
+
+    Every frame but the last holds exactly frame_size plaintext bytes, so
+    frame i starts at a computable offset and read_at() decrypts only the
+    frames a byte range touches (the most recent few are cached).
+    """
+
+    CACHED_FRAMES = 8
+
+    def __init__(self, fileobj, key):
+        super().__init__(fileobj, key)
+        self.stride = LENGTH.size + self.frame_size + TAG_SIZE
+        end = fileobj.seek(0, os.SEEK_END)
+        self.index_offset = None
+        if self.flags & FLAG_INDEX:
+            if end < len(self.header) + TRAILER.size:
+                raise BackupFormatError("Backup is truncated (no index).")
+            fileobj.seek(end - TRAILER.size)
+            offset, magic = TRAILER.unpack(fileobj.read(TRAILER.size))
+            if magic != INDEX_MAGIC or not len(self.header) <= offset < end - TRAILER.size:
+                raise BackupFormatError("Backup index trailer is corrupt.")
+            self.index_offset, self.index_end = offset, end - TRAILER.size
+            end = offset
+        # the last frame holds less than frame_size bytes, so it is the only partial one
+        self.last = (end - len(self.header)) // self.stride
+        self.size = self.last * self.frame_size
+        self._cache = {}
+        self.size += len(self.frame(self.last))
+
+    def frame(self, i):
+        """Decrypt frame i; raises BackupFormatError if it is missing or tampered with."""
+        if i in self._cache:
+            return self._cache[i]
+        if not 0 <= i <= self.last:
+            raise BackupFormatError(f"Frame {i} is out of range.")
+        plaintext = _read_frame(self.fileobj, self.cipher, self.header, self.frame_size, i, i == self.last)
+        if len(self._cache) >= self.CACHED_FRAMES:
+            del self._cache[next(iter(self._cache))]
+        self._cache[i] = plaintext
+        return plaintext
+
+    def read_at(self, offset, length):
+        """Plaintext bytes [offset, offset + length), clipped to the end of the backup."""
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+        first, last = offset // self.frame_size, (end - 1) // self.frame_size
+        data = b"".join(self.frame(i) for i in range(first, last + 1))
+        start = offset - first * self.frame_size
+        return data[start:start + end - offset]
+
+    def read_index(self):
+        """The decrypted central index, or None for a backup written without one."""
+        if self.index_offset is None:
+            return None
+        self.fileobj.seek(self.index_offset)
+        block = self.fileobj.read(self.index_end - self.index_offset)
+        if len(block) < LENGTH.size or LENGTH.unpack_from(block)[0] != len(block) - LENGTH.size:
+            raise BackupFormatError("Backup index is truncated.")
+        ct = block[LENGTH.size:]
+        try:
+            return self.cipher.decrypt(INDEX_NONCE, ct, self.header)
+        except InvalidTag:
+            raise BackupFormatError("Backup index failed authentication (wrong password or corrupt backup).")
+
+
+# ==========================================
+# VERIFY
+# ==========================================
+
+VERIFY_BATCH = 64      # frames per verification task
+
+
+def _verify_frames(path, frame_key, header, frame_size, first, stop, last):
+    # runs in a worker process: authenticate frames [first, stop), keep nothing
+    cipher = AESGCM(frame_key)
+    with open(path, "rb") as f:
+        for i in range(first, stop):
+            _read_frame(f, cipher, header, frame_size, i, i == last)
+    return stop - first
+
+
+def verify_backups(paths, key, workers=None):
+    """
+    Check the authentication tag of every frame (and index) of each backup
+    in `paths` without writing any plaintext. Frames are independent, so
+    ranges of them, across all files, are verified on `workers` processes
+    (default: all cores). Returns {path: (frames, plaintext bytes)};
+    raises BackupFormatError naming the first bad file.
+    """
+    results = {}
+    tasks = []
+
+    for path in paths:
+        try:
+            if not is_framed(path):
+                # legacy single-token Fernet backup: one authenticated blob
+                with open(path, "rb") as f:
+                    results[path] = (1, len(Fernet(key.legacy_key()).decrypt(f.read())))
+                continue
+
+            # the header, index and last frame are checked here; the rest in the pool
+            with open(path, "rb") as f:
+                reader = BackupReader(f, key)
+                reader.read_index()
+        except (BackupFormatError, InvalidToken) as e:
+            raise BackupFormatError(f"{path}: {str(e) or 'failed authentication'}")
+
+        results[path] = (reader.last + 1, reader.size)
+        for first in range(0, reader.last, VERIFY_BATCH):
+            stop = min(first + VERIFY_BATCH, reader.last)
+            tasks.append((path, reader.frame_key, reader.header, reader.frame_size, first, stop, reader.last))
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            _verify_task(task)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_verify_task, task) for task in tasks]
+        try:
+            for fut in futures:
+                fut.result()
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+
+    return results
+
+
+def _verify_task(task):
+    try:
+        return _verify_frames(*task)
+    except BackupFormatError as e:
+        raise BackupFormatError(f"{task[0]}: {e}")
+
+
+# ==========================================
+# FILE HELPERS
+# ==========================================
+
+def is_framed(file_path):
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encrypt_stream(src, dst, key, frame_size=FRAME_SIZE):
+    """Encrypt everything readable from file object `src` into `dst`."""
+    with FrameWriter(dst, key, frame_size) as writer:
+        while chunk := src.read(frame_size):
+            writer.write(chunk)
+
+
+def decrypt_stream(src, dst, key):
+    """Decrypt a framed backup from file object `src` into `dst`."""
+    for plaintext in FrameReader(src, key).frames():
+        dst.write(plaintext)
+
+
+def decrypt_file(encrypted_path, output_path, key):
+    """
+    Decrypt a backup to output_path. Framed backups are streamed in bounded
+    memory; legacy single-token Fernet backups are decrypted in one piece.
+    """
+    tmp_path = output_path + ".part"
+    try:
+        with open(encrypted_path, "rb") as src, open(tmp_path, "wb") as dst:
+            if src.read(len(MAGIC)) == MAGIC:
+                src.seek(0)
+                decrypt_stream(src, dst, key)
+            else:
+                src.seek(0)
+                dst.write(Fernet(key.legacy_key()).decrypt(src.read()))
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+bench_build.py
+
+Build-time benchmark suite for build_lib.py.
+
+Features:
+- Generates synthetic C or template-heavy C++ source trees at a configurable
+  scale (number of sources, number of headers, header fan-out per source).
+- Times clean, no-op and one-file-touched rebuilds under each build mode
+  (serial, parallel -j, incremental, cached, unity).
+- Writes machine-readable JSON results and compares them against a stored
+  baseline, exiting non-zero on regressions.
+
+Usage examples:
+  # 200 plain C files, every source including 8 of 40 headers
+  python bench_build.py --files 200 --headers 40 --fanout 8 --json bench.json
+
+  # template-heavy C++, only the no-op paths, checked against a baseline
+  python bench_build.py --lang cpp --modes incremental unity --scenarios noop \
+      --baseline bench_baseline.json
+
+  # store a new baseline
+  python bench_build.py --json bench_baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BUILD_LIB = Path(__file__).resolve().parent / "build_lib.py"
+
+# build_lib.py arguments per mode; "{jobs}" is replaced by --jobs
+MODES = {
+    "serial": ["-j", "1"],
+    "parallel": ["-j", "{jobs}"],
+    "incremental": ["-j", "{jobs}", "--incremental"],
+    "cached": ["-j", "{jobs}", "--cache"],
+    "unity": ["-j", "{jobs}", "--incremental", "--unity", "{unity}"],
+}
+SCENARIOS = ("clean", "noop", "touch")
+
+# ---------- Synthetic trees ----------
+def c_header(i):
+    return (f"#ifndef BENCH_H{i}\n#define BENCH_H{i}\n"
+            f"typedef struct {{ int a; double b; char name[32]; }} rec{i}_t;\n"
+            f"static inline int h{i}_mix(int x) {{ return (x * {i + 3}) ^ (x >> 3); }}\n"
+            f"int h{i}_api(const rec{i}_t *r);\n"
+            f"#endif\n")
+
+def cpp_header(i):
+    return (f"#pragma once\n#include <vector>\n#include <map>\n#include <string>\n#include <algorithm>\n"
+            f"namespace bench{i} {{\n"
+            f"template <typename T, int N>\nstruct Box {{\n"
+            f"    std::vector<T> items;\n    std::map<std::string, T> index;\n"
+            f"    T sum() const {{ T s{{}}; for (const auto &v : items) s += v * N; return s; }}\n"
+            f"    void sort() {{ std::sort(items.begin(), items.end()); }}\n"
+            f"    void add(const std::string &k, T v) {{ items.push_back(v); index[k] = v; }}\n"
+            f"}};\n}}\n")
+
+def source_text(i, headers, fanout, lang):
+    picked = [(i + k) % headers for k in range(min(fanout, headers))]
+    includes = "".join(f'#include "h{h}.h{"pp" if lang == "cpp" else ""}"\n' for h in picked)
+    if lang == "cpp":
+        body = "".join(f"    bench{h}::Box<double, {k + 1}> b{k}; b{k}.add(\"x\", {i}.0); b{k}.sort(); r += b{k}.sum();\n"
+                       for k, h in enumerate(picked))
+        return f"{includes}double s{i}_run() {{\n    double r = 0;\n{body}    return r;\n}}\n"
+    body = "".join(f"    r += h{h}_mix(x + {k});\n" for k, h in enumerate(picked))
+    return f"{includes}int s{i}_run(int x) {{\n    int r = 0;\n{body}    return r;\n}}\n"
+
+def generate_tree(root: Path, files, headers, fanout, lang, per_dir=50):
+    """Write include/ and src/dNN/ under root; returns the list of generated sources."""
+    inc = root / "include"
+    inc.mkdir(parents=True, exist_ok=True)
+    for i in range(headers):
+        if lang == "cpp":
+            (inc / f"h{i}.hpp").write_text(cpp_header(i))
+        else:
+            (inc / f"h{i}.h").write_text(c_header(i))
+    sources = []
+    ext = ".cpp" if lang == "cpp" else ".c"
+    for i in range(files):
+        d = root / "src" / f"d{i // per_dir:02d}"
+        d.mkdir(parents=True, exist_ok=True)
+        path = d / f"s{i}{ext}"
+        path.write_text(source_text(i, headers, fanout, lang))
+        sources.append(path)
+    return sources
+
+def touch_source(path: Path, n):
+    """Change one source the way an edit would (a new definition, not just a comment or mtime)."""
+    with open(path, "a") as f:
+        f.write(f"int bench_touch_{n}(void) {{ return {n}; }}\n")
+
+# ---------- Timing ----------
+def build_cmd(mode, args, cache_dir):
+    extra = [a.format(jobs=args.jobs, unity=args.unity) for a in MODES[mode]]
+    if mode == "cached":
+        extra += ["--cache-dir", str(cache_dir)]
+    return [sys.executable, str(BUILD_LIB), "--sources", "src", "--include", "include",
+            "--output", "bench", "--type", args.type, "--build-dir", "build"] + extra
+
+def timed(cmd, cwd):
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed:\n{proc.stdout}{proc.stderr}")
+    return seconds
+
+def bench_mode(mode, args, workdir: Path):
+    """Run every scenario of one mode on a fresh copy of the tree; returns {scenario: [seconds, ...]}."""
+    root = workdir / mode
+    sources = generate_tree(root, args.files, args.headers, args.fanout, args.lang)
+    cache_dir = workdir / f"{mode}-cache"
+    cmd = build_cmd(mode, args, cache_dir)
+    if mode == "cached":
+        # warm the cache: "clean" then measures a clean checkout served from the cache
+        timed(cmd, root)
+    samples = {s: [] for s in args.scenarios}
+    touches = 0
+    for _ in range(args.repeat):
+        shutil.rmtree(root / "build", ignore_errors=True)
+        clean = timed(cmd, root)
+        if "clean" in samples:
+            samples["clean"].append(clean)
+        if "noop" in samples:
+            samples["noop"].append(timed(cmd, root))
+        if "touch" in samples:
+            touches += 1
+            touch_source(sources[len(sources) // 2], touches)
+            samples["touch"].append(timed(cmd, root))
+    return samples
+
+def summarize(samples):
+    return {"min": min(samples), "median": statistics.median(samples), "samples": samples}
+
+# ---------- Baselines ----------
+def compare(results, baseline, tolerance, floor):
+    """Return human-readable regressions of results against baseline (median times)."""
+    regressions = []
+    for mode, scenarios in results.items():
+        for scenario, stats in scenarios.items():
+            base = baseline.get(mode, {}).get(scenario)
+            if not base:
+                continue
+            now, before = stats["median"], base["median"]
+            if now > before * (1 + tolerance) and now - before > floor:
+                regressions.append(f"{mode}/{scenario}: {now:.3f}s vs baseline {before:.3f}s "
+                                   f"(+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+def print_table(results):
+    print(f"{'mode':<12}" + "".join(f"{s:>12}" for s in SCENARIOS))
+    for mode, scenarios in results.items():
+        cells = [f"{scenarios[s]['median']:>11.3f}s" if s in scenarios else f"{'-':>12}" for s in SCENARIOS]
+        print(f"{mode:<12}" + "".join(cells))
+
+# ---------- CLI ----------
+def parse_args():
+    ap = argparse.ArgumentParser(description="Benchmark build_lib.py on synthetic C/C++ trees.")
+    ap.add_argument("--files", type=int, default=100, help="Number of generated source files.")
+    ap.add_argument("--headers", type=int, default=20, help="Number of generated headers.")
+    ap.add_argument("--fanout", type=int, default=5, help="Headers included by every source.")
+    ap.add_argument("--lang", choices=("c", "cpp"), default="c", help="Plain C or template-heavy C++.")
+    ap.add_argument("--type", choices=("shared", "static"), default="static", help="Library type to build.")
+    ap.add_argument("--modes", nargs="+", choices=tuple(MODES), default=list(MODES), help="Build modes to time.")
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to time.")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Jobs for the parallel modes.")
+    ap.add_argument("--unity", type=int, default=8, help="Batch size for the unity mode.")
+    ap.add_argument("--repeat", type=int, default=3, help="Repetitions per scenario (median is reported).")
+    ap.add_argument("--workdir", help="Where to generate trees (default: a temporary directory).")
+    ap.add_argument("--json", help="Write results to this JSON file.")
+    ap.add_argument("--baseline", help="Compare against results previously written with --json.")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%).")
+    ap.add_argument("--floor", type=float, default=0.05, help="Ignore slowdowns smaller than this many seconds.")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="bench_build_"))
+    results = {}
+    try:
+        for mode in args.modes:
+            print(f"Benchmarking {mode} ...")
+            results[mode] = {s: summarize(v) for s, v in bench_mode(mode, args, workdir).items()}
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    report = {
+        "config": {k: getattr(args, k) for k in ("files", "headers", "fanout", "lang", "type", "jobs", "unity", "repeat")},
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Warning: baseline was recorded with a different configuration.", file=sys.stderr)
+        regressions = compare(results, baseline.get("results", {}), args.tolerance, args.floor)
+        if regressions:
+            print("Regressions against baseline:", file=sys.stderr)
+            for line in regressions:
+                print("  " + line, file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+bench_sync.py
+
+Benchmarks for sync_data.py: its copy engine against shutil.copy2, and
+delta sync against whole-file copies.
+
+Copies: a large file (and a sparse one, mostly holes) is copied whole by
+shutil.copy2 and by fast_copy with each method allowed in turn; reported
+are MB/s and the space the copy takes on disk. A method the filesystem does
+not support falls through to the next one, so the method actually used is
+reported too.
+
+Delta: a large file is synced once, a few small edits are made to the
+source, and the re-sync is timed three ways:
+- copy:  whole-file shutil.copy2 (delta sync disabled)
+- delta: block patching with the signatures stored by the previous run
+- cold:  block patching without stored signatures (the destination is read)
+
+Reported per case: wall time and bytes written to the destination. Delta
+runs fsync their journal and the patched file; copy runs do not fsync, so
+their times are if anything flattering.
+
+Copies are measured with a warm page cache, so they show the CPU and
+syscall cost of each method rather than the disk.
+
+Usage examples:
+  python bench_sync.py --size 512 --edits 1 10 100
+  python bench_sync.py --size 2048 --block-size 256 --json bench_sync.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import fast_copy
+import sync_data
+
+MODES = ("copy", "delta", "cold")
+ENGINES = ("shutil.copy2",) + fast_copy.METHODS
+
+def make_file(path, size_mb, seed=1):
+    rng = random.Random(seed)
+    block = rng.randbytes(1024 * 1024)
+    with open(path, "wb") as f:
+        for i in range(size_mb):
+            # vary the blocks so no two are identical
+            f.write(i.to_bytes(8, "big") + block[8:])
+
+def edit_file(path, edits, rng):
+    """Overwrite `edits` random 16-byte spans, like a game rewriting a few records."""
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        for _ in range(edits):
+            f.seek(rng.randrange(max(size - 16, 1)))
+            f.write(rng.randbytes(16))
+
+def make_sparse_file(path, size_mb):
+    """size_mb MB, of which 1 MB of data every 16 MB and the rest holes."""
+    block = random.Random(2).randbytes(1024 * 1024)
+    with open(path, "wb") as f:
+        f.truncate(size_mb * 1024 * 1024)
+        for offset in range(0, size_mb, 16):
+            f.seek(offset * 1024 * 1024)
+            f.write(block)
+
+def run_copy_case(workdir, name, size_mb, repeat):
+    src = os.path.join(workdir, name)
+    if name == "sparse.dat":
+        make_sparse_file(src, size_mb)
+    else:
+        make_file(src, size_mb)
+    dst = os.path.join(workdir, "copy.dat")
+    results = {}
+
+    for engine in ENGINES:
+        seconds = []
+        for _ in range(repeat):
+            if os.path.exists(dst):
+                os.remove(dst)
+            start = time.perf_counter()
+            if engine == "shutil.copy2":
+                shutil.copy2(src, dst)
+                method = engine
+            else:
+                method = fast_copy.Copier([engine]).copy_file(src, dst)
+            seconds.append(time.perf_counter() - start)
+        median = statistics.median(seconds)
+        results[engine] = {"method": method, "median_s": median, "mb_per_s": size_mb * 1.048576 / median,
+                           "allocated_mb": os.stat(dst).st_blocks * 512 / 1e6}
+
+    os.remove(dst)
+    os.remove(src)
+    return results
+
+def run_case(workdir, size_mb, edits, block_size, repeat):
+    src = os.path.join(workdir, "src")
+    os.makedirs(src, exist_ok=True)
+    make_file(os.path.join(src, "world.dat"), size_mb)
+    rng = random.Random(edits)
+    samples = {mode: {"seconds": [], "written": []} for mode in MODES}
+    quiet = open(os.devnull, "w")
+
+    for _ in range(repeat):
+        for mode in MODES:
+            dst = os.path.join(workdir, f"dst_{mode}")
+            shutil.rmtree(dst, ignore_errors=True)
+            options = dict(delta_threshold=None if mode == "copy" else 1, block_size=block_size)
+
+            stdout, sys.stdout = sys.stdout, quiet
+            try:
+                sync_data.sync_folders(src, dst, **options)
+                if mode == "delta":
+                    # one patched run so the destination's signatures are stored
+                    edit_file(os.path.join(src, "world.dat"), 1, rng)
+                    sync_data.sync_folders(src, dst, **options)
+                edit_file(os.path.join(src, "world.dat"), edits, rng)
+                start = time.perf_counter()
+                stats = sync_data.sync_folders(src, dst, **options)
+                seconds = time.perf_counter() - start
+            finally:
+                sys.stdout = stdout
+
+            samples[mode]["seconds"].append(seconds)
+            samples[mode]["written"].append(stats.written_bytes)
+
+    quiet.close()
+    return {mode: {"median_s": statistics.median(s["seconds"]), "written_mb": statistics.median(s["written"]) / 1e6}
+            for mode, s in samples.items()}
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Compare delta sync with whole-file copies.")
+    ap.add_argument("--size", type=int, default=256, help="Size of the synced file in MB.")
+    ap.add_argument("--edits", type=int, nargs="+", default=[1, 10, 100], help="Number of 16-byte edits per case.")
+    ap.add_argument("--block-size", type=int, default=sync_data.DELTA_BLOCK_SIZE // 1024, help="Delta block size in KB.")
+    ap.add_argument("--no-copy", action="store_true", help="Skip the copy engine benchmark.")
+    ap.add_argument("--no-delta", action="store_true", help="Skip the delta sync benchmark.")
+    ap.add_argument("--repeat", type=int, default=3, help="Repetitions per case (median is reported).")
+    ap.add_argument("--workdir", help="Where to create files (default: a temporary directory).")
+    ap.add_argument("--json", help="Write results to this JSON file.")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_sync_")
+    copies = {}
+    results = {}
+    try:
+        if not args.no_copy:
+            for name in ("world.dat", "sparse.dat"):
+                print(f"Benchmarking copies of {args.size} MB {name} ...", file=sys.stderr)
+                copies[name] = run_copy_case(workdir, name, args.size, args.repeat)
+        if not args.no_delta:
+            for edits in args.edits:
+                print(f"Benchmarking {args.size} MB, {edits} edits ...", file=sys.stderr)
+                results[f"{edits} edits"] = run_case(workdir, args.size, edits, args.block_size * 1024, args.repeat)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if copies:
+        print(f"{'file':<12}{'engine':<18}{'used':<26}{'MB/s':>10}{'on disk MB':>12}")
+        for name, r in copies.items():
+            for engine, c in r.items():
+                print(f"{name:<12}{engine:<18}{c['method']:<26}{c['mb_per_s']:>10.0f}{c['allocated_mb']:>12.1f}")
+
+    if results:
+        print(f"{'case':<12}" + "".join(f"{m + ' s':>12}{m + ' MB':>12}" for m in MODES))
+        for case, r in results.items():
+            print(f"{case:<12}" + "".join(f"{r[m]['median_s']:>12.3f}{r[m]['written_mb']:>12.2f}" for m in MODES))
+
+    if args.json:
+        report = {
+            "config": {k: getattr(args, k) for k in ("size", "edits", "block_size", "repeat")},
+            "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+            "copies": copies,
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+    return {"copies": copies, "delta": results}
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+bench_upload.py
+
+Benchmark for upload_files.py against the local stand-in server
+(upload_server.py).
+
+A burst of files is uploaded:
+- serial: one requests.post per file, a new connection each (the old handler)
+- pool-N: through an Uploader with N workers sharing a keep-alive session
+
+Reported per case: wall time, files/s, MB/s and the number of connections
+the server saw. --latency adds a delay per request on the server, standing
+in for the round trip to a remote endpoint.
+
+Usage examples:
+  python bench_upload.py --files 200 --size 64 --workers 1 4 16
+  python bench_upload.py --latency 50 --json bench_upload.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+
+import upload_files
+from upload_server import UploadServer
+
+def make_files(folder, count, size_kb):
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"save{i}.dat")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size_kb * 1024))
+        paths.append(path)
+    return paths
+
+def upload_serial(url, paths):
+    for path in paths:
+        with open(path, "rb") as f:
+            requests.post(url, files={"file": f}).raise_for_status()
+
+def upload_pool(url, paths, workers):
+    uploader = upload_files.Uploader(url, workers, verbose=False)
+    for path in paths:
+        uploader.submit(path)
+    uploader.close()
+    if uploader.metrics.failed:
+        raise RuntimeError(uploader.metrics.summary())
+
+def run_case(paths, mode, workers, latency, repeat):
+    seconds = []
+    for _ in range(repeat):
+        with UploadServer(latency=latency) as server:
+            start = time.perf_counter()
+            if mode == "serial":
+                upload_serial(server.url, paths)
+            else:
+                upload_pool(server.url, paths, workers)
+            seconds.append(time.perf_counter() - start)
+            connections = len(server.connections)
+            assert len(server.received) == len(paths)
+
+    median = statistics.median(seconds)
+    mb = sum(os.path.getsize(p) for p in paths) / 1e6
+    return {"median_s": median, "files_per_s": len(paths) / median, "mb_per_s": mb / median,
+            "connections": connections}
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Compare pooled keep-alive uploads with one request per file.")
+    ap.add_argument("--files", type=int, default=100, help="Files per burst.")
+    ap.add_argument("--size", type=int, default=256, help="Size of each file in KB.")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="Uploader pool sizes.")
+    ap.add_argument("--latency", type=float, default=20, help="Server delay per request in ms.")
+    ap.add_argument("--repeat", type=int, default=3, help="Repetitions per case (median is reported).")
+    ap.add_argument("--workdir", help="Where to create files (default: a temporary directory).")
+    ap.add_argument("--json", help="Write results to this JSON file.")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_upload_")
+    results = {}
+    try:
+        paths = make_files(os.path.join(workdir, "files"), args.files, args.size)
+        cases = [("serial", 1)] + [(f"pool-{n}", n) for n in args.workers]
+        for case, workers in cases:
+            print(f"Benchmarking {case} ...", file=sys.stderr)
+            results[case] = run_case(paths, case, workers, args.latency / 1000, args.repeat)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'case':<10}{'s':>10}{'files/s':>10}{'MB/s':>10}{'conns':>8}")
+    for case, r in results.items():
+        print(f"{case:<10}{r['median_s']:>10.3f}{r['files_per_s']:>10.1f}{r['mb_per_s']:>10.1f}{r['connections']:>8}")
+
+    if args.json:
+        report = {
+            "config": {k: getattr(args, k) for k in ("files", "size", "workers", "latency", "repeat")},
+            "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+if __name__ == "__main__":
+    main()
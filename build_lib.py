@@ -9,6 +9,16 @@ Features:
 - Auto-detects platform and available compilers (gcc/clang or MSVC cl).
 - Accepts include dirs, library dirs, link libraries, extra compile/link flags.
 - Collects all .c/.cpp files under provided source directories or explicit list.
+- Compiles each translation unit to its own object in parallel (-j), then links/archives once.
+- Objects mirror the source tree under <build-dir>/obj and are written atomically;
+  concurrent builds into the same build directory are serialized by a lock file.
+- Incremental mode tracks header dependencies and skips up-to-date objects and links.
+- Optional local object cache keyed by preprocessed source, flags and compiler.
+- Unity/jumbo mode that compiles batches of sources as single translation units.
+- Named optimization profiles (debug/release/release-lto/pgo) from project_config.py.
+- Writes compile_commands.json and, optionally, a Chrome trace of the build (--trace).
+- Watch mode that keeps compiler detection and the dependency graph in memory
+  and rebuilds affected translation units as files change.
 - Produces output in a build directory.
 
 Usage examples:
@@ -21,24 +31,64 @@ Usage examples:
 
   # verbose
   python build_lib.py --sources src --output mylib --type shared -v
+
+  # compile with 16 parallel jobs
+  python build_lib.py --sources src --output mylib -j 16
+
+  # incremental rebuild (only changed sources and their dependents)
+  python build_lib.py --sources src --output mylib --incremental
+
+  # reuse objects across checkouts and branches
+  python build_lib.py --sources src --output mylib --cache --cache-stats
+
+  # unity build, 16 sources per TU, keeping one troublesome file separate
+  python build_lib.py --sources src --output mylib --unity 16 --unity-exclude src/legacy.cpp
+
+  # LTO release build, or a PGO build trained by running a benchmark against the library
+  python build_lib.py --sources src --output mylib --profile release-lto
+  python build_lib.py --sources src --output mylib --profile pgo --pgo-train "python bench.py"
+
+  # record where build time goes (open build.json in chrome://tracing or Perfetto)
+  python build_lib.py --sources src --output mylib -j 8 --trace build.json
+
+  # rebuild on every save
+  python build_lib.py --sources src --include include --output mylib --watch
 """
 
 import argparse
+import fnmatch
+import hashlib
+import json
 import os
 import platform
 import shutil
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache, partial
 from pathlib import Path
 from typing import List
 
+try:
+    from project_config import CONFIG as PROJECT_CONFIG
+except ImportError:
+    PROJECT_CONFIG = {}
+
 # ---------- Helpers ----------
+_print_lock = threading.Lock()
+
 def which(exe: str):
     return shutil.which(exe)
 
+SOURCE_EXTS = (".c", ".cpp", ".cxx", ".cc", ".c++")
+HEADER_EXTS = (".h", ".hh", ".hpp", ".hxx", ".h++", ".inl", ".ipp", ".tpp")
+
 def find_sources(files_or_dirs: List[str]):
     p = []
-    exts = (".c", ".cpp", ".cxx", ".cc", ".c++")
+    exts = SOURCE_EXTS
     for s in files_or_dirs:
         s_path = Path(s)
         if s_path.is_dir():
@@ -57,19 +107,89 @@ def find_sources(files_or_dirs: List[str]):
     # dedupe and sort
     return sorted(dict.fromkeys(p))
 
-def run(cmd, verbose=False, check=True):
-    if verbose:
+def echo(cmd, proc):
+    # keep each command and its output together when running in parallel
+    with _print_lock:
         print("+ " + " ".join(cmd))
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if verbose:
         if proc.stdout:
             print(proc.stdout)
         if proc.stderr:
             print(proc.stderr, file=sys.stderr)
+
+def run(cmd, verbose=False, check=True):
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if verbose:
+        echo(cmd, proc)
     if check and proc.returncode != 0:
         raise subprocess.CalledProcessError(proc.returncode, cmd, output=proc.stdout, stderr=proc.stderr)
     return proc
 
+def run_all(tasks, jobs=1, on_done=None):
+    """
+    Run independent tasks (one per translation unit) on a bounded pool.
+
+    Each task is a callable returning a CompletedProcess, e.g.
+    functools.partial(run, cmd, verbose, False).
+    on_done(index, proc) is called for every task that succeeded.
+    Stops scheduling new tasks as soon as one fails, waits for the ones
+    already running, and raises CalledProcessError carrying the output of
+    every failed command. A task or on_done that raises stops the run the
+    same way, and its exception is re-raised.
+    """
+    jobs = max(1, min(jobs or 1, len(tasks) or 1))
+    failures = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(task): i for i, task in enumerate(tasks)}
+
+        def cancel_pending():
+            # fail fast: drop everything that has not started yet
+            for pending in futures:
+                pending.cancel()
+
+        try:
+            for fut in as_completed(futures):
+                if fut.cancelled():
+                    continue
+                proc = fut.result()
+                if proc.returncode != 0:
+                    failures.append(proc)
+                    cancel_pending()
+                elif on_done:
+                    on_done(futures[fut], proc)
+        except BaseException:
+            # e.g. a missing compiler binary, or Ctrl+C
+            cancel_pending()
+            raise
+    if failures:
+        first = failures[0]
+        stdout = "".join(p.stdout or "" for p in failures)
+        stderr = "".join(p.stderr or "" for p in failures)
+        raise subprocess.CalledProcessError(first.returncode, first.args, output=stdout, stderr=stderr)
+
+def file_signature(path):
+    """Cheap change detector for a file: [mtime_ns, size], or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def parse_depfile(path):
+    """Return the prerequisites listed in a make-style depfile written by -MMD -MF."""
+    with open(path) as f:
+        text = f.read()
+    text = text.replace("\\\n", " ")
+    _, _, deps = text.partition(": ")
+    # spaces inside paths are escaped as "\ "
+    return [d.replace("\0", " ") for d in deps.replace("\\ ", "\0").split()]
+
+MSVC_INCLUDE_NOTE = "Note: including file:"
+
+def parse_msvc_includes(output):
+    """Return the headers reported by cl /showIncludes."""
+    return [line[len(MSVC_INCLUDE_NOTE):].strip()
+            for line in output.splitlines() if line.startswith(MSVC_INCLUDE_NOTE)]
+
 # ---------- Compiler selection ----------
 class Compiler:
     name: str
@@ -83,6 +203,7 @@ class Compiler:
         self.cxx_compiler = cxx_compiler
         self.is_msvc = is_msvc
 
+@lru_cache(maxsize=None)
 def detect_compiler(prefer=None) -> Compiler:
     system = platform.system()
     # If user prefers a specific compiler, try to use it
@@ -117,16 +238,514 @@ def detect_compiler(prefer=None) -> Compiler:
     # If nothing found, error out
     raise EnvironmentError("No suitable C/C++ compiler found in PATH. Install gcc/clang or MSVC toolset.")
 
+@lru_cache(maxsize=None)
+def compiler_family(compiler: Compiler):
+    """'msvc', 'clang' or 'gcc' (Apple's gcc is clang, so ask the binary)."""
+    if compiler.is_msvc:
+        return "msvc"
+    proc = subprocess.run([compiler.c_compiler, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return "clang" if "clang" in proc.stdout.lower() else "gcc"
+
+@lru_cache(maxsize=None)
+def compiler_identity(compiler: Compiler):
+    """Resolved path and signature of each compiler binary; a toolchain upgrade changes it."""
+    ident = {}
+    for exe in sorted({compiler.c_compiler, compiler.cxx_compiler}):
+        path = which(exe) or exe
+        ident[exe] = [path, file_signature(path)]
+    return ident
+
+def compile_command(compiler: Compiler, src_path: Path, obj_path: Path, include_flags, extra_cflags,
+                    fpic=False, depfile=None, preprocess=False):
+    """
+    Command line that compiles a single source file to obj_path.
+    If depfile is given, header dependencies are recorded (-MMD -MF, or /showIncludes for cl).
+    With preprocess=True the command instead writes the preprocessed source to stdout.
+    """
+    if compiler.is_msvc:
+        # cl /c src.c /Foobj\src.obj
+        if preprocess:
+            cmd = ["cl", "/nologo", "/E", str(src_path)] + include_flags + extra_cflags
+        else:
+            cmd = ["cl", "/nologo", "/c", str(src_path), f"/Fo{obj_path}"] + include_flags + extra_cflags
+        cmd += ["/showIncludes"] if depfile else []
+        return cmd
+    if src_path.suffix.lower() == ".c":
+        cc = compiler.c_compiler
+    else:
+        cc = compiler.cxx_compiler
+    if preprocess:
+        cmd = [cc, "-E", str(src_path)]
+    else:
+        cmd = [cc, "-c", str(src_path), "-o", str(obj_path)]
+    cmd += ["-MMD", "-MF", str(depfile)] if depfile else []
+    cmd += ["-fPIC"] if fpic else []
+    cmd += include_flags
+    cmd += extra_cflags
+    return cmd
+
+def object_path(obj_dir: Path, src, obj_ext):
+    """
+    Object file for src, mirroring the source tree under obj_dir
+    (src/net/util.c -> obj/src/net/util.c.o) so that equally named sources
+    in different directories, or a.c next to a.cpp, never share an object.
+    """
+    p = Path(os.path.abspath(src))
+    try:
+        rel = p.relative_to(Path.cwd())
+    except ValueError:
+        # outside the working directory: keep the full path below "_abs"
+        rel = Path("_abs", *[part.replace(":", "").strip("\\/") for part in p.parts if part.strip("\\/:")])
+    return obj_dir / rel.parent / (rel.name + obj_ext)
+
+def compile_object(cmd, obj_path: Path, verbose=False):
+    """
+    Run a compile command so that obj_path is replaced atomically: the
+    compiler writes a temp file that is renamed into place on success, so a
+    failed or interrupted compile never leaves a truncated object behind.
+    """
+    tmp = obj_path.with_name(obj_path.name + ".tmp")
+    swap = {str(obj_path): str(tmp), f"/Fo{obj_path}": f"/Fo{tmp}"}
+    proc = run([swap.get(a, a) for a in cmd], check=False)
+    if verbose:
+        echo(cmd, proc)
+    if proc.returncode == 0:
+        os.replace(tmp, obj_path)
+    else:
+        tmp.unlink(missing_ok=True)
+    proc.args = cmd
+    return proc
+
+def link_or_copy(src, dst: Path):
+    """Hard-link src to dst (copy across filesystems), replacing dst atomically."""
+    if dst.exists() and os.path.samefile(src, dst):
+        return  # already linked; rename() onto the same inode would be a no-op
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+class BuildLock:
+    """
+    Exclusive lock on a file in the build directory, so concurrent builds
+    into the same --build-dir (e.g. two CI jobs sharing a workspace) take turns.
+    ObjectCache takes one in the cache directory the same way.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a+")
+        if os.name == "nt":
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    print(f"Waiting for build lock {self.path} ...")
+        else:
+            import fcntl
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                print(f"Waiting for build lock {self.path} ...")
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        # closing the file releases the lock
+        self.file.close()
+        self.file = None
+
+# ---------- Incremental build state ----------
+STATE_FILE = ".build_state.json"
+LOCK_FILE = ".build.lock"
+
+# file timestamps come from the kernel's coarse clock, which lags time.time_ns() by up to a tick
+MTIME_SLACK_NS = 20_000_000
+
+class BuildState:
+    """
+    Build-state database kept in the build directory.
+
+    For every object it remembers the exact compile command and the
+    signature of each file the object depends on (source and headers);
+    it also remembers the compiler identity and the last link command.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.compiler = None
+        self.objects = {}
+        self.link = None
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.compiler = data.get("compiler")
+            self.objects = data.get("objects", {})
+            self.link = data.get("link")
+        except (OSError, ValueError):
+            pass
+
+    def check_compiler(self, identity):
+        # a different compiler binary invalidates every object
+        if self.compiler != identity:
+            self.compiler = identity
+            self.objects = {}
+            self.link = None
+
+    def is_stale(self, obj, cmd):
+        entry = self.objects.get(obj)
+        if entry is None or entry["cmd"] != cmd or not os.path.exists(obj):
+            return True
+        return any(file_signature(dep) != sig for dep, sig in entry["deps"].items())
+
+    def record(self, obj, cmd, deps, started=None):
+        """
+        Remember what obj was built from. started is when its compile began
+        (time.time_ns()): a dependency modified since may not be what the
+        compiler read, so it is recorded as None and counts as stale next time.
+        """
+        sigs = {}
+        for dep in deps:
+            sig = file_signature(dep)
+            if sig and started is not None and sig[0] >= started - MTIME_SLACK_NS:
+                sig = None
+            sigs[dep] = sig
+        self.objects[obj] = {"cmd": cmd, "deps": sigs}
+
+    def forget(self, obj):
+        self.objects.pop(obj, None)
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"compiler": self.compiler, "objects": self.objects, "link": self.link}, f)
+        os.replace(tmp, self.path)
+
+# ---------- Compilation cache ----------
+def parse_size(text):
+    """Parse a size such as 500M or 5G into bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = str(text).strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def format_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+
+class ObjectCache:
+    """
+    Local content-addressed object cache (ccache-style).
+
+    The key is a hash of the compiler identity, the compile command line
+    (minus output paths) and the preprocessed source, so hits survive clean
+    checkouts and branch switches. Entries are evicted least-recently-used
+    once the cache grows beyond max_size bytes.
+    """
+
+    STATS_FILE = "stats.json"
+    LOCK_FILE = "cache.lock"
+
+    def __init__(self, cache_dir, max_size, compiler: Compiler, salt=""):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        # salt covers inputs that are not visible in the preprocessed source, e.g. PGO profile data
+        self.identity = [compiler_identity(compiler), salt]
+        self.is_msvc = compiler.is_msvc
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+        self._lock = threading.Lock()
+
+    def key(self, preprocessed: bytes, cmd, obj_path, depfile=None):
+        # output locations and dependency tracking do not influence the object contents
+        outputs = {str(obj_path), str(depfile), f"/Fo{obj_path}", "-MMD", "-MF", "/showIncludes"}
+        h = hashlib.sha256()
+        h.update(json.dumps([self.identity, [a for a in cmd if a not in outputs]]).encode())
+        h.update(preprocessed)
+        return h.hexdigest()
+
+    def entry(self, key, suffix):
+        return self.dir / key[:2] / (key + suffix)
+
+    def compile(self, cmd, pp_cmd, obj_path: Path, depfile=None, verbose=False):
+        """Produce obj_path from the cache or by running cmd; returns a CompletedProcess."""
+        pp = subprocess.run(pp_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if pp.returncode != 0:
+            # let the real compiler report the error
+            return compile_object(cmd, obj_path, verbose=verbose)
+        # cl /E reports /showIncludes on stderr; hand it back so dependencies get recorded
+        notes = pp.stderr.decode(errors="replace") if self.is_msvc else ""
+        key = self.key(pp.stdout, cmd, obj_path, depfile)
+        entry = self.entry(key, obj_path.suffix)
+        meta = self.entry(key, ".json")
+        if self.fetch(entry, meta, obj_path):
+            if verbose:
+                with _print_lock:
+                    print(f"+ (cached) {' '.join(cmd)}")
+            return subprocess.CompletedProcess(cmd, 0, stdout=notes, stderr="")
+
+        start = time.perf_counter()
+        proc = compile_object(cmd, obj_path, verbose=verbose)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+        if proc.returncode == 0:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(obj_path, entry)
+            with open(meta, "w") as f:
+                json.dump({"seconds": seconds, "source": cmd}, f)
+        return proc
+
+    def fetch(self, entry, meta, obj_path):
+        """Copy a cached object to obj_path; False if there is none."""
+        try:
+            with open(meta) as f:
+                seconds = json.load(f).get("seconds", 0.0)
+        except (OSError, ValueError):
+            seconds = 0.0
+        try:
+            # objects are only ever replaced by rename, so sharing the inode is safe
+            link_or_copy(entry, obj_path)
+            os.utime(entry)  # mark as recently used
+        except FileNotFoundError:
+            # not cached, or evicted by another build just now
+            return False
+        with self._lock:
+            self.hits += 1
+            self.saved += seconds
+        return True
+
+    def finish(self):
+        """Fold this build's counters into the persistent stats and evict old entries."""
+        # builds sharing the cache take turns, so no counts are lost and no entry is evicted twice
+        with BuildLock(self.dir / self.LOCK_FILE):
+            stats = self.load_stats()
+            stats["hits"] += self.hits
+            stats["misses"] += self.misses
+            stats["saved"] += self.saved
+            tmp = self.dir / (self.STATS_FILE + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp, self.dir / self.STATS_FILE)
+            self.evict()
+        return stats
+
+    def load_stats(self):
+        try:
+            with open(self.dir / self.STATS_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "saved": 0.0}
+
+    def entries(self):
+        """(mtime, size, path) of every cached object, oldest first."""
+        found = []
+        for f in self.dir.glob("??/*"):
+            if f.suffix in (".o", ".obj"):
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    continue  # evicted meanwhile
+                found.append((st.st_mtime, st.st_size, f))
+        return sorted(found)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, f in entries:
+            if total <= self.max_size:
+                break
+            f.unlink(missing_ok=True)
+            f.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
+
+    def report(self, stats):
+        size = sum(size for _, size, _ in self.entries())
+        print(f"Cache {self.dir}")
+        print(f"  this build: {self.hits} hits, {self.misses} misses, {self.saved:.2f}s saved")
+        print(f"  total:      {stats['hits']} hits, {stats['misses']} misses, {stats['saved']:.2f}s saved")
+        print(f"  size:       {format_size(size)} / {format_size(self.max_size)}")
+
+# ---------- Unity builds ----------
+UNITY_DIR = "unity"
+TIMES_FILE = ".build_times.json"
+
+def unity_batches(sources, size, exclude=()):
+    """
+    Group sources into unity batches of at most `size` files.
+
+    Sources are batched per language and per directory in sorted order, so
+    adding or removing a file only reshuffles batches of its own directory
+    and incremental rebuilds of the rest stay valid. Files matching one of
+    the `exclude` glob patterns are returned separately to be compiled alone.
+    """
+    groups = {}
+    standalone = []
+    for src in sources:
+        posix = Path(src).as_posix()
+        if any(fnmatch.fnmatch(posix, pat) or fnmatch.fnmatch(Path(src).name, pat) for pat in exclude):
+            standalone.append(src)
+            continue
+        lang = ".c" if Path(src).suffix.lower() == ".c" else ".cpp"
+        groups.setdefault((lang, str(Path(src).parent)), []).append(src)
+    batches = []
+    for (lang, directory), files in sorted(groups.items()):
+        for k in range(0, len(files), size):
+            batches.append((lang, directory, k // size, files[k:k + size]))
+    return batches, standalone
+
+def write_unity_sources(batches, unity_dir: Path):
+    """Write one generated TU per batch; files are only touched when their contents change."""
+    unity_dir.mkdir(parents=True, exist_ok=True)
+    generated = []
+    for lang, directory, index, files in batches:
+        if len(files) == 1:
+            generated.append(files[0])
+            continue
+        tag = hashlib.sha1(directory.encode()).hexdigest()[:8]
+        path = unity_dir / f"unity_{Path(directory).name or 'root'}_{tag}_{index}{lang}"
+        text = "/* generated by build_lib.py --unity; do not edit */\n"
+        text += "".join(f'#include "{Path(f).resolve().as_posix()}"\n' for f in files)
+        try:
+            with open(path) as f:
+                unchanged = f.read() == text
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            with open(path, "w") as f:
+                f.write(text)
+        generated.append(str(path))
+    return generated
+
+def record_compile_time(outdir: Path, mode, seconds):
+    """Remember the wall-clock time of a full compile in `mode`; returns all recorded times."""
+    path = outdir / TIMES_FILE
+    try:
+        with open(path) as f:
+            times = json.load(f)
+    except (OSError, ValueError):
+        times = {}
+    times[mode] = seconds
+    with open(path, "w") as f:
+        json.dump(times, f)
+    return times
+
+# ---------- Build reports ----------
+COMPILE_COMMANDS_FILE = "compile_commands.json"
+
+def write_compile_commands(outdir: Path, sources, objects, compile_cmds):
+    """Write a clang-style compilation database for every translation unit of the build."""
+    cwd = os.getcwd()
+    entries = [{"directory": cwd, "arguments": cmd, "file": src, "output": obj}
+               for src, obj, cmd in zip(sources, objects, compile_cmds)]
+    tmp = outdir / (COMPILE_COMMANDS_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp, outdir / COMPILE_COMMANDS_FILE)
+
+class Tracer:
+    """
+    Collects Chrome trace events (load the file in chrome://tracing or
+    Perfetto). Every span is tagged with the worker slot that ran it:
+    0 is the main thread, 1..N the compile workers.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.slot()  # the creating (main) thread is slot 0
+
+    def slot(self):
+        ident = threading.get_ident()
+        with self._lock:
+            return self._slots.setdefault(ident, len(self._slots))
+
+    def add(self, name, cat, start, end, **args):
+        event = {"name": name, "cat": cat, "ph": "X", "pid": 1, "tid": self.slot(),
+                 "ts": round((start - self.origin) * 1e6), "dur": round((end - start) * 1e6)}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def wrap(self, task, name, cat):
+        """Wrap a run_all() task so that its execution is recorded as a span."""
+        def traced():
+            start = time.perf_counter()
+            proc = task()
+            self.add(name, cat, start, time.perf_counter(), returncode=proc.returncode)
+            return proc
+        return traced
+
+    def save(self, path):
+        names = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": slot,
+                  "args": {"name": "main" if slot == 0 else f"worker {slot}"}}
+                 for slot in sorted(self._slots.values())]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": names + self.events, "displayTimeUnit": "ms"}, f)
+
+@contextmanager
+def trace_span(tracer, name, cat):
+    """Record the enclosed block as a span on the current thread's slot (no-op without tracer)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if tracer:
+            tracer.add(name, cat, start, time.perf_counter())
+
 # ---------- Build logic ----------
-def build(args):
+def link(cmd, out_path: Path, state=None, relink=True, verbose=False, tracer=None):
+    """
+    Run the final link/archive command.
+    In incremental mode the step is skipped when no object was rebuilt and
+    the command is unchanged; returns False if it was skipped.
+    """
+    if state and not relink and state.link == cmd and out_path.exists():
+        print(f"Up to date: {out_path}")
+        return False
+    if state:
+        state.link = None
+        state.save()
+    # archives are updated in place by ar/lib; start fresh so removed sources don't linger
+    archive = out_path.suffix in (".a", ".lib") and not cmd[0].lower().startswith("link")
+    if archive and out_path.exists():
+        out_path.unlink()
+    with trace_span(tracer, out_path.name, "archive" if archive else "link"):
+        run(cmd, verbose=verbose)
+    if state:
+        state.link = cmd
+        state.save()
+    return True
+
+def source_roots(args):
+    """What --files/--sources (default: src/) refer to."""
+    return args.files or args.sources or ["src"]
+
+def build(args, tracer=None, sources=None, state=None):
+    """
+    Build the library described by args and return its path.
+    `sources` and `state` let a long-running caller (--watch) reuse the
+    source list and the in-memory build state instead of rescanning/reloading.
+    """
     # Prepare file lists
-    if args.files:
-        sources = find_sources(args.files)
-    elif args.sources:
-        sources = find_sources(args.sources)
-    else:
-        # default: src/
-        sources = find_sources(["src"])
+    if sources is None:
+        with trace_span(tracer, "find sources", "scan"):
+            sources = find_sources(source_roots(args))
     if not sources:
         raise SystemExit("No source files found. Provide --files or --sources that contain .c/.cpp files.")
 
@@ -134,7 +753,8 @@ def build(args):
     outdir.mkdir(parents=True, exist_ok=True)
     system = platform.system().lower()
 
-    compiler = detect_compiler(prefer=args.compiler)
+    with trace_span(tracer, "detect compiler", "scan"):
+        compiler = detect_compiler(prefer=args.compiler)
     verbose = args.verbose
 
     # File lists by language (approx)
@@ -179,107 +799,435 @@ def build(args):
     extra_cflags = args.cflags or []
     extra_ldflags = args.ldflags or []
 
-    # If building static archive on POSIX, use ar
-    if args.type == "static" and system != "windows":
-        # compile object files then run ar
-        obj_dir = outdir / "obj"
-        obj_dir.mkdir(parents=True, exist_ok=True)
-        objects = []
-        compile_cmds = []
-        # Compile each source to object
-        for src in sources:
-            src_path = Path(src)
-            obj_path = obj_dir / (src_path.stem + ".o")
-            objects.append(str(obj_path))
-            if src_path.suffix.lower() == ".c":
-                cc = compiler.c_compiler
-            else:
-                cc = compiler.cxx_compiler
-            cmd = [cc, "-c", str(src_path), "-o", str(obj_path)]
-            if not compiler.is_msvc:
-                cmd += ["-fPIC"] if args.fpic else []
-                cmd += include_flags
-                cmd += extra_cflags
-            else:
-                cmd += include_flags
-                cmd += extra_cflags
-                # MSVC uses /Fo for object output, but our -o approach may not work with cl; handle cl separately
-                if compiler.is_msvc:
-                    # cl /c src.c /Foobj\src.obj
-                    cmd = ["cl", "/nologo", "/c", str(src_path), f"/Fo{obj_path}"] + include_flags + extra_cflags
-            compile_cmds.append(cmd)
-        # Execute compile commands
-        for cmd in compile_cmds:
-            run(cmd, verbose=verbose)
-        # Create archive with ar
-        ar = which("ar") or "ar"
-        ar_cmd = [ar, "rcs", str(out_path)] + objects
-        run(ar_cmd, verbose=verbose)
-        print(f"Built static library: {out_path}")
-        return
+    # Unity: compile batches of sources as single translation units
+    n_sources = len(sources)
+    if args.unity:
+        batches, standalone = unity_batches(sources, args.unity, args.unity_exclude or [])
+        sources = write_unity_sources(batches, outdir / UNITY_DIR) + standalone
+
+    # Compile every source to its own object, then link or archive once.
+    # Shared objects on ELF platforms must be position independent.
+    fpic = args.fpic or (args.type == "shared" and system not in ("windows", "darwin"))
+    obj_dir = outdir / "obj"
+    obj_dir.mkdir(parents=True, exist_ok=True)
+    obj_ext = ".obj" if compiler.is_msvc else ".o"
+    if args.incremental and state is None:
+        state = BuildState(outdir / STATE_FILE)
+    if state:
+        state.check_compiler(compiler_identity(compiler))
+    objects = []
+    compile_cmds = []
+    for src in sources:
+        src_path = Path(src)
+        obj_path = object_path(obj_dir, src, obj_ext)
+        obj_path.parent.mkdir(parents=True, exist_ok=True)
+        depfile = obj_path.with_suffix(".d") if state else None
+        objects.append(str(obj_path))
+        compile_cmds.append(compile_command(compiler, src_path, obj_path, include_flags, extra_cflags,
+                                            fpic=fpic, depfile=depfile))
+
+    # Incremental: only recompile objects whose command or dependencies changed
+    if state:
+        todo = [i for i, obj in enumerate(objects) if state.is_stale(obj, compile_cmds[i])]
+    else:
+        todo = list(range(len(sources)))
+
+    started = {}
+
+    def compiled(k, proc):
+        i = todo[k]
+        if compiler.is_msvc:
+            deps = [sources[i]] + parse_msvc_includes(proc.stdout)
+        else:
+            deps = parse_depfile(Path(objects[i]).with_suffix(".d"))
+        state.record(objects[i], compile_cmds[i], deps, started=started.get(k))
+
+    def timed(k, task):
+        # a file saved while its TU compiles must not be recorded as built
+        def run():
+            started[k] = time.time_ns()
+            return task()
+        return run
+
+    cache = None
+    if args.cache:
+        cache = ObjectCache(args.cache_dir, parse_size(args.cache_size), compiler, salt=args.cache_salt)
+    tasks = []
+    for i in todo:
+        if cache:
+            src_path, obj_path = Path(sources[i]), Path(objects[i])
+            depfile = obj_path.with_suffix(".d") if state else None
+            pp_cmd = compile_command(compiler, src_path, obj_path, include_flags, extra_cflags,
+                                     fpic=fpic, depfile=depfile, preprocess=True)
+            tasks.append(partial(cache.compile, compile_cmds[i], pp_cmd, obj_path, depfile, verbose))
+        else:
+            tasks.append(partial(compile_object, compile_cmds[i], Path(objects[i]), verbose))
+
+    if tracer:
+        tasks = [tracer.wrap(task, sources[i], "compile") for i, task in zip(todo, tasks)]
+    if state:
+        tasks = [timed(k, task) for k, task in enumerate(tasks)]
+    write_compile_commands(outdir, sources, objects, compile_cmds)
+
+    if state:
+        for i in todo:
+            state.forget(objects[i])
+    start = time.perf_counter()
+    try:
+        run_all(tasks, jobs=args.jobs, on_done=compiled if state else None)
+        elapsed = time.perf_counter() - start
+        # only a full compile is comparable between normal and unity builds;
+        # one served (even partly) from the cache is not a compile at all
+        if todo and len(todo) == len(sources) and not (cache and cache.hits):
+            mode = "unity" if args.unity else "normal"
+            times = record_compile_time(outdir, mode, elapsed)
+            if args.unity:
+                line = f"Unity build: {len(sources)} TUs from {n_sources} sources compiled in {elapsed:.2f}s"
+                if times.get("normal"):
+                    line += f" (normal build: {times['normal']:.2f}s, {times['normal'] / elapsed:.1f}x)"
+                else:
+                    line += " (build once without --unity to compare)"
+                print(line)
+    finally:
+        if state:
+            state.save()
+        if cache:
+            stats = cache.finish()
+            if args.cache_stats:
+                cache.report(stats)
 
-    # Shared/Static link command (single-step for gcc/clang; MSVC uses different flags)
     if compiler.is_msvc:
-        # MSVC (cl + link)
-        # Build objects
-        obj_dir = outdir / "obj"
-        obj_dir.mkdir(parents=True, exist_ok=True)
-        objects = []
-        for src in sources:
-            src_path = Path(src)
-            obj_path = obj_dir / (src_path.stem + ".obj")
-            objects.append(str(obj_path))
-            # cl /c file.c /Foobj\file.obj [includes]
-            cmd = ["cl", "/nologo", "/c", str(src_path), f"/Fo{obj_path}"] + include_flags + extra_cflags
-            run(cmd, verbose=verbose)
-        # Link step
-        linker = "link"
-        link_cmd = [linker, "/NOLOGO"]
-        # output
-        link_cmd += [f"/OUT:{out_path}"]
-        if args.type == "shared":
-            link_cmd += ["/DLL"]
-        # object files
-        link_cmd += objects
-        # library dirs and libs
-        for ld in args.libdirs or []:
-            link_cmd += [f"/LIBPATH:{ld}"]
-        for lib in args.libs or []:
-            link_cmd += [lib if lib.lower().endswith(".lib") else f"{lib}.lib"]
+        if args.type == "static":
+            # lib /OUT:mylib.lib a.obj b.obj
+            link_cmd = ["lib", "/NOLOGO", f"/OUT:{out_path}"] + objects
+        else:
+            link_cmd = ["link", "/NOLOGO", f"/OUT:{out_path}", "/DLL"] + objects
+            # library dirs and libs
+            link_cmd += libdir_flags
+            link_cmd += link_libs
         link_cmd += extra_ldflags
-        run(link_cmd, verbose=verbose)
-        print(f"Built (MSVC) {args.type} library: {out_path}")
-        return
-    else:
-        # gcc/clang style
-        # Determine whether to use c or c++ linker: if any cpp files present, use cxx compiler
-        linker = compiler.cxx_compiler if cpp_files else compiler.c_compiler
-        cmd = [linker]
-        if args.type == "shared":
-            cmd += ["-shared"]
-            if args.fpic and platform.system().lower() != "darwin":
-                # if fpic was requested, ensure compiled with -fPIC; when compiling single-step this flag matters for objects,
-                # but adding to compiler invocation is OK for simple cases.
-                pass
-        # Position independent code flag for shared libs on some platforms
-        if args.type == "shared" and platform.system().lower() != "darwin":
-            # many systems need -fPIC on object files; adding to compile flags below already handled or user-provided
-            pass
-        cmd += ["-o", str(out_path)]
-        # Inputs: sources
-        cmd += sources
-        # include dirs are usually used at compile time; when linking we don't need them — keep in case of single-step compile+link
-        cmd += include_flags
-        # libdirs and libs
-        cmd += libdir_flags
-        cmd += link_libs
-        cmd += extra_cflags + extra_ldflags
-        # Run
-        run(cmd, verbose=verbose)
+        if link(link_cmd, out_path, state, relink=bool(todo), verbose=verbose, tracer=tracer):
+            print(f"Built (MSVC) {args.type} library: {out_path}")
+        return out_path
+
+    if args.type == "static":
+        # Create archive with ar; LTO objects need the plugin-aware wrapper for a symbol index
+        ar = which("ar") or "ar"
+        if any(flag.startswith("-flto") for flag in extra_cflags):
+            lto_ar = "llvm-ar" if compiler_family(compiler) == "clang" else "gcc-ar"
+            ar = which(lto_ar) or ar
+        ar_cmd = [ar, "rcs", str(out_path)] + objects
+        if link(ar_cmd, out_path, state, relink=bool(todo), verbose=verbose, tracer=tracer):
+            print(f"Built static library: {out_path}")
+        return out_path
+
+    # gcc/clang style
+    # Determine whether to use c or c++ linker: if any cpp files present, use cxx compiler
+    linker = compiler.cxx_compiler if cpp_files else compiler.c_compiler
+    cmd = [linker, "-shared", "-o", str(out_path)]
+    cmd += objects
+    # libdirs and libs
+    cmd += libdir_flags
+    cmd += link_libs
+    # compile flags such as -pthread or -fopenmp also matter when linking
+    cmd += extra_cflags + extra_ldflags
+    if link(cmd, out_path, state, relink=bool(todo), verbose=verbose, tracer=tracer):
         print(f"Built {args.type} library: {out_path}")
-        return
+    return out_path
+
+# ---------- Build profiles ----------
+def with_flags(args, cflags=(), ldflags=(), **overrides):
+    """Copy of args with profile flags placed before the user's --cflags/--ldflags."""
+    new = argparse.Namespace(**vars(args))
+    new.cflags = list(cflags) + (args.cflags or [])
+    new.ldflags = list(ldflags) + (args.ldflags or [])
+    for k, v in overrides.items():
+        setattr(new, k, v)
+    return new
+
+def find_llvm_profdata(compiler: Compiler):
+    """llvm-profdata matching the clang in use (next to it, unversioned, or via xcrun)."""
+    clang = which(compiler.c_compiler)
+    if clang:
+        sibling = Path(os.path.realpath(clang)).parent / "llvm-profdata"
+        if sibling.exists():
+            return [str(sibling)]
+    if which("llvm-profdata"):
+        return ["llvm-profdata"]
+    if platform.system() == "Darwin" and which("xcrun"):
+        return ["xcrun", "llvm-profdata"]
+    raise EnvironmentError("llvm-profdata not found; it is required to merge clang PGO profiles.")
+
+def profile_digest(files):
+    h = hashlib.sha256()
+    for f in sorted(files):
+        h.update(str(f.name).encode())
+        h.update(f.read_bytes())
+    return h.hexdigest()
+
+def build_pgo(args, cflags, ldflags, compiler: Compiler, tracer=None):
+    """
+    Profile-guided optimization in three stages:
+      1. instrumented build,
+      2. run the training command (--pgo-train) against it,
+      3. rebuild using the collected profile.
+    All stages build into the same --build-dir so object paths, which gcc
+    uses to name its .gcda files, line up between stages 1 and 3.
+    """
+    family = compiler_family(compiler)
+    if family == "msvc":
+        raise SystemExit("The pgo profile is only supported with gcc/clang.")
+    if not args.pgo_train:
+        raise SystemExit("The pgo profile needs a training command: --pgo-train \"CMD\".")
+
+    data_dir = (Path(args.build_dir) / "pgo-data").resolve()
+    if data_dir.exists():
+        shutil.rmtree(data_dir)  # stale counters would mismatch the new objects
+    data_dir.mkdir(parents=True)
+    instr = [f"-fprofile-generate={data_dir}"]
+
+    print("PGO stage 1/3: instrumented build")
+    # the gcc/clang link step also receives the compile flags, which pulls in the profiling runtime
+    out_path = build(with_flags(args, cflags + instr, ldflags), tracer)
+
+    print(f"PGO stage 2/3: training: {args.pgo_train}")
+    env = dict(os.environ, BUILD_LIB_OUTPUT=str(out_path.resolve()), BUILD_LIB_PROFILE_DIR=str(data_dir))
+    lib_dir = str(out_path.parent.resolve())
+    for var in ("LD_LIBRARY_PATH", "DYLD_LIBRARY_PATH"):
+        env[var] = os.pathsep.join(p for p in (lib_dir, env.get(var)) if p)
+    with trace_span(tracer, "pgo training", "train"):
+        proc = subprocess.run(args.pgo_train, shell=True, env=env)
+    if proc.returncode != 0:
+        raise SystemExit(f"PGO training command failed with exit code {proc.returncode}.")
+
+    if family == "clang":
+        raw = sorted(data_dir.rglob("*.profraw"))
+        if not raw:
+            raise SystemExit(f"Training produced no profile data in {data_dir}.")
+        profdata = data_dir / "default.profdata"
+        run(find_llvm_profdata(compiler) + ["merge", f"-output={profdata}"] + [str(r) for r in raw],
+            verbose=args.verbose)
+        use = [f"-fprofile-use={profdata}"]
+        digest = profile_digest([profdata])
+    else:
+        gcda = sorted(data_dir.rglob("*.gcda"))
+        if not gcda:
+            raise SystemExit(f"Training produced no profile data in {data_dir}.")
+        use = [f"-fprofile-use={data_dir}", "-fprofile-correction"]
+        digest = profile_digest(gcda)
+
+    print("PGO stage 3/3: optimized build")
+    return build(with_flags(args, cflags + use, ldflags, cache_salt=digest), tracer)
+
+def build_with_profile(args):
+    """Entry point: take the build-directory lock, apply the --profile from project_config.CONFIG, then build."""
+    Path(args.build_dir).mkdir(parents=True, exist_ok=True)
+    tracer = Tracer() if args.trace else None
+    try:
+        with BuildLock(Path(args.build_dir) / LOCK_FILE):
+            return _build_with_profile(args, tracer)
+    finally:
+        if tracer:
+            tracer.save(args.trace)
+
+def _build_with_profile(args, tracer=None, **kwargs):
+    if not args.profile:
+        return build(args, tracer, **kwargs)
+    profiles = PROJECT_CONFIG.get("profiles", {})
+    if args.profile not in profiles:
+        raise SystemExit(f"Unknown profile '{args.profile}'. Available: {', '.join(sorted(profiles)) or 'none'}")
+    profile = profiles[args.profile]
+    compiler = detect_compiler(prefer=args.compiler)
+    prefix = "msvc_" if compiler.is_msvc else ""
+    cflags = list(profile.get(prefix + "cflags", []))
+    ldflags = list(profile.get(prefix + "ldflags", []))
+    if profile.get("pgo"):
+        if kwargs:
+            raise SystemExit("The pgo profile cannot be used with --watch.")
+        return build_pgo(args, cflags, ldflags, compiler, tracer)
+    return build(with_flags(args, cflags, ldflags), tracer, **kwargs)
+
+# ---------- Watch mode ----------
+class PollingWatcher:
+    """Detects changes by comparing stat snapshots of the watched trees."""
+
+    interval = 0.25
+
+    def __init__(self, roots, ignore=()):
+        self.roots = roots
+        self.ignore = ignore
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snap = {}
+        stack = list(self.roots)
+        while stack:
+            d = stack.pop()
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for e in entries:
+                if os.path.abspath(e.path) in self.ignore:
+                    continue
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                else:
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    snap[os.path.abspath(e.path)] = (st.st_mtime_ns, st.st_size)
+        return snap
+
+    def poll(self):
+        new = self.scan()
+        changed = {p for p in new.keys() | self.snapshot.keys() if new.get(p) != self.snapshot.get(p)}
+        self.snapshot = new
+        return changed
+
+    def stop(self):
+        pass
+
+class EventWatcher:
+    """Collects filesystem events from watchdog (inotify/FSEvents/ReadDirectoryChangesW)."""
+
+    interval = 0.05
+
+    def __init__(self, roots, ignore=()):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        self.ignore = ignore
+        self.changed = set()
+        self._lock = threading.Lock()
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # newer watchdog also reports reads, e.g. the compiler opening a source
+                if event.is_directory or event.event_type in ("opened", "closed_no_write"):
+                    return
+                paths = [event.src_path, getattr(event, "dest_path", None)]
+                with watcher._lock:
+                    watcher.changed.update(os.path.abspath(p) for p in paths if p)
+
+        self.observer = Observer()
+        for root in roots:
+            self.observer.schedule(Handler(), root, recursive=True)
+        self.observer.start()
+
+    def poll(self):
+        with self._lock:
+            changed, self.changed = self.changed, set()
+        return {p for p in changed if not any(p == i or p.startswith(i + os.sep) for i in self.ignore)}
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+def make_watcher(roots, ignore=()):
+    try:
+        return EventWatcher(roots, ignore)
+    except ImportError:
+        return PollingWatcher(roots, ignore)
+
+def wait_for_changes(watcher, debounce):
+    """Block until something changes, then keep collecting until it has been quiet for `debounce` seconds."""
+    changed = set()
+    while not changed:
+        time.sleep(watcher.interval)
+        changed |= watcher.poll()
+    quiet_since = time.monotonic()
+    while time.monotonic() - quiet_since < debounce:
+        time.sleep(min(watcher.interval, debounce))
+        more = watcher.poll()
+        if more:
+            changed |= more
+            quiet_since = time.monotonic()
+    return changed
+
+def report_failure(e: subprocess.CalledProcessError):
+    print("Build failed.", file=sys.stderr)
+    if e.stdout:
+        print(e.stdout)
+    if e.stderr:
+        print(e.stderr, file=sys.stderr)
+
+def watch(args):
+    """
+    Rebuild whenever a source or header changes.
+
+    Compiler detection, the source list and the dependency graph
+    (BuildState) stay in memory between rebuilds; only stale objects are
+    recompiled, and a burst of changes (e.g. a git checkout) is debounced
+    into a single rebuild.
+    """
+    args.incremental = True
+    outdir = Path(args.build_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    roots = []
+    for r in source_roots(args) + (args.include or []):
+        p = Path(r) if Path(r).is_dir() else Path(r).parent
+        if p.is_dir() and str(p.resolve()) not in roots:
+            roots.append(str(p.resolve()))
+    # build outputs (the trace included) must not trigger the next rebuild
+    ignore = {str(outdir.resolve())}
+    if args.trace:
+        ignore.add(str(Path(args.trace).resolve()))
+    watcher = make_watcher(roots, ignore=ignore)
+    state = BuildState(outdir / STATE_FILE)
+    sources = find_sources(source_roots(args))
+
+    def relevant(changed):
+        # sources, headers and anything an object was built from; not editor swap files or .git
+        deps = {os.path.realpath(dep) for entry in state.objects.values() for dep in entry["deps"]}
+        return {p for p in changed if p.lower().endswith(SOURCE_EXTS + HEADER_EXTS) or p in deps}
+
+    def rebuild():
+        # --trace holds the latest rebuild
+        tracer = Tracer() if args.trace else None
+        try:
+            with BuildLock(outdir / LOCK_FILE):
+                _build_with_profile(args, tracer, sources=sources, state=state)
+        except subprocess.CalledProcessError as e:
+            report_failure(e)
+        except SystemExit as e:
+            print(e, file=sys.stderr)
+        except Exception as e:
+            # whatever broke this build, the next change may fix it: keep watching
+            print("Error:", e, file=sys.stderr)
+        finally:
+            if tracer:
+                tracer.save(args.trace)
+
+    rebuild()
+    print(f"Watching {', '.join(roots)} (Ctrl+C to stop)")
+    try:
+        while True:
+            changed = relevant(wait_for_changes(watcher, args.debounce / 1000.0))
+            if not changed:
+                continue
+            known = {os.path.abspath(src) for src in sources}
+            # rescan only when a source file appeared or disappeared
+            if any(p.lower().endswith(SOURCE_EXTS) and (p in known) != os.path.exists(p) for p in changed):
+                sources = find_sources(source_roots(args))
+            print(f"{len(changed)} file(s) changed, rebuilding ...")
+            start = time.perf_counter()
+            rebuild()
+            print(f"Rebuilt in {time.perf_counter() - start:.2f}s")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.stop()
 
 # ---------- CLI ----------
+def positive_int(text):
+    n = int(text)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {n}")
+    return n
+
 def parse_args():
     ap = argparse.ArgumentParser(description="Build a shared/static library from C/C++ sources.")
     group = ap.add_mutually_exclusive_group()
@@ -295,19 +1243,48 @@ def parse_args():
     ap.add_argument("--ldflags", nargs="*", help="Extra flags passed to the linker.")
     ap.add_argument("--compiler", help="Preferred compiler executable name (gcc/clang/cl).")
     ap.add_argument("--fpic", action="store_true", help="Compile position-independent code where applicable.")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                    help="Number of translation units to compile in parallel (default: CPU count).")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Only recompile sources whose contents, headers, flags or compiler changed.")
+    ap.add_argument("--cache", action="store_true",
+                    help="Reuse objects from a local content-addressed compilation cache.")
+    ap.add_argument("--cache-dir",
+                    default=os.environ.get("BUILD_LIB_CACHE_DIR", str(Path.home() / ".cache" / "build_lib")),
+                    help="Cache location (default: $BUILD_LIB_CACHE_DIR or ~/.cache/build_lib).")
+    ap.add_argument("--cache-size", default="5G",
+                    help="Maximum cache size, e.g. 500M or 5G; least recently used objects are evicted.")
+    ap.add_argument("--cache-stats", action="store_true", help="Print cache hit/miss counts and time saved.")
+    ap.add_argument("--unity", type=positive_int, metavar="N",
+                    help="Unity/jumbo build: compile batches of N sources per directory as one TU.")
+    ap.add_argument("--unity-exclude", nargs="*", metavar="PATTERN",
+                    help="Sources (glob on path or file name) compiled on their own in unity builds.")
+    # CONFIG['profile'] is None unless a project opts in; without project_config.py there are no profiles
+    ap.add_argument("--profile", default=PROJECT_CONFIG.get("profile"),
+                    help="Named build profile from project_config.CONFIG['profiles'] (e.g. debug, release, release-lto, pgo; "
+                         "default: CONFIG['profile'], none unless set).")
+    ap.add_argument("--pgo-train", metavar="CMD",
+                    help="Training command for the pgo profile; $BUILD_LIB_OUTPUT points at the instrumented library.")
+    ap.add_argument("--trace", metavar="FILE",
+                    help="Write a Chrome trace-event JSON with every compile/archive/link step "
+                         "(with --watch, of the latest rebuild).")
+    ap.add_argument("--watch", action="store_true",
+                    help="Stay running and incrementally rebuild whenever sources or headers change.")
+    ap.add_argument("--debounce", type=int, default=300, metavar="MS",
+                    help="In --watch mode, wait until changes have been quiet this long before rebuilding.")
     ap.add_argument("-v", "--verbose", action="store_true", help="Print commands and output.")
+    ap.set_defaults(cache_salt="")
     return ap.parse_args()
 
 if __name__ == "__main__":
     args = parse_args()
     try:
-        build(args)
+        if args.watch:
+            watch(args)
+        else:
+            build_with_profile(args)
     except subprocess.CalledProcessError as e:
-        print("Build failed.", file=sys.stderr)
-        if e.stdout:
-            print(e.stdout)
-        if e.stderr:
-            print(e.stderr, file=sys.stderr)
+        report_failure(e)
         sys.exit(e.returncode if isinstance(e.returncode, int) else 1)
     except Exception as e:
         print("Error:", e, file=sys.stderr)
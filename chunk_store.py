@@ -0,0 +1,346 @@
+"""
+chunk_store.py
+
+Incremental, deduplicated backups for encrypted_backup.py.
+
+Files are split with content-defined chunking (a gear rolling hash), so an
+edit only changes the chunks around it. Every chunk is compressed,
+encrypted with the backup_crypto frame format and stored once under its
+keyed hash:
+
+    store/
+        keycheck                 encrypted marker, detects a wrong password early
+        chunks/ab/ab12...        one encrypted chunk per file
+        snapshots/<timestamp>    encrypted JSON manifest: path, size, mtime, chunk ids
+
+A backup run reuses the chunk list of every file whose size and mtime match
+the previous snapshot without opening it, so unchanged data is never
+re-read, recompressed or re-encrypted.
+
+Do not run prune() while a backup into the same store is in progress.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+from backup_crypto import BackupFormatError, FrameReader, FrameWriter, read_header, subkey
+
+# ==========================================
+# CHUNKING
+# ==========================================
+
+MIN_CHUNK = 512 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+CUT_MASK = (1 << 19) - 1        # ~1 MiB average chunk (MIN_CHUNK + 512 KiB)
+
+# fixed pseudo-random table for the gear hash; must never change
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256)]
+
+
+# cut points are searched this many bytes at a time
+SCAN_BLOCK = 16 * 1024
+
+
+@lru_cache(maxsize=None)
+def _gear_tables(cut_mask, block):
+    """
+    For bytes.translate(): the low, middle and high byte of GEAR[b] & cut_mask,
+    and a function returning an int of 3-byte lanes, each holding `width`
+    ones, for masking a block of those lanes at once.
+    """
+    bits = cut_mask.bit_length()
+    tables = [bytes((g & cut_mask) >> shift & 0xFF for g in GEAR) for shift in (0, 8, 16)]
+
+    @lru_cache(maxsize=None)
+    def lanes_of(width):
+        return int.from_bytes(((1 << width) - 1).to_bytes(3, "little") * (block + bits), "little")
+
+    return bits, tables, lanes_of
+
+
+def _cut_hashes(data, cut_mask, block):
+    """
+    Low bits (cut_mask) of the gear hash ending at every byte of data (at
+    most block + bits - 1 bytes), as 3-byte little-endian lanes; the first
+    bits - 1 lanes see too few bytes.
+
+    Bit k of a gear hash depends only on the last k + 1 bytes, so the bits a
+    cut is decided on need no running state. All positions are hashed at
+    once with big-int arithmetic: each step adds the sums so far, shifted
+    along by as many lanes as bytes they cover (and as many bits), doubling
+    the span each time.
+    """
+    bits, tables, lanes_of = _gear_tables(cut_mask, block)
+    lanes = bytearray(3 * len(data))
+    for i, table in enumerate(tables):
+        lanes[i::3] = data.translate(table)
+    spans = {1: int.from_bytes(lanes, "little")}
+    span = 1
+    while 2 * span <= bits:
+        h = spans[span]
+        spans[2 * span] = (h + ((h & lanes_of(bits - span)) << (25 * span))) & lanes_of(bits)
+        span *= 2
+    h = spans[span]
+    for part in sorted(spans, reverse=True):
+        if span + part <= bits:
+            h = (h + ((spans[part] & lanes_of(bits - span)) << (25 * span))) & lanes_of(bits)
+            span += part
+    return h.to_bytes(3 * (block + bits), "little")
+
+
+def find_cut(buf, eof):
+    """Length of the next chunk at the start of buf."""
+    end = min(len(buf), MAX_CHUNK)
+    if len(buf) <= MIN_CHUNK:
+        return len(buf) if eof else end
+    warm = CUT_MASK.bit_length() - 1
+    # bytes before MIN_CHUNK cannot be a cut point
+    for start in range(MIN_CHUNK, end, SCAN_BLOCK):
+        stop = min(start + SCAN_BLOCK, end)
+        hashes = _cut_hashes(buf[start - warm:stop], CUT_MASK, SCAN_BLOCK)
+        low = hashes[0::3]
+        i = warm
+        while True:
+            # a zero low byte is the rare case; only then look at the rest of the lane
+            i = low.find(0, i, stop - start + warm)
+            if i < 0:
+                break
+            if not hashes[3 * i + 1] and not hashes[3 * i + 2]:
+                return start - warm + i + 1
+            i += 1
+    return end
+
+
+def iter_chunks(f):
+    """Yield the content-defined chunks of the binary file object f."""
+    buf = b""
+    eof = False
+    while True:
+        while not eof and len(buf) < MAX_CHUNK:
+            more = f.read(MAX_CHUNK)
+            if not more:
+                eof = True
+            buf += more
+        if not buf:
+            return
+        cut = find_cut(buf, eof)
+        yield buf[:cut]
+        buf = buf[cut:]
+
+# ==========================================
+# STORE
+# ==========================================
+
+KEYCHECK = b"GSBK chunk store"
+
+
+class ChunkStore:
+    """Encrypted, content-addressed chunk store plus snapshot manifests."""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.chunk_dir = os.path.join(path, "chunks")
+        self.snapshot_dir = os.path.join(path, "snapshots")
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        keycheck = os.path.join(path, "keycheck")
+        if os.path.exists(keycheck):
+            # everything in a store shares the keycheck's KDF salt, so the
+            # password is stretched once per run, not once per chunk
+            with open(keycheck, "rb") as f:
+                _, kdf_salt, kdf_params = read_header(f)
+            self.key = key.with_salt(kdf_salt, kdf_params)
+            try:
+                ok = self._read_encrypted(keycheck) == KEYCHECK
+            except BackupFormatError:
+                ok = False
+            if not ok:
+                raise BackupFormatError("Wrong password for this chunk store.")
+        else:
+            self.key = key
+            self._write_encrypted(keycheck, KEYCHECK)
+
+        self.id_key = subkey(self.key.master(), b"GSBK chunk id")
+
+    # ---------- encrypted files ----------
+
+    def _write_encrypted(self, path, data):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            with FrameWriter(f, self.key) as writer:
+                writer.write(data)
+        os.replace(tmp, path)
+
+    def _read_encrypted(self, path):
+        with open(path, "rb") as f:
+            return b"".join(FrameReader(f, self.key).frames())
+
+    # ---------- chunks ----------
+
+    def chunk_id(self, data):
+        # keyed, so chunk names do not reveal hashes of known content
+        return hmac.new(self.id_key, data, hashlib.sha256).hexdigest()
+
+    def chunk_path(self, cid):
+        return os.path.join(self.chunk_dir, cid[:2], cid)
+
+    def has(self, cid):
+        return os.path.exists(self.chunk_path(cid))
+
+    def put(self, cid, data):
+        """Store a chunk; returns the number of bytes written (0 if it was already stored)."""
+        path = self.chunk_path(cid)
+        if os.path.exists(path):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        packed = zlib.compress(data, 1)
+        payload = b"Z" + packed if len(packed) < len(data) else b"S" + data
+        self._write_encrypted(path, payload)
+        return os.path.getsize(path)
+
+    def get(self, cid):
+        payload = self._read_encrypted(self.chunk_path(cid))
+        data = zlib.decompress(payload[1:]) if payload[:1] == b"Z" else payload[1:]
+        if not hmac.compare_digest(self.chunk_id(data), cid):
+            raise BackupFormatError(f"Chunk {cid} does not match its id.")
+        return data
+
+    def chunk_ids(self):
+        for sub in os.listdir(self.chunk_dir):
+            for name in os.listdir(os.path.join(self.chunk_dir, sub)):
+                if not name.endswith(".tmp"):
+                    yield name
+
+    # ---------- snapshots ----------
+
+    def snapshots(self):
+        return sorted(n for n in os.listdir(self.snapshot_dir) if not n.endswith(".tmp"))
+
+    def latest(self):
+        names = self.snapshots()
+        return names[-1] if names else None
+
+    def read_snapshot(self, name):
+        return json.loads(self._read_encrypted(os.path.join(self.snapshot_dir, name)))
+
+    def write_snapshot(self, manifest):
+        name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        n = 1
+        while os.path.exists(os.path.join(self.snapshot_dir, name)):
+            n += 1
+            name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + f"_{n}"
+        self._write_encrypted(os.path.join(self.snapshot_dir, name), json.dumps(manifest).encode())
+        return name
+
+    def delete_snapshot(self, name):
+        os.remove(os.path.join(self.snapshot_dir, name))
+
+# ==========================================
+# BACKUP / RESTORE / PRUNE
+# ==========================================
+
+def backup_incremental(source_folder, store_path, key):
+    """
+    Add a snapshot of source_folder to the store. Files whose size and
+    mtime match the previous snapshot are not opened. Returns
+    (snapshot name, stats dict).
+    """
+    store = ChunkStore(store_path, key)
+    previous = {}
+    if store.latest():
+        previous = {f["path"]: f for f in store.read_snapshot(store.latest())["files"]}
+
+    stats = {"files": 0, "unchanged": 0, "read_bytes": 0, "new_chunks": 0, "stored_bytes": 0}
+    files = []
+
+    for root, dirs, names in os.walk(source_folder):
+        dirs.sort()
+        for name in sorted(names):
+            full_path = os.path.join(root, name)
+            rel = os.path.relpath(full_path, source_folder).replace(os.sep, "/")
+            st = os.stat(full_path)
+            stats["files"] += 1
+
+            old = previous.get(rel)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                files.append(old)
+                stats["unchanged"] += 1
+                continue
+
+            chunks = []
+            with open(full_path, "rb") as f:
+                for data in iter_chunks(f):
+                    cid = store.chunk_id(data)
+                    written = store.put(cid, data)
+                    if written:
+                        stats["new_chunks"] += 1
+                        stats["stored_bytes"] += written
+                    stats["read_bytes"] += len(data)
+                    chunks.append(cid)
+
+            files.append({"path": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                          "mode": st.st_mode & 0o777, "chunks": chunks})
+
+    manifest = {"created": datetime.now().isoformat(timespec="seconds"),
+                "source": os.path.abspath(source_folder), "files": files}
+    return store.write_snapshot(manifest), stats
+
+
+def restore_snapshot(store_path, key, snapshot, target_folder):
+    """Rebuild every file of `snapshot` ("latest" for the newest) under target_folder."""
+    store = ChunkStore(store_path, key)
+    if snapshot == "latest":
+        snapshot = store.latest()
+    if snapshot is None or snapshot not in store.snapshots():
+        raise FileNotFoundError(f"No such snapshot: {snapshot}")
+
+    manifest = store.read_snapshot(snapshot)
+    for entry in manifest["files"]:
+        dst = os.path.join(target_folder, *entry["path"].split("/"))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + ".part"
+        with open(tmp, "wb") as f:
+            for cid in entry["chunks"]:
+                f.write(store.get(cid))
+        os.replace(tmp, dst)
+        os.chmod(dst, entry.get("mode", 0o644))
+        os.utime(dst, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+    return snapshot, len(manifest["files"])
+
+
+def prune(store_path, key, keep_last=None):
+    """
+    Optionally drop all but the newest `keep_last` snapshots, then delete
+    every chunk no remaining snapshot references. Returns
+    (snapshots removed, chunks removed, bytes freed).
+    """
+    store = ChunkStore(store_path, key)
+    names = store.snapshots()
+    removed_snapshots = []
+    if keep_last is not None and len(names) > keep_last:
+        removed_snapshots = names[:len(names) - keep_last]
+        for name in removed_snapshots:
+            store.delete_snapshot(name)
+
+    referenced = set()
+    for name in store.snapshots():
+        for entry in store.read_snapshot(name)["files"]:
+            referenced.update(entry["chunks"])
+
+    removed_chunks = 0
+    freed = 0
+    for cid in list(store.chunk_ids()):
+        if cid not in referenced:
+            path = store.chunk_path(cid)
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed_chunks += 1
+
+    return removed_snapshots, removed_chunks, freed
@@ -1,6 +1,13 @@
-from cryptography.fernet import Fernet
-import base64
-import hashlib
+import os
+import io
+import bz2
+import sys
+import json
+import zlib
+import struct
+import zipfile
+import argparse
+from backup_crypto import BackupFormatError, BackupReader, decrypt_file, generate_key
 
 PASSWORD = "YourStrongPassword123"
 
@@ -8,22 +15,172 @@ ENCRYPTED_FILE = r"C:\EncryptedBackups\backup.enc"
 
 OUTPUT_FILE = r"C:\EncryptedBackups\restored_backup.zip"
 
-def generate_key(password):
+EXTRACT_FOLDER = r"C:\EncryptedBackups\restored"
 
-    key = hashlib.sha256(password.encode()).digest()
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
 
-    return base64.urlsafe_b64encode(key)
+# ==========================================
+# INDEX
+# ==========================================
 
-key = generate_key(PASSWORD)
+class PlaintextFile(io.RawIOBase):
+    """Seekable read-only view of a backup's plaintext, for backups without an index."""
 
-fernet = Fernet(key)
+    def __init__(self, reader):
+        self.reader = reader
+        self.pos = 0
 
-with open(ENCRYPTED_FILE, "rb") as f:
-    encrypted_data = f.read()
+    def readable(self):
+        return True
 
-decrypted = fernet.decrypt(encrypted_data)
+    def seekable(self):
+        return True
 
-with open(OUTPUT_FILE, "wb") as f:
-    f.write(decrypted)
+    def tell(self):
+        return self.pos
 
-print("Backup restored.")
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.reader.size}[whence]
+        self.pos = base + offset
+        return self.pos
+
+    def readinto(self, buffer):
+        data = self.reader.read_at(self.pos, len(buffer))
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+def read_index(reader):
+
+    # indexed backups: only the index is decrypted; older backups fall back
+    # to the zip central directory, which sits in the last few frames
+    data = reader.read_index()
+
+    if data is not None:
+        return json.loads(zlib.decompress(data))["files"]
+
+    with zipfile.ZipFile(PlaintextFile(reader)) as z:
+        return [{"path": info.filename, "offset": info.header_offset, "size": info.file_size,
+                 "compress_size": info.compress_size, "method": info.compress_type, "crc": info.CRC}
+                for info in z.infolist() if not info.is_dir()]
+
+def list_backup(encrypted_path, key):
+
+    with open(encrypted_path, "rb") as f:
+        return read_index(BackupReader(f, key))
+
+# ==========================================
+# SINGLE-FILE EXTRACTION
+# ==========================================
+
+def extract_entry(reader, entry, output_path):
+
+    # decrypts only the frames under this entry's local header and data
+    header = reader.read_at(entry["offset"], LOCAL_HEADER.size)
+    fields = LOCAL_HEADER.unpack(header) if len(header) == LOCAL_HEADER.size else (0,)
+
+    if fields[0] != 0x04034B50:
+        raise BackupFormatError(f"No local header for {entry['path']}.")
+
+    offset = entry["offset"] + LOCAL_HEADER.size + fields[-2] + fields[-1]
+    remaining = entry["compress_size"]
+
+    if entry["method"] == zipfile.ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-15)
+    elif entry["method"] == zipfile.ZIP_BZIP2:
+        decompressor = bz2.BZ2Decompressor()
+    elif entry["method"] == zipfile.ZIP_STORED:
+        decompressor = None
+    else:
+        raise BackupFormatError(f"Unsupported compression method {entry['method']}.")
+
+    crc = 0
+    tmp_path = output_path + ".part"
+
+    try:
+        with open(tmp_path, "wb") as out:
+            while remaining:
+                # whole frames at a time, so each one is decrypted once
+                n = min(remaining, reader.frame_size - offset % reader.frame_size)
+                data = reader.read_at(offset, n)
+                if len(data) != n:
+                    raise BackupFormatError(f"{entry['path']} runs past the end of the backup.")
+                offset += n
+                remaining -= n
+                if decompressor:
+                    data = decompressor.decompress(data)
+                crc = zlib.crc32(data, crc)
+                out.write(data)
+
+        if crc != entry["crc"]:
+            raise BackupFormatError(f"CRC mismatch for {entry['path']}.")
+
+        os.replace(tmp_path, output_path)
+
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return output_path
+
+def extract_files(encrypted_path, key, paths, target_folder):
+
+    with open(encrypted_path, "rb") as f:
+        reader = BackupReader(f, key)
+        entries = {entry["path"]: entry for entry in read_index(reader)}
+
+        missing = [p for p in paths if p not in entries]
+        if missing:
+            raise FileNotFoundError(f"Not in backup: {', '.join(missing)}")
+
+        restored = []
+        for path in paths:
+            output_path = os.path.join(target_folder, *path.split("/"))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            restored.append(extract_entry(reader, entries[path], output_path))
+
+    return restored
+
+# ==========================================
+# RUN
+# ==========================================
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Restore an encrypted backup.")
+
+    parser.add_argument("--input", default=ENCRYPTED_FILE, help="Encrypted backup (.enc)")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Restored .zip (full restore)")
+    parser.add_argument("--list", action="store_true", help="List the files in the backup")
+    parser.add_argument("--extract", action="append", metavar="PATH",
+                        help="Restore only this file (repeatable); only its frames are decrypted")
+    parser.add_argument("--to", default=EXTRACT_FOLDER, help="Folder for --extract")
+
+    return parser.parse_args()
+
+def main():
+
+    args = parse_args()
+
+    key = generate_key(PASSWORD)
+
+    try:
+        if args.list:
+            for entry in list_backup(args.input, key):
+                print(f"{entry['size']:>12}  {entry['path']}")
+
+        elif args.extract:
+            for path in extract_files(args.input, key, args.extract, args.to):
+                print(f"Restored {path}")
+
+        else:
+            # streams framed backups; old single-token Fernet backups are still accepted
+            decrypt_file(args.input, args.output, key)
+            print("Backup restored.")
+
+    except (BackupFormatError, FileNotFoundError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
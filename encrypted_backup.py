@@ -1,9 +1,17 @@
 import os
+import sys
+import bz2
+import zlib
+import struct
+import json
 import zipfile
+import argparse
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from cryptography.fernet import Fernet
-import base64
-import hashlib
+from backup_crypto import DEFAULT_KDF, MAX_KDF_COST, BackupFormatError, FrameWriter, encrypt_stream, generate_key, is_framed, verify_backups
+from chunk_store import ChunkStore, backup_incremental, prune, restore_snapshot
 
 # ==========================================
 # CONFIG
@@ -12,79 +20,500 @@ import hashlib
 SOURCE_FOLDER = r"C:\GameSaves"
 BACKUP_FOLDER = r"C:\EncryptedBackups"
 
+# Deduplicated chunk store used by the "incremental" command
+STORE_FOLDER = r"C:\EncryptedBackups\store"
+
 PASSWORD = "YourStrongPassword123"
 
+# scrypt cost for new backups: N = 2**KDF_COST (17 ~ 128 MiB, a fraction of a second)
+KDF_COST = DEFAULT_KDF.log_n
+
+# Compression: codec "deflate", "bzip2" or "store"; level 1 (fastest) .. 9 (smallest)
+COMPRESSION = "deflate"
+COMPRESSION_LEVEL = 6
+
+# Worker threads compressing entries / blocks of large files (1 = plain zipfile)
+COMPRESSION_WORKERS = os.cpu_count() or 1
+
+# Files larger than this are compressed in blocks of this size
+BLOCK_SIZE = 1024 * 1024
+
+# Already-compressed formats are stored as-is
+STORED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".mp3", ".ogg", ".flac", ".mp4", ".mkv", ".webm",
+    ".zip", ".7z", ".rar", ".gz", ".bz2", ".xz", ".zst", ".enc",
+}
+
 # ==========================================
-# KEY GENERATION
+# COMPRESSION POLICY
 # ==========================================
 
-def generate_key(password):
+ZIP_METHODS = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+}
+
+def compression_for(path, codec):
+
+    if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+        return "store"
+
+    return codec
+
+class BackupCancelled(Exception):
+    """Raised inside a backup when its cancel event is set."""
+
+def check_cancel(cancel):
+
+    if cancel is not None and cancel.is_set():
+        raise BackupCancelled("Backup cancelled.")
+
+def walk_files(source_folder, cancel=None):
+
+    # cancel is a threading.Event, checked before every file here and
+    # before every block by the readers
 
-    key = hashlib.sha256(password.encode()).digest()
+    for root, dirs, files in os.walk(source_folder):
 
-    return base64.urlsafe_b64encode(key)
+        for file in files:
+
+            check_cancel(cancel)
+
+            full_path = os.path.join(root, file)
+
+            arcname = os.path.relpath(full_path, source_folder)
+
+            yield full_path, arcname
+
+def scan_source(source_folder):
+
+    # totals for progress reporting: (file count, bytes)
+    count = 0
+    size = 0
+
+    for full_path, _ in walk_files(source_folder):
+        count += 1
+        size += os.path.getsize(full_path)
+
+    return count, size
 
 # ==========================================
 # CREATE ZIP
 # ==========================================
 
-def create_zip(source_folder, output_zip):
+def create_zip(source_folder, output_zip, codec=COMPRESSION, level=COMPRESSION_LEVEL,
+               progress=None, cancel=None):
 
-    with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
+    # output_zip may be a path or a writable file object (e.g. a FrameWriter);
+    # returns the entries and the offset where the central directory starts.
+    # progress(bytes, files) is called for every block written and every
+    # file finished, and cancel is checked before every block
 
-        for root, dirs, files in os.walk(source_folder):
+    with zipfile.ZipFile(output_zip, "w", ZIP_METHODS[codec], compresslevel=level) as zipf:
 
-            for file in files:
+        for full_path, arcname in walk_files(source_folder, cancel):
 
-                full_path = os.path.join(root, file)
+            # what zipf.write() does, but a block at a time
+            info = zipfile.ZipInfo.from_file(full_path, arcname, strict_timestamps=False)
+            info.compress_type = ZIP_METHODS[compression_for(full_path, codec)]
+            info._compresslevel = level
+
+            with open(full_path, "rb") as src, zipf.open(info, "w") as dst:
+                while block := src.read(BLOCK_SIZE):
+                    check_cancel(cancel)
+                    dst.write(block)
+                    if progress:
+                        progress(len(block), 0)
 
-                arcname = os.path.relpath(full_path, source_folder)
+            if progress:
+                progress(0, 1)
 
-                zipf.write(full_path, arcname)
+        end = zipf.start_dir
+
+    return zipf.infolist(), end
 
 # ==========================================
-# ENCRYPT FILE
+# PARALLEL COMPRESSION
 # ==========================================
 
-def encrypt_file(file_path, key):
+ZIP64_LIMIT = (1 << 31) - 1
+MAX_32 = 0xFFFFFFFF
 
-    fernet = Fernet(key)
+class StreamZipInfo(zipfile.ZipInfo):
+    """ZipInfo that can also carry the zip64 decision made when the entry was started."""
 
-    with open(file_path, "rb") as f:
+    zip64 = False
+
+class ZipStreamWriter:
+    """
+    Minimal streaming zip writer for entries whose data arrives already
+    compressed (zipfile can only compress on the calling thread).
+
+    Entries are followed by data descriptors, so the output does not need
+    to be seekable; zip64 records are written when sizes or offsets need them.
+    """
+
+    def __init__(self, fileobj):
+        self.fp = fileobj
+        self.offset = 0
+        self.entries = []
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.offset += len(data)
+
+    def begin(self, info):
+
+        # info is a StreamZipInfo with compress_type and (expected) file_size set
+        info.header_offset = self.offset
+        info.compress_size = 0
+        info.CRC = 0
+        info.flag_bits = 0x08 | (0x800 if not info.filename.isascii() else 0)
+        info.zip64 = info.file_size * 1.05 > ZIP64_LIMIT
+
+        name = info.filename.encode("utf-8")
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if info.zip64 else b""
+        size = MAX_32 if info.zip64 else 0
+
+        self._write(struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45 if info.zip64 else 20, info.flag_bits, info.compress_type,
+            _dos_time(info), _dos_date(info), 0, size, size, len(name), len(extra)
+        ) + name + extra)
+
+        return info
+
+    def write(self, info, data):
+        self._write(data)
+        info.compress_size += len(data)
+
+    def end(self, info, crc, file_size):
+        info.CRC = crc
+        info.file_size = file_size
+
+        if info.zip64:
+            self._write(struct.pack("<IIQQ", 0x08074B50, crc, info.compress_size, file_size))
+        else:
+            self._write(struct.pack("<IIII", 0x08074B50, crc, info.compress_size, file_size))
+
+        self.entries.append(info)
+
+    def close(self):
+
+        # returns the offset of the central directory
+        cd_start = self.offset
+
+        for info in self.entries:
+            name = info.filename.encode("utf-8")
+            values = [info.file_size, info.compress_size, info.header_offset]
+            big = [v for v in values if v >= MAX_32]
+            extra = struct.pack("<HH", 1, 8 * len(big)) + struct.pack(f"<{len(big)}Q", *big) if big else b""
+            file_size, compress_size, header_offset = [min(v, MAX_32) for v in values]
+            version = 45 if big or info.zip64 else 20
+
+            self._write(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, version | (info.create_system << 8), version,
+                info.flag_bits, info.compress_type, _dos_time(info), _dos_date(info), info.CRC,
+                compress_size, file_size, len(name), len(extra), 0, 0, 0, info.external_attr, header_offset
+            ) + name + extra)
+
+        cd_size = self.offset - cd_start
+        count = len(self.entries)
+
+        if count >= 0xFFFF or cd_size >= MAX_32 or cd_start >= MAX_32:
+            zip64_end = self.offset
+            self._write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_start))
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1))
+
+        self._write(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(cd_size, MAX_32), min(cd_start, MAX_32), 0
+        ))
+
+        return cd_start
+
+def _dos_time(info):
+    h, m, s = info.date_time[3:6]
+    return (h << 11) | (m << 5) | (s // 2)
+
+def _dos_date(info):
+    y, mo, d = info.date_time[0:3]
+    return ((y - 1980) << 9) | (mo << 5) | d
+
+def compress_whole(path, codec, level):
+
+    # small files: read, checksum and compress in one go on a worker
+    with open(path, "rb") as f:
         data = f.read()
 
-    encrypted = fernet.encrypt(data)
+    crc = zlib.crc32(data)
+
+    if codec == "deflate":
+        c = zlib.compressobj(level, zlib.DEFLATED, -15)
+        out = c.compress(data) + c.flush()
+    elif codec == "bzip2":
+        out = bz2.compress(data, level)
+    else:
+        out = data
+
+    return crc, len(data), out
+
+def deflate_block(block, zdict, last, level):
+
+    # pigz-style: every block is primed with the previous 32 KiB as dictionary
+    # and ends on a byte boundary, so the blocks concatenate to one deflate stream
+    if zdict:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15)
+
+    return c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def stream_entry(writer, info, path, codec, level, progress=None, cancel=None):
+
+    # large files with a codec that cannot be split into blocks: compress in order
+    compressor = bz2.BZ2Compressor(level) if codec == "bzip2" else None
+    crc = 0
+    size = 0
+
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            check_cancel(cancel)
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            writer.write(info, compressor.compress(block) if compressor else block)
+            if progress:
+                progress(len(block), 0)
+
+    if compressor:
+        writer.write(info, compressor.flush())
+
+    writer.end(info, crc, size)
+
+def create_zip_parallel(source_folder, output_zip, codec=COMPRESSION, level=COMPRESSION_LEVEL,
+                        workers=COMPRESSION_WORKERS, progress=None, cancel=None):
+
+    """
+    Like create_zip(), but entries (and blocks of large deflated files) are
+    compressed on a pool of worker threads and written in order. At most a
+    few blocks per worker are in flight, so memory use stays bounded.
+    Returns the entries and the offset where the central directory starts.
+    """
+
+    if isinstance(output_zip, (str, os.PathLike)):
+        with open(output_zip, "wb") as f:
+            return create_zip_parallel(source_folder, f, codec, level, workers, progress, cancel)
+
+    writer = ZipStreamWriter(output_zip)
+    pending = deque()
+    limit = workers * 4
+
+    def report(nbytes, nfiles):
+        if progress:
+            progress(nbytes, nfiles)
+
+    def drain(keep):
+
+        # progress is reported as blocks reach the output, in order
+        while len(pending) > keep:
+            check_cancel(cancel)
+            kind, info, payload = pending.popleft()
+
+            if kind == "whole":
+                crc, size, data = payload.result()
+                writer.begin(info)
+                writer.write(info, data)
+                writer.end(info, crc, size)
+                report(size, 1)
+            elif kind == "begin":
+                writer.begin(info)
+            elif kind == "block":
+                future, nbytes = payload
+                writer.write(info, future.result())
+                report(nbytes, 0)
+            elif kind == "end":
+                writer.end(info, *payload)
+                report(0, 1)
+            else:
+                writer.begin(info)
+                stream_entry(writer, info, *payload, progress, cancel)
+                report(0, 1)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        for full_path, arcname in walk_files(source_folder, cancel):
+
+            info = StreamZipInfo.from_file(full_path, arcname, strict_timestamps=False)
+            method = compression_for(full_path, codec)
+            info.compress_type = ZIP_METHODS[method]
+
+            if info.file_size <= BLOCK_SIZE:
+                pending.append(("whole", info, pool.submit(compress_whole, full_path, method, level)))
+
+            elif method == "deflate":
+                pending.append(("begin", info, None))
+                crc = 0
+                size = 0
+                previous = None
+                zdict = b""
+
+                with open(full_path, "rb") as f:
+                    while True:
+                        check_cancel(cancel)
+                        block = f.read(BLOCK_SIZE)
+
+                        if previous is not None:
+                            last = not block
+                            future = pool.submit(deflate_block, previous, zdict, last, level)
+                            pending.append(("block", info, (future, len(previous))))
+                            zdict = previous[-32768:]
+                            drain(limit)
+
+                        if not block:
+                            break
+
+                        crc = zlib.crc32(block, crc)
+                        size += len(block)
+                        previous = block
+
+                if previous is None:
+                    # the file shrank to nothing since it was listed
+                    pending.append(("block", info, (pool.submit(deflate_block, b"", b"", True, level), 0)))
+
+                pending.append(("end", info, (crc, size)))
+
+            else:
+                pending.append(("stream", info, (full_path, method, level)))
+
+            drain(limit)
+
+        drain(0)
+
+    return writer.entries, writer.close()
 
+# ==========================================
+# ENCRYPT FILE
+# ==========================================
+
+def encrypt_file(file_path, key):
+
+    # stream frame by frame so memory use does not grow with the archive
     encrypted_path = file_path + ".enc"
 
-    with open(encrypted_path, "wb") as f:
-        f.write(encrypted)
+    with open(file_path, "rb") as src, open(encrypted_path, "wb") as dst:
+        encrypt_stream(src, dst, key)
 
     os.remove(file_path)
 
     return encrypted_path
 
+# ==========================================
+# CENTRAL INDEX
+# ==========================================
+
+def build_index(entries, end, frame_size):
+
+    # entry i occupies [header_offset, next header_offset) of the plaintext
+    # zip (local header, data and data descriptor); "frames" is the inclusive
+    # range of frames a reader has to decrypt to get it back
+    files = []
+    bounds = [info.header_offset for info in entries[1:]] + [end]
+
+    for info, stop in zip(entries, bounds):
+        files.append({
+            "path": info.filename,
+            "offset": info.header_offset,
+            "end": stop,
+            "size": info.file_size,
+            "compress_size": info.compress_size,
+            "method": info.compress_type,
+            "crc": info.CRC,
+            "date_time": list(info.date_time),
+            "frames": [info.header_offset // frame_size, max(stop - 1, 0) // frame_size],
+        })
+
+    return zlib.compress(json.dumps({"files": files}).encode())
+
+# ==========================================
+# ZIP + ENCRYPT IN ONE PASS
+# ==========================================
+
+def create_encrypted_backup(source_folder, encrypted_path, key, codec=COMPRESSION,
+                            level=COMPRESSION_LEVEL, workers=COMPRESSION_WORKERS,
+                            progress=None, cancel=None):
+
+    # zipfile streams straight into the encryptor: one read pass over the
+    # source files, one write pass of ciphertext, no plaintext on disk; the
+    # encrypted index written after the last frame enables single-file restores;
+    # on error or cancellation (BackupCancelled) the partial output is removed
+    part_path = encrypted_path + ".part"
+
+    try:
+        with open(part_path, "wb") as f:
+            with FrameWriter(f, key, indexed=True) as writer:
+                if workers > 1:
+                    entries, end = create_zip_parallel(source_folder, writer, codec, level, workers,
+                                                       progress, cancel)
+                else:
+                    entries, end = create_zip(source_folder, writer, codec, level, progress, cancel)
+
+                writer.index_data = build_index(entries, end, writer.frame_size)
+
+        os.replace(part_path, encrypted_path)
+
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    return encrypted_path
+
+# ==========================================
+# VERIFY
+# ==========================================
+
+def backup_files(paths):
+
+    # files are taken as given; folders (a backup folder or a chunk store)
+    # contribute every .enc or framed file below them
+    for path in paths:
+
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+
+            for file in sorted(files):
+
+                full_path = os.path.join(root, file)
+
+                if file.endswith((".part", ".tmp")):
+                    continue
+
+                if file.endswith(".enc") or is_framed(full_path):
+                    yield full_path
+
 # ==========================================
 # MAIN BACKUP PROCESS
 # ==========================================
 
-def backup():
+def backup(source=SOURCE_FOLDER, destination=BACKUP_FOLDER, codec=COMPRESSION,
+           level=COMPRESSION_LEVEL, workers=COMPRESSION_WORKERS, key=None):
 
-    os.makedirs(BACKUP_FOLDER, exist_ok=True)
+    os.makedirs(destination, exist_ok=True)
 
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-    zip_name = f"backup_{timestamp}.zip"
-
-    zip_path = os.path.join(BACKUP_FOLDER, zip_name)
+    encrypted_name = f"backup_{timestamp}.zip.enc"
 
-    print("Creating zip archive...")
-    create_zip(SOURCE_FOLDER, zip_path)
+    encrypted_path = os.path.join(destination, encrypted_name)
 
-    print("Encrypting archive...")
-    key = generate_key(PASSWORD)
+    print("Creating encrypted archive...")
+    key = key or generate_key(PASSWORD, DEFAULT_KDF._replace(log_n=KDF_COST))
 
-    encrypted_file = encrypt_file(zip_path, key)
+    encrypted_file = create_encrypted_backup(source, encrypted_path, key, codec, level, workers)
 
     print(f"Encrypted backup created:\n{encrypted_file}")
 
@@ -92,5 +521,87 @@ def backup():
 # RUN
 # ==========================================
 
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Create an encrypted backup of a save folder.")
+
+    parser.add_argument("--source", default=SOURCE_FOLDER, help="Folder to back up")
+    parser.add_argument("--dest", default=BACKUP_FOLDER, help="Folder for encrypted backups")
+    parser.add_argument("--codec", choices=sorted(ZIP_METHODS), default=COMPRESSION, help="Compression codec")
+    parser.add_argument("--level", type=int, choices=range(1, 10), default=COMPRESSION_LEVEL,
+                        metavar="1-9", help="Compression level (1 = fastest)")
+    parser.add_argument("-j", "--jobs", type=int, default=COMPRESSION_WORKERS,
+                        help="Compression threads / verify processes (1 = single-threaded)")
+    parser.add_argument("--kdf-cost", type=int, choices=range(14, MAX_KDF_COST + 1), default=KDF_COST,
+                        metavar=f"14-{MAX_KDF_COST}",
+                        help="scrypt cost of new backups, log2 N (each step doubles time and memory)")
+
+    # without a command a full .zip.enc archive is written to --dest
+    commands = parser.add_subparsers(dest="command")
+
+    incremental = commands.add_parser("incremental", help="Add a deduplicated snapshot to the chunk store")
+    incremental.add_argument("--store", default=STORE_FOLDER, help="Chunk store folder")
+
+    snapshots = commands.add_parser("snapshots", help="List the snapshots in the chunk store")
+    snapshots.add_argument("--store", default=STORE_FOLDER, help="Chunk store folder")
+
+    restore = commands.add_parser("restore", help="Restore a snapshot from the chunk store")
+    restore.add_argument("snapshot", help='Snapshot name or "latest"')
+    restore.add_argument("target", help="Folder to restore into")
+    restore.add_argument("--store", default=STORE_FOLDER, help="Chunk store folder")
+
+    verify = commands.add_parser("verify", help="Check every frame of backups without writing plaintext")
+    verify.add_argument("paths", nargs="+", help="Backup files, backup folders or chunk stores")
+
+    prune_cmd = commands.add_parser("prune", help="Delete old snapshots and unreferenced chunks")
+    prune_cmd.add_argument("--keep-last", type=int, help="Keep only the newest N snapshots")
+    prune_cmd.add_argument("--store", default=STORE_FOLDER, help="Chunk store folder")
+
+    return parser.parse_args()
+
+def main():
+
+    args = parse_args()
+
+    key = generate_key(PASSWORD, DEFAULT_KDF._replace(log_n=args.kdf_cost))
+
+    if args.command is None:
+        backup(args.source, args.dest, args.codec, args.level, args.jobs, key)
+        return
+
+    if args.command == "incremental":
+        name, stats = backup_incremental(args.source, args.store, key)
+        print(f"Snapshot {name}: {stats['files']} files, {stats['unchanged']} unchanged, "
+              f"{stats['read_bytes'] / 1e6:.1f} MB read, {stats['new_chunks']} new chunks "
+              f"({stats['stored_bytes'] / 1e6:.1f} MB stored)")
+
+    elif args.command == "snapshots":
+        store = ChunkStore(args.store, key)
+        for name in store.snapshots():
+            files = store.read_snapshot(name)["files"]
+            print(f"{name}  {len(files)} files, {sum(f['size'] for f in files) / 1e6:.1f} MB")
+
+    elif args.command == "restore":
+        name, count = restore_snapshot(args.store, key, args.snapshot, args.target)
+        print(f"Restored {count} files from {name} to {args.target}")
+
+    elif args.command == "verify":
+        paths = list(backup_files(args.paths))
+        start = time.perf_counter()
+        try:
+            results = verify_backups(paths, key, args.jobs)
+        except BackupFormatError as e:
+            print(f"FAILED: {e}", file=sys.stderr)
+            sys.exit(1)
+        seconds = time.perf_counter() - start
+        frames = sum(n for n, _ in results.values())
+        size = sum(b for _, b in results.values())
+        print(f"OK: {len(results)} backups, {frames} frames, {size / 1e6:.1f} MB "
+              f"in {seconds:.1f}s ({size / 1e6 / max(seconds, 1e-9):.1f} MB/s)")
+
+    elif args.command == "prune":
+        snapshots, chunks, freed = prune(args.store, key, args.keep_last)
+        print(f"Removed {len(snapshots)} snapshots and {chunks} chunks ({freed / 1e6:.1f} MB freed)")
+
 if __name__ == "__main__":
-    backup()
+    main()
@@ -1,46 +1,44 @@
 
 import os
-import zipfile
-import hashlib
-import base64
+import time
+import queue
+import threading
 from datetime import datetime
-from cryptography.fernet import Fernet
+from backup_crypto import generate_key
+from encrypted_backup import BackupCancelled, create_encrypted_backup, scan_source
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
+
+POLL_MS = 100
 
 # =========================
-# ENCRYPTION HELPERS
+# BACKGROUND WORKER
 # =========================
 
-def generate_key(password):
-    key = hashlib.sha256(password.encode()).digest()
-    return base64.urlsafe_b64encode(key)
-
-def create_zip(source_folder, output_zip):
-    with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(source_folder):
-            for file in files:
-                full_path = os.path.join(root, file)
-                arcname = os.path.relpath(full_path, source_folder)
-                zipf.write(full_path, arcname)
-
-def encrypt_file(file_path, password):
-    key = generate_key(password)
-    fernet = Fernet(key)
+def backup_worker(source, encrypted_path, password, events, cancel):
 
-    with open(file_path, "rb") as f:
-        data = f.read()
+    # runs off the Tk thread; everything it reports goes through `events`
+    try:
+        files, total = scan_source(source)
+        events.put(("start", files, total))
 
-    encrypted = fernet.encrypt(data)
+        def progress(nbytes, nfiles):
+            events.put(("progress", nbytes, nfiles))
 
-    encrypted_path = file_path + ".enc"
+        encrypted_file = create_encrypted_backup(source, encrypted_path, generate_key(password),
+                                                 progress=progress, cancel=cancel)
+        events.put(("done", encrypted_file))
 
-    with open(encrypted_path, "wb") as f:
-        f.write(encrypted)
+    except BackupCancelled:
+        events.put(("cancelled",))
 
-    os.remove(file_path)
+    except Exception as e:
+        events.put(("error", str(e)))
 
-    return encrypted_path
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
 
 # =========================
 # GUI FUNCTIONS
@@ -67,32 +65,104 @@ def run_backup():
 
     try:
         os.makedirs(backup, exist_ok=True)
+    except OSError as e:
+        messagebox.showerror("Backup Failed", str(e))
+        return
 
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        zip_name = f"backup_{timestamp}.zip"
-
-        zip_path = os.path.join(backup, zip_name)
-
-        status_var.set("Creating ZIP archive...")
-        root.update()
-
-        create_zip(source, zip_path)
-
-        status_var.set("Encrypting backup...")
-        root.update()
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    encrypted_name = f"backup_{timestamp}.zip.enc"
+
+    encrypted_path = os.path.join(backup, encrypted_name)
+
+    job.update(events=queue.Queue(), cancel=threading.Event(), files=0, total=0,
+               done_files=0, done_bytes=0, started=time.monotonic())
+    job["thread"] = threading.Thread(
+        target=backup_worker,
+        args=(source, encrypted_path, password, job["events"], job["cancel"]),
+        daemon=True,
+    )
+
+    backup_button.config(state="disabled")
+    cancel_button.config(state="normal")
+    progress_bar.config(value=0, maximum=1)
+    status_var.set("Scanning source folder...")
+
+    job["thread"].start()
+    root.after(POLL_MS, poll_backup)
+
+def poll_backup():
+    finished = None
+
+    # drain everything the worker queued since the last poll
+    while True:
+        try:
+            event = job["events"].get_nowait()
+        except queue.Empty:
+            break
+
+        if event[0] == "start":
+            job["files"], job["total"] = event[1], event[2]
+            job["started"] = time.monotonic()
+            progress_bar.config(maximum=max(job["total"], 1))
+        elif event[0] == "progress":
+            job["done_bytes"] += event[1]
+            job["done_files"] += event[2]
+        else:
+            finished = event
+
+    if finished is None:
+        show_progress()
+        root.after(POLL_MS, poll_backup)
+        return
 
-        encrypted_file = encrypt_file(zip_path, password)
+    job["thread"].join()
+    backup_button.config(state="normal")
+    cancel_button.config(state="disabled")
 
+    if finished[0] == "done":
+        progress_bar.config(value=progress_bar["maximum"])
         status_var.set("Backup completed.")
-
         messagebox.showinfo(
             "Success",
-            f"Encrypted backup created:\n\n{encrypted_file}"
+            f"Encrypted backup created:\n\n{finished[1]}"
         )
-
-    except Exception as e:
-        messagebox.showerror("Backup Failed", str(e))
+    elif finished[0] == "cancelled":
+        progress_bar.config(value=0)
+        status_var.set("Backup cancelled.")
+    else:
         status_var.set("Backup failed.")
+        messagebox.showerror("Backup Failed", finished[1])
+
+def show_progress():
+    if not job["total"] and not job["done_files"]:
+        return
+
+    elapsed = max(time.monotonic() - job["started"], 1e-6)
+    rate = job["done_bytes"] / elapsed
+    remaining = max(job["total"] - job["done_bytes"], 0)
+    eta = format_eta(remaining / rate) if rate > 0 else "--:--"
+
+    progress_bar.config(value=job["done_bytes"])
+    status_var.set(
+        f"{job['done_files']}/{job['files']} files, "
+        f"{job['done_bytes'] / 1e6:.1f}/{job['total'] / 1e6:.1f} MB, "
+        f"{rate / 1e6:.1f} MB/s, ETA {eta}"
+    )
+
+def cancel_backup():
+    if job.get("thread") and job["thread"].is_alive():
+        job["cancel"].set()
+        cancel_button.config(state="disabled")
+        status_var.set("Cancelling...")
+
+def on_close():
+    # let a running backup remove its partial output before exiting
+    if job.get("thread") and job["thread"].is_alive():
+        cancel_backup()
+        root.after(POLL_MS, on_close)
+        return
+
+    root.destroy()
 
 # =========================
 # GUI SETUP
@@ -100,7 +170,11 @@ def run_backup():
 
 root = tk.Tk()
 root.title("Encrypted Backup Manager")
-root.geometry("600x300")
+root.geometry("600x340")
+root.protocol("WM_DELETE_WINDOW", on_close)
+
+# state of the running backup, only touched on the Tk thread
+job = {}
 
 source_var = tk.StringVar()
 backup_var = tk.StringVar()
@@ -130,15 +204,32 @@ tk.Label(root, text="Encryption Password").pack(anchor="w", padx=10, pady=(10, 0
 
 tk.Entry(root, textvariable=password_var, show="*").pack(fill="x", padx=10)
 
-# Backup Button
-tk.Button(
-    root,
+# Backup / Cancel Buttons
+button_frame = tk.Frame(root)
+button_frame.pack(pady=(20, 10))
+
+backup_button = tk.Button(
+    button_frame,
     text="Create Encrypted Backup",
     command=run_backup,
     height=2
-).pack(pady=20)
+)
+backup_button.pack(side="left", padx=5)
+
+cancel_button = tk.Button(
+    button_frame,
+    text="Cancel",
+    command=cancel_backup,
+    height=2,
+    state="disabled"
+)
+cancel_button.pack(side="left", padx=5)
+
+# Progress
+progress_bar = ttk.Progressbar(root, mode="determinate")
+progress_bar.pack(fill="x", padx=10)
 
 # Status
-tk.Label(root, textvariable=status_var).pack()
+tk.Label(root, textvariable=status_var).pack(pady=(5, 0))
 
 root.mainloop()
@@ -0,0 +1,203 @@
+"""
+fast_copy.py
+
+File copy engine for sync_data.py.
+
+copy_file() tries, in order:
+- a reflink (FICLONE): the copy shares the source's blocks until either is
+  written to, so it is instant whatever the size (Btrfs, XFS, bcachefs)
+- os.copy_file_range(): the kernel copies without passing the data through
+  user space, and offloads to the server on NFS 4.2 / SMB
+- os.sendfile(): the same for kernels or filesystems without copy_file_range
+- readinto() a reused per-thread buffer and write it out
+
+Each method falls back to the next where it is unsupported (other systems,
+crossing filesystems, old kernels), resuming where the last one stopped.
+Sparse files are copied extent by extent (SEEK_DATA / SEEK_HOLE), so their
+holes stay holes.
+"""
+
+import errno
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+BUFFER_SIZE = 1024 * 1024
+
+# kernel copy calls are made in pieces of this size, so a copy can be interrupted
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# errors that mean "this method cannot do this copy", not "the copy failed"
+UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+               errno.EBADF, errno.ENOTSOCK, errno.ETXTBSY}
+
+METHODS = ("reflink", "copy_file_range", "sendfile", "readinto")
+
+_buffers = threading.local()
+
+
+# ==========================================
+# METHODS
+# ==========================================
+
+def _reflink(src_fd, dst_fd):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError:
+        return False
+    return True
+
+
+# the kernel methods copy one piece per call and return the new offset, so
+# copy_range() knows how far they got if the next call fails
+
+def _copy_file_range(src_fd, dst_fd, offset, end):
+    return offset + os.copy_file_range(src_fd, dst_fd, min(end - offset, CHUNK_SIZE), offset, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, end):
+    # sendfile writes at the destination's file position
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    return offset + os.sendfile(dst_fd, src_fd, offset, min(end - offset, CHUNK_SIZE))
+
+
+def _readinto(src_fd, dst_fd, offset, end):
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    with open(src_fd, "rb", buffering=0, closefd=False) as src:
+        while offset < end:
+            n = src.readinto(view[:min(end - offset, BUFFER_SIZE)])
+            if not n:
+                break
+            done = 0
+            while done < n:
+                done += os.write(dst_fd, view[done:n])
+            offset += n
+    return offset
+
+
+# the kernel calls only exist on some systems (neither does on Windows)
+_RANGE_METHODS = [(name, copy) for name, copy in
+                  [("copy_file_range", _copy_file_range), ("sendfile", _sendfile), ("readinto", _readinto)]
+                  if name == "readinto" or hasattr(os, name)]
+
+
+# ==========================================
+# COPY
+# ==========================================
+
+def data_extents(fd, size):
+    """[(start, end)] of the parts of a file that hold data; one extent unless the file has holes."""
+    if not hasattr(os, "SEEK_DATA"):
+        return [(0, size)]
+
+    extents = []
+    offset = 0
+    try:
+        while offset < size:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            extents.append((start, end))
+            offset = end
+    except OSError as e:
+        if e.errno == errno.ENXIO:
+            # no data after offset: the rest is a hole
+            return extents
+        # SEEK_DATA not supported here
+        return [(0, size)]
+    return extents
+
+
+class Copier:
+    """
+    Copies files with the fastest of `methods` that works. A method the
+    kernel does not have at all (ENOSYS) is not tried again.
+    """
+
+    def __init__(self, methods=METHODS):
+        self.methods = [m for m in METHODS if m in methods]
+
+    def copy_range(self, src_fd, dst_fd, start, end):
+        """Copy bytes start..end; returns the method that finished it."""
+        offset = start
+        for name, copy in _RANGE_METHODS:
+            if name not in self.methods and name != "readinto":
+                continue
+            # each method carries on from where the previous one stopped;
+            # one that stops short or raises "unsupported" hands over to the next
+            while offset < end:
+                try:
+                    done = copy(src_fd, dst_fd, offset, end)
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED or name == "readinto":
+                        raise
+                    if e.errno == errno.ENOSYS:
+                        self.methods = [m for m in self.methods if m != name]
+                    break
+                if done <= offset:
+                    break
+                offset = done
+            if offset >= end:
+                return name
+        raise OSError(errno.EIO, f"source ended at byte {offset} of {end} while copying")
+
+    def copy_file(self, src_file, dst_file):
+        """
+        Copy src_file's contents over dst_file (created or truncated); returns
+        the method that did the copy, with ", sparse" added when the source
+        had holes and they were kept.
+        """
+        with open(src_file, "rb", buffering=0) as src, open(dst_file, "wb", buffering=0) as dst:
+            src_fd, dst_fd = src.fileno(), dst.fileno()
+            st = os.fstat(src_fd)
+
+            if st.st_size == 0:
+                return "empty"
+
+            if "reflink" in self.methods and _reflink(src_fd, dst_fd):
+                return "reflink"
+
+            # fewer allocated blocks than the size needs: there are holes
+            sparse = getattr(st, "st_blocks", None) is not None and st.st_blocks * 512 < st.st_size
+            extents = data_extents(src_fd, st.st_size) if sparse else [(0, st.st_size)]
+
+            method = None
+            for start, end in extents:
+                method = self.copy_range(src_fd, dst_fd, start, end)
+
+            if sparse:
+                # sets the size, leaving a trailing hole a hole
+                os.ftruncate(dst_fd, st.st_size)
+                return f"{method or 'empty'}, sparse"
+            return method or "empty"
+
+
+_default = Copier()
+
+
+def copy_file(src_file, dst_file):
+    """Copy the contents of src_file to dst_file; returns the method used."""
+    return _default.copy_file(src_file, dst_file)
+
+
+def copy2(src_file, dst_file):
+    """Drop-in for shutil.copy2 (to a file path): contents through copy_file(), then timestamps and mode."""
+    method = copy_file(src_file, dst_file)
+    shutil.copystat(src_file, dst_file)
+    return method
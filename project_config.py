@@ -6,6 +6,7 @@ Central configuration module for the library-build project.
 This file allows you to:
 - Define default source/include directories
 - Set default C/C++ compiler flags
+- Define named build profiles (debug, release, release-lto, pgo)
 - Provide per-platform overrides
 - Store common library dependencies
 - Keep metadata in one place
@@ -52,12 +53,50 @@ DEFAULT_LIBS = []               # e.g. ["m", "pthread"]
 DEFAULT_CFLAGS = [
     "-Wall",
     "-Wextra",
-    "-O2",
 ]
 
 DEFAULT_LDFLAGS = []
 
 
+# ---------------------------------------
+# Build Profiles (build_lib.py --profile NAME)
+# ---------------------------------------
+# "cflags"/"ldflags" apply to gcc/clang, "msvc_cflags"/"msvc_ldflags" to cl/link.
+# A profile with "pgo": True runs the three-stage profile-guided pipeline
+# (instrumented build, training command, optimized rebuild).
+
+# Profile used when --profile is not given. None keeps profiles opt-in: a
+# plain build gets only the compiler's defaults and --cflags (release would
+# also define NDEBUG and compile out assert()).
+DEFAULT_PROFILE = None
+
+BUILD_PROFILES = {
+    "debug": {
+        "cflags": ["-O0", "-g"],
+        "ldflags": [],
+        "msvc_cflags": ["/Od", "/Zi"],
+        "msvc_ldflags": ["/DEBUG"],
+    },
+    "release": {
+        "cflags": ["-O2", "-DNDEBUG"],
+        "ldflags": [],
+        "msvc_cflags": ["/O2", "/DNDEBUG"],
+        "msvc_ldflags": [],
+    },
+    "release-lto": {
+        "cflags": ["-O2", "-DNDEBUG", "-flto"],
+        "ldflags": ["-flto"],
+        "msvc_cflags": ["/O2", "/DNDEBUG", "/GL"],
+        "msvc_ldflags": ["/LTCG"],
+    },
+    "pgo": {
+        "cflags": ["-O2", "-DNDEBUG"],
+        "ldflags": [],
+        "pgo": True,
+    },
+}
+
+
 # ---------------------------------------
 # Platform-Specific Overrides
 # ---------------------------------------
@@ -90,4 +129,6 @@ CONFIG = {
     "ldflags": DEFAULT_LDFLAGS,
     "build_dir": str(BUILD_DIR),
     "build_type": DEFAULT_BUILD_TYPE,
+    "profile": DEFAULT_PROFILE,
+    "profiles": BUILD_PROFILES,
 }
@@ -1,7 +1,18 @@
 import os
+import sys
+import time
 import shutil
+import sqlite3
+import stat
+import struct
+import threading
 import hashlib
-from pathlib import Path
+import pathlib
+import argparse
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from fast_copy import copy2
 
 # ==========================================
 # CONFIGURATION
@@ -10,6 +21,33 @@ from pathlib import Path
 SOURCE_FOLDER = r"C:\GameSaves"
 DESTINATION_FOLDER = r"D:\Backup\GameSaves"
 
+# Manifest of what was last synced; None = <destination>/.sync_manifest.sqlite
+MANIFEST_FILE = None
+MANIFEST_NAME = ".sync_manifest.sqlite"
+
+# Worker threads per pipeline stage; hashing and copying release the GIL
+SCAN_WORKERS = 8
+HASH_WORKERS = os.cpu_count() or 1
+COPY_WORKERS = 4
+
+# Read size for hashing (the old 4 KiB reads were syscall-bound)
+BUFFER_SIZE = 1024 * 1024
+
+# Files at least this big that already exist at the destination are patched
+# block by block instead of copied whole (None = always copy whole files)
+DELTA_THRESHOLD = 64 * 1024 * 1024
+DELTA_BLOCK_SIZE = 64 * 1024
+
+# --mirror: plan operations are carried out (and recorded in the manifest) this many at a time
+MIRROR_BATCH = 1000
+
+# --watch: a changed file is synced once it has been quiet for WATCH_SETTLE
+# seconds (or has been dirty for WATCH_MAX_DELAY), and a full audit scan
+# catches anything the filesystem events missed
+WATCH_SETTLE = 2.0
+WATCH_MAX_DELAY = 60.0
+AUDIT_INTERVAL = 30 * 60
+
 # ==========================================
 # HELPER FUNCTIONS
 # ==========================================
@@ -19,71 +57,1104 @@ def file_hash(filepath):
     Generate SHA256 hash for file comparison
     """
     sha256 = hashlib.sha256()
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
 
-    with open(filepath, "rb") as f:
-        while chunk := f.read(4096):
-            sha256.update(chunk)
+    with open(filepath, "rb", buffering=0) as f:
+        while n := f.readinto(buffer):
+            sha256.update(view[:n])
 
     return sha256.hexdigest()
 
 
-def files_are_different(src, dst):
+# ==========================================
+# MANIFEST
+# ==========================================
+
+class Manifest:
     """
-    Compare files using hash
+    SQLite record of every synced file: the source's size, mtime_ns, inode
+    and SHA-256 (when known), plus the destination's size and mtime_ns as
+    they were right after the sync. A file whose source and destination
+    stat data both still match is skipped without being opened.
     """
-    if not os.path.exists(dst):
-        return True
 
-    if os.path.getsize(src) != os.path.getsize(dst):
-        return True
+    def __init__(self, path, source, read_only=False):
+        if read_only:
+            # work on a copy in memory: nothing below may touch the file on disk.
+            # Even read-only, SQLite creates -wal/-shm files for a WAL database
+            # unless told it is immutable, which holds unless a -wal was left behind
+            uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+            if not os.path.exists(f"{path}-wal"):
+                uri += "&immutable=1"
+            disk = sqlite3.connect(uri, uri=True)
+            self.db = sqlite3.connect(":memory:")
+            try:
+                disk.backup(self.db)
+            finally:
+                disk.close()
+        else:
+            self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash TEXT,"
+            " dst_size INTEGER, dst_mtime_ns INTEGER)"
+        )
+        # block signatures of large destination files, valid while their stat data is unchanged
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            " path TEXT PRIMARY KEY, dst_size INTEGER, dst_mtime_ns INTEGER, block_size INTEGER, sigs BLOB)"
+        )
+
+        # a manifest describes one source folder; start over if it moved
+        source = os.path.abspath(source)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        if row is None or row[0] != source:
+            self.db.execute("DELETE FROM files")
+            self.db.execute("DELETE FROM signatures")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (source,))
+            self.db.commit()
+
+        # one query instead of one per file; lookups are then dictionary hits
+        self.entries = {row[0]: row[1:] for row in self.db.execute("SELECT * FROM files")}
+        self.seen = set()
+        self.updates = []
+        self.signature_updates = []
+        self.moves = []
+        self.forgotten = []
+
+    def get(self, rel):
+        self.seen.add(rel)
+        return self.entries.get(rel)
+
+    def record(self, rel, src_stat, digest, dst_stat):
+        row = (src_stat.st_size, src_stat.st_mtime_ns, src_stat.st_ino, digest,
+               dst_stat.st_size, dst_stat.st_mtime_ns)
+        # a no-change run writes nothing back
+        if self.entries.get(rel) != row:
+            self.entries[rel] = row
+            self.updates.append((rel,) + row)
+
+    def signatures(self, rel, dst_stat, block_size):
+        """Stored block signatures of the destination file, or None if stale or missing."""
+        row = self.db.execute("SELECT dst_size, dst_mtime_ns, block_size, sigs FROM signatures WHERE path = ?",
+                              (rel,)).fetchone()
+        if row and row[:3] == (dst_stat.st_size, dst_stat.st_mtime_ns, block_size):
+            return row[3]
+        return None
+
+    def record_signatures(self, rel, dst_stat, block_size, sigs):
+        self.signature_updates.append((rel, dst_stat.st_size, dst_stat.st_mtime_ns, block_size, sigs))
+
+    def move(self, old, new, src_stat, digest, dst_stat):
+        """old was renamed to new at the destination; its block signatures go with it."""
+        self.get(new)
+        self.record(new, src_stat, digest, dst_stat)
+        self.moves.append((new, old))
+        self.forget(old)
+
+    def forget(self, rel):
+        self.entries.pop(rel, None)
+        self.seen.discard(rel)
+        self.forgotten.append((rel,))
+
+    def flush(self, full_scan=False):
+        """
+        Write recorded changes. After a full scan, entries for files that
+        were not seen (gone from the source) are dropped as well, and the
+        next scan starts from a clean slate.
+        """
+        gone = [(rel,) for rel in self.entries if rel not in self.seen] if full_scan else []
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", self.updates)
+            self.db.executemany("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?)",
+                                self.signature_updates)
+            self.db.executemany("UPDATE OR REPLACE signatures SET path = ? WHERE path = ?", self.moves)
+            self.db.executemany("DELETE FROM files WHERE path = ?", gone + self.forgotten)
+            self.db.executemany("DELETE FROM signatures WHERE path = ?", gone + self.forgotten)
+        for (rel,) in gone:
+            del self.entries[rel]
+        if full_scan:
+            self.seen = set()
+        self.updates = []
+        self.signature_updates = []
+        self.moves = []
+        self.forgotten = []
+
+    def close(self):
+        self.db.close()
+
+
+def stat_matches(st, size, mtime_ns, inode=None):
+    return (st.st_size == size and st.st_mtime_ns == mtime_ns
+            and (inode is None or st.st_ino == inode))
+
+
+SKIP, COPY, HASH = "skip", "copy", "hash"
+
+
+def classify(src_stat, dst_stat, entry, checksum=False):
+    """
+    Decide from stat data alone: SKIP, COPY, or HASH when only the contents
+    can tell (sizes match but the manifest cannot vouch for both sides).
+    """
+    if dst_stat is None:
+        return COPY
+
+    if not checksum and entry is not None and stat_matches(src_stat, *entry[0:3]) \
+            and stat_matches(dst_stat, *entry[4:6]):
+        return SKIP
+
+    if src_stat.st_size != dst_stat.st_size:
+        return COPY
 
-    return file_hash(src) != file_hash(dst)
+    return HASH
+
+
+def compare_contents(src_file, dst_file, src_stat, dst_stat, entry, checksum=False):
+    """
+    Hash what has to be hashed; returns (same?, source hash). A side whose
+    stat data is unchanged still has the content recorded at the last sync.
+    """
+    trusted = entry[3] if entry is not None and not checksum else None
+    src_hash = trusted if trusted and stat_matches(src_stat, *entry[0:3]) else file_hash(src_file)
+    dst_hash = trusted if trusted and stat_matches(dst_stat, *entry[4:6]) else file_hash(dst_file)
+
+    return src_hash == dst_hash, src_hash
+
+
+# ==========================================
+# SCANNER
+# ==========================================
+
+def scan_dir(path):
+    """One directory: (sorted [(name, stat)] of files, sorted subdirectory names)."""
+    files = []
+    dirs = []
+
+    with os.scandir(path) as it:
+        for entry in it:
+            # like os.walk: do not descend into symlinked directories
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif not entry.is_dir():
+                    files.append((entry.name, entry.stat()))
+            except FileNotFoundError:
+                # deleted while we were listing
+                continue
+
+    files.sort()
+    dirs.sort()
+    return files, dirs
+
+
+def scan_tree(source, workers=SCAN_WORKERS, onerror=None):
+    """
+    Yield (relative dir, [(name, stat)]) for every directory under source in
+    sorted depth-first order. Subdirectories are listed on a thread pool
+    ahead of being yielded, so slow (network) listings overlap. Unreadable
+    directories are passed to onerror(path, exception) and skipped.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque([("", pool.submit(scan_dir, source))])
+
+        while pending:
+            rel, fut = pending.popleft()
+            try:
+                files, dirs = fut.result()
+            except OSError as e:
+                if onerror:
+                    onerror(os.path.join(source, rel), e)
+                continue
+
+            children = [(rel + name + "/", pool.submit(scan_dir, os.path.join(source, rel, name)))
+                        for name in dirs]
+            pending.extendleft(reversed(children))
+
+            yield rel, files
+
+
+# ==========================================
+# DELTA SYNC
+# ==========================================
+
+# Journal of the blocks a delta sync is about to write: "SYNCDLT1", the new
+# file size, then (offset, length, data) records and a zero-length end record.
+JOURNAL_MAGIC = b"SYNCDLT1"
+JOURNAL_HEADER = struct.Struct(">8sQ")
+JOURNAL_RECORD = struct.Struct(">QI")
+SIG_SIZE = 16
+
+
+def block_signature(block):
+    # truncated SHA-256: with SHA extensions it outruns blake2b and md5
+    return hashlib.sha256(block).digest()[:SIG_SIZE]
+
+
+def file_signatures(path, block_size=DELTA_BLOCK_SIZE):
+    """Concatenated signatures of every block_size block of path."""
+    sigs = bytearray()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            sigs += block_signature(block)
+    return bytes(sigs)
+
+
+def journal_path(dst_file):
+    head, tail = os.path.split(dst_file)
+    return os.path.join(head, f".{tail}.syncdelta")
+
+
+def replay_journal(dst_file):
+    """
+    Finish (or discard) a delta sync interrupted by a crash. A complete
+    journal is applied again, so the file ends up whole; an incomplete one
+    was written before the file was touched and is simply removed.
+    """
+    journal = journal_path(dst_file)
+    if not os.path.exists(journal):
+        return False
+
+    with open(journal, "rb") as j:
+        records = []
+        complete = False
+        header = j.read(JOURNAL_HEADER.size)
+        if len(header) == JOURNAL_HEADER.size and header[:8] == JOURNAL_MAGIC:
+            new_size = JOURNAL_HEADER.unpack(header)[1]
+            while len(word := j.read(JOURNAL_RECORD.size)) == JOURNAL_RECORD.size:
+                offset, length = JOURNAL_RECORD.unpack(word)
+                if length == 0:
+                    complete = True
+                    break
+                records.append((offset, length, j.tell()))
+                j.seek(length, os.SEEK_CUR)
+
+        if complete:
+            with open(dst_file, "r+b") as dst:
+                for offset, length, position in records:
+                    j.seek(position)
+                    dst.seek(offset)
+                    dst.write(j.read(length))
+                dst.truncate(new_size)
+                dst.flush()
+                os.fsync(dst.fileno())
+
+    os.remove(journal)
+    return complete
+
+
+def delta_sync(src_file, dst_file, old_sigs=None, block_size=DELTA_BLOCK_SIZE):
+    """
+    Bring an existing dst_file up to date with src_file by rewriting only
+    the blocks that differ. old_sigs are dst_file's block signatures (read
+    from dst_file when not given). Changed blocks are first written to a
+    journal next to dst_file and fsynced, then applied in place, so a crash
+    never leaves a half-patched file behind (see replay_journal()).
+    Returns (source SHA-256, new signatures, bytes written to dst_file,
+    whether dst_file changed at all).
+    """
+    replay_journal(dst_file)
+    if old_sigs is None:
+        old_sigs = file_signatures(dst_file, block_size)
+
+    journal = journal_path(dst_file)
+    sha256 = hashlib.sha256()
+    new_sigs = bytearray()
+    written = 0
+    new_size = os.path.getsize(src_file)
+
+    try:
+        with open(src_file, "rb") as src, open(journal, "wb") as j:
+            j.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, new_size))
+            offset = 0
+            while block := src.read(block_size):
+                sha256.update(block)
+                sig = block_signature(block)
+                i = len(new_sigs)
+                new_sigs += sig
+                # a block matches only at the same offset: blocks shifted by an
+                # insertion would have to be moved, which in place is a rewrite anyway
+                if old_sigs[i:i + SIG_SIZE] != sig:
+                    j.write(JOURNAL_RECORD.pack(offset, len(block)) + block)
+                    written += len(block)
+                offset += len(block)
+            j.write(JOURNAL_RECORD.pack(0, 0))
+            j.flush()
+            os.fsync(j.fileno())
+    except BaseException:
+        # dst_file has not been touched yet
+        if os.path.exists(journal):
+            os.remove(journal)
+        raise
+
+    # the journal is complete: from here a crash is recovered by replaying it
+    replay_journal(dst_file)
+    shutil.copystat(src_file, dst_file)
+
+    changed = written > 0 or len(old_sigs) != len(new_sigs)
+    return sha256.hexdigest(), bytes(new_sigs), written, changed
 
 
 # ==========================================
 # SYNC LOGIC
 # ==========================================
 
-def sync_folders(source, destination):
+class SyncStats:
+    """Counters for one sync run."""
 
-    source = Path(source)
-    destination = Path(destination)
+    def __init__(self):
+        self.started = time.monotonic()
+        self.files = 0
+        self.bytes = 0
+        self.copied = 0
+        self.copied_bytes = 0
+        self.skipped = 0
+        self.hashed = 0
+        self.delta = 0
+        self.written_bytes = 0
+        self.renamed = 0
+        self.deleted = 0
+        self.errors = 0
 
-    for root, dirs, files in os.walk(source):
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-9)
 
-        relative_path = Path(root).relative_to(source)
-        target_dir = destination / relative_path
+    def as_dict(self):
+        return {"copied": self.copied, "skipped": self.skipped, "errors": self.errors}
 
-        # Create missing folders
-        target_dir.mkdir(parents=True, exist_ok=True)
+    def summary(self):
+        seconds = self.elapsed()
+        return (f"{self.files} files ({self.bytes / 1e6:.1f} MB) in {seconds:.2f}s: "
+                f"{self.files / seconds:.0f} files/s, {self.bytes / 1e6 / seconds:.1f} MB/s scanned, "
+                f"{self.copied_bytes / 1e6 / seconds:.1f} MB/s copied, {self.written_bytes / 1e6:.1f} MB written; "
+                f"{self.copied} copied ({self.delta} by delta), {self.skipped} skipped, "
+                f"{self.hashed} hashed, {self.renamed} renamed, {self.deleted} deleted, {self.errors} errors")
 
-        for file in files:
 
-            src_file = Path(root) / file
-            dst_file = target_dir / file
+# what a file's job produced; written is the bytes written to the destination
+Outcome = namedtuple("Outcome", "action digest dst_stat written signatures", defaults=(0, None))
 
-            try:
-                if files_are_different(src_file, dst_file):
 
-                    shutil.copy2(src_file, dst_file)
+def copy_task(src_file, dst_file, digest=None):
+    # reflink / copy_file_range / sendfile where available; keeps holes
+    copy2(src_file, dst_file)
+    dst_stat = os.stat(dst_file)
+    return Outcome(COPY, digest, dst_stat, dst_stat.st_size)
+
+
+def hash_task(src_file, dst_file, src_stat, dst_stat, entry, checksum, copy_pool):
+    same, digest = compare_contents(src_file, dst_file, src_stat, dst_stat, entry, checksum)
+    if same:
+        return Outcome(SKIP, digest, dst_stat)
+    # hand over to the copy stage; the caller waits on the returned future
+    return copy_pool.submit(copy_task, src_file, dst_file, digest)
+
+
+def delta_task(src_file, dst_file, old_sigs, block_size):
+    digest, sigs, written, changed = delta_sync(src_file, dst_file, old_sigs, block_size)
+    return Outcome(COPY if changed else SKIP, digest, os.stat(dst_file), written, sigs)
+
+
+# tuning shared by one-shot runs, watch mode and audits
+SyncOptions = namedtuple(
+    "SyncOptions", "checksum verbose scan_workers hash_workers copy_workers delta_threshold block_size",
+    defaults=(False, False, SCAN_WORKERS, HASH_WORKERS, COPY_WORKERS, DELTA_THRESHOLD, DELTA_BLOCK_SIZE),
+)
+
+
+def sync_entries(entries, source, destination, manifest, stats, options, dst_stats=None):
+
+    """
+    Sync every (relative dir, [(name, stat)]) of `entries` (as produced by
+    scan_tree()). Stat-only decisions are made here; files that need hashing
+    go to a hash pool and files that need copying to a copy pool. Files of
+    at least delta_threshold bytes that already exist at the destination are
+    patched block by block on the copy pool instead. Results are reported
+    (and recorded in the manifest) in order, so output is the same whatever
+    the concurrency. dst_stats ({rel: stat}), when given, stands in for
+    stat'ing the destination.
+    """
+
+    pending = deque()
+    window = 16 * (options.hash_workers + options.copy_workers)
+
+    def report(keep):
 
-                    print(f"[SYNCED] {src_file} -> {dst_file}")
+        while len(pending) > keep:
+            rel, src_file, dst_file, src_stat, job = pending.popleft()
+
+            try:
+                # a hash job may hand over to a copy job
+                while isinstance(job, Future):
+                    job = job.result()
 
+                if job.action == COPY:
+                    stats.copied += 1
+                    stats.copied_bytes += src_stat.st_size
+                    stats.written_bytes += job.written
+                    if job.signatures is not None:
+                        stats.delta += 1
+                        print(f"[DELTA] {src_file} -> {dst_file} ({job.written} bytes written)")
+                    else:
+                        print(f"[SYNCED] {src_file} -> {dst_file}")
                 else:
-                    print(f"[SKIPPED] {src_file}")
+                    stats.skipped += 1
+                    if options.verbose:
+                        print(f"[SKIPPED] {src_file}")
+
+                manifest.record(rel, src_stat, job.digest, job.dst_stat)
+                if job.signatures is not None:
+                    manifest.record_signatures(rel, job.dst_stat, options.block_size, job.signatures)
 
             except Exception as e:
+                stats.errors += 1
                 print(f"[ERROR] {src_file}: {e}")
 
+    with ThreadPoolExecutor(max_workers=options.copy_workers) as copy_pool, \
+            ThreadPoolExecutor(max_workers=options.hash_workers) as hash_pool:
+
+        for rel_dir, files in entries:
+
+            target_dir = os.path.join(destination, rel_dir)
+            # created when a file has to be copied into it, not checked on every run
+            dir_ready = False
+
+            if not files:
+                os.makedirs(target_dir, exist_ok=True)
+
+            for file, src_stat in files:
+
+                rel = rel_dir + file
+                src_file = os.path.join(source, rel_dir, file)
+                dst_file = os.path.join(target_dir, file)
+                entry = manifest.get(rel)
+                stats.files += 1
+                stats.bytes += src_stat.st_size
+
+                if dst_stats is not None:
+                    dst_stat = dst_stats.get(rel)
+                else:
+                    try:
+                        dst_stat = os.stat(dst_file)
+                    except FileNotFoundError:
+                        dst_stat = None
+
+                if dst_stat is None and not dir_ready:
+                    os.makedirs(target_dir, exist_ok=True)
+                    dir_ready = True
+
+                action = classify(src_stat, dst_stat, entry, options.checksum)
+
+                if action == SKIP:
+                    job = Outcome(SKIP, entry[3], dst_stat)
+                elif dst_stat is not None and options.delta_threshold is not None \
+                        and src_stat.st_size >= options.delta_threshold:
+                    # stored signatures save reading the destination; --checksum distrusts them
+                    old_sigs = None if options.checksum else manifest.signatures(rel, dst_stat, options.block_size)
+                    job = copy_pool.submit(delta_task, src_file, dst_file, old_sigs, options.block_size)
+                elif action == COPY:
+                    job = copy_pool.submit(copy_task, src_file, dst_file)
+                else:
+                    stats.hashed += 1
+                    job = hash_pool.submit(hash_task, src_file, dst_file, src_stat, dst_stat,
+                                           entry, options.checksum, copy_pool)
+
+                pending.append((rel, src_file, dst_file, src_stat, job))
+                report(window)
+
+        report(0)
+
+
+def full_sync(source, destination, manifest, options):
+
+    # one complete pass over the source tree; returns its SyncStats
+    stats = SyncStats()
+    # files synced by earlier partial passes (--watch) must be seen again to be kept
+    manifest.seen = set()
+
+    def scan_error(path, e):
+        stats.errors += 1
+        print(f"[ERROR] {path}: {e}")
+
+    try:
+        sync_entries(scan_tree(source, options.scan_workers, scan_error), source, destination,
+                     manifest, stats, options)
+    finally:
+        manifest.flush(full_scan=True)
+
+    return stats
+
+
+def sync_folders(source, destination, checksum=False, manifest_path=MANIFEST_FILE, verbose=False,
+                 scan_workers=SCAN_WORKERS, hash_workers=HASH_WORKERS, copy_workers=COPY_WORKERS,
+                 delta_threshold=DELTA_THRESHOLD, block_size=DELTA_BLOCK_SIZE):
+
+    """
+    Sync every new or changed file of source to destination; returns the SyncStats.
+    """
+
+    source = os.fspath(source)
+    destination = os.fspath(destination)
+    os.makedirs(destination, exist_ok=True)
+
+    options = SyncOptions(checksum, verbose, scan_workers, hash_workers, copy_workers, delta_threshold, block_size)
+    manifest = Manifest(manifest_path or os.path.join(destination, MANIFEST_NAME), source)
+
+    try:
+        return full_sync(source, destination, manifest, options)
+    finally:
+        manifest.close()
+
+
+# ==========================================
+# MIRROR
+# ==========================================
+
+CREATE, UPDATE = "create", "update"
+
+
+def batches(items, size=MIRROR_BATCH):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class MirrorPlan:
+    """
+    Everything a --mirror run will do, worked out before anything is
+    touched: folders to create, destination files to rename (moved at the
+    source), source files to create or update, and destination files and
+    folders to delete.
+    """
+
+    def __init__(self):
+        self.mkdirs = []
+        self.renames = []       # (old rel, new rel, source stat, hash, destination stat)
+        self.changes = []       # (CREATE or UPDATE, rel, size)
+        self.deletes = []
+        self.rmdirs = []
+        # destination files where the source now has a folder, and folders ("x/")
+        # where it has a file: cleared before anything is created in their place
+        self.replaced = []
+        # the whole source tree, for sync_entries(), and what is at the destination
+        self.entries = []
+        self.dst_stats = {}
+
+    def transfer_bytes(self):
+        # an upper bound: updates may turn out unchanged once hashed, or need only a delta
+        return sum(size for _, _, size in self.changes)
+
+    def summary(self):
+        creates = sum(1 for action, _, _ in self.changes if action == CREATE)
+        return (f"{len(self.mkdirs)} folders and {creates} files to create, "
+                f"{len(self.changes) - creates} to update, {len(self.renames)} to rename, "
+                f"{len(self.deletes)} files and {len(self.rmdirs)} folders to delete; "
+                f"up to {self.transfer_bytes() / 1e6:.1f} MB to transfer")
+
+    def show(self):
+        for rel in self.mkdirs:
+            print(f"[MKDIR] {rel}")
+        for old, new, *_ in self.renames:
+            print(f"[RENAME] {old} -> {new}")
+        for action, rel, size in self.changes:
+            print(f"[{action.upper()}] {rel} ({size} bytes)")
+        for rel in self.deletes:
+            print(f"[DELETE] {rel}")
+        for rel in self.rmdirs:
+            print(f"[RMDIR] {rel}")
+        print(f"\nPlan: {self.summary()}")
+
+
+def scan_destination(destination, manifest_path, workers=SCAN_WORKERS, onerror=None):
+    """
+    ({rel: stat} of the files at the destination, set of its relative dirs),
+    leaving out sync_data's own files: the manifest and delta journals.
+    """
+    files = {}
+    dirs = set()
+    if not os.path.isdir(destination):
+        return files, dirs
+
+    manifest_rel = os.path.relpath(os.path.abspath(manifest_path), os.path.abspath(destination)).replace(os.sep, "/")
+    own = {manifest_rel + suffix for suffix in ("", "-wal", "-shm", "-journal")}
+
+    for rel_dir, entries in scan_tree(destination, workers, onerror):
+        dirs.add(rel_dir)
+        for name, st in entries:
+            rel = rel_dir + name
+            if rel not in own and not (name.startswith(".") and name.endswith(".syncdelta")):
+                files[rel] = st
+
+    return files, dirs
+
+
+def plan_mirror(source, destination, manifest, options, manifest_path, onerror=None):
+
+    """
+    Compare the source tree with the destination tree and the manifest.
+    A destination file that is gone from the source is renamed into place
+    instead of a new file being copied when it holds that file's contents:
+    the manifest records the same inode and stat data for it (the file was
+    moved at the source) and its destination is unchanged since, or failing
+    that both have the same size and SHA-256 (taken from the manifest where
+    it can vouch for it).
+    """
+
+    plan = MirrorPlan()
+    dst_files, dst_dirs = scan_destination(destination, manifest_path, options.scan_workers, onerror)
+    entries = manifest.entries
+    src_dirs = set()
+    new = []
+
+    for rel_dir, files in scan_tree(source, options.scan_workers, onerror):
+        src_dirs.add(rel_dir)
+        if files:
+            plan.entries.append((rel_dir, files))
+        for name, src_stat in files:
+            rel = rel_dir + name
+            dst_stat = plan.dst_stats[rel] = dst_files.get(rel)
+            if dst_stat is None:
+                new.append((rel, src_stat))
+            elif classify(src_stat, dst_stat, entries.get(rel), options.checksum) != SKIP:
+                plan.changes.append((UPDATE, rel, src_stat.st_size))
+
+    gone = sorted(rel for rel in dst_files if rel not in plan.dst_stats)
+    plan.replaced = sorted([rel for rel in gone if rel + "/" in src_dirs] +
+                           [rel_dir for rel_dir in dst_dirs - src_dirs if rel_dir[:-1] in plan.dst_stats])
+    by_inode = {}
+    by_size = {}
+    known = {}
+    for rel in gone:
+        if rel + "/" in src_dirs:
+            # in the way of a folder: deleted before folders are made, so never renamed
+            continue
+        by_size.setdefault(dst_files[rel].st_size, []).append(rel)
+        entry = entries.get(rel)
+        if entry is not None and stat_matches(dst_files[rel], *entry[4:6]):
+            by_inode.setdefault(entry[2], []).append(rel)
+            if entry[3]:
+                known[rel] = entry[3]
+
+    def dst_hash(rel):
+        if rel not in known:
+            known[rel] = file_hash(os.path.join(destination, rel))
+        return known[rel]
+
+    moved = set()
+    for rel, src_stat in new:
+        old = digest = None
+        if src_stat.st_ino:
+            old = next((o for o in by_inode.get(src_stat.st_ino, ())
+                        if o not in moved and stat_matches(src_stat, *entries[o][0:3])), None)
+            digest = old and entries[old][3]
+        if old is None and any(o not in moved for o in by_size.get(src_stat.st_size, ())):
+            # reading both copies is still cheaper than writing one
+            digest = file_hash(os.path.join(source, rel))
+            old = next((o for o in by_size[src_stat.st_size] if o not in moved and dst_hash(o) == digest), None)
+        if old is None:
+            plan.changes.append((CREATE, rel, src_stat.st_size))
+        else:
+            moved.add(old)
+            plan.renames.append((old, rel, src_stat, digest, dst_files[old]))
+
+    plan.deletes = [rel for rel in gone if rel not in moved]
+    plan.mkdirs = sorted(src_dirs - dst_dirs - {""})
+    # deepest first, so each folder is empty by the time it is removed
+    plan.rmdirs = sorted(dst_dirs - src_dirs, reverse=True)
+
+    return plan
+
+
+def run_mirror(plan, source, destination, manifest, stats, options):
+
+    """
+    Carry out a MirrorPlan: folders, renames, copies, then deletions, so a
+    run that stops half way has lost nothing. Each batch of MIRROR_BATCH
+    operations is committed to the manifest as it completes. Only what is in
+    the way of a folder or file of another type is deleted up front.
+    """
+
+    def failed(path, e):
+        stats.errors += 1
+        print(f"[ERROR] {path}: {e}")
+
+    def delete_files(rels):
+        for batch in batches(rels):
+            for rel in batch:
+                path = os.path.join(destination, rel)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    failed(path, e)
+                    continue
+                manifest.forget(rel)
+                stats.deleted += 1
+                print(f"[DELETED] {path}")
+            manifest.flush()
+
+    def remove_dirs(rels):
+        for rel in rels:
+            path = os.path.join(destination, rel)
+            try:
+                os.rmdir(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                failed(path, e)
+
+    # a type change: the files in the way, and what is left in the folders in the way
+    replaced_dirs = tuple(rel for rel in plan.replaced if rel.endswith("/"))
+    in_the_way = set(plan.replaced).union(rel for rel in plan.deletes if rel.startswith(replaced_dirs))
+    delete_files([rel for rel in plan.deletes if rel in in_the_way])
+
+    for rel in plan.mkdirs:
+        path = os.path.join(destination, rel)
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            failed(path, e)
+
+    for batch in batches(plan.renames):
+        for old, new, src_stat, digest, dst_stat in batch:
+            old_file = os.path.join(destination, old)
+            new_file = os.path.join(destination, new)
+            try:
+                os.replace(old_file, new_file)
+                if dst_stat.st_mtime_ns != src_stat.st_mtime_ns:
+                    shutil.copystat(os.path.join(source, new), new_file)
+                moved_stat = plan.dst_stats[new] = os.stat(new_file)
+            except OSError as e:
+                failed(old_file, e)
+                continue
+            manifest.move(old, new, src_stat, digest, moved_stat)
+            stats.renamed += 1
+            print(f"[RENAMED] {old_file} -> {new_file}")
+        manifest.flush()
+
+    # empty by now: what was left in them is deleted, what moved is renamed out
+    remove_dirs([rel for rel in plan.rmdirs if rel.startswith(replaced_dirs)])
+
+    batch = []
+    count = 0
+    for i, (rel_dir, files) in enumerate(plan.entries):
+        batch.append((rel_dir, files))
+        count += len(files)
+        if count >= MIRROR_BATCH or i == len(plan.entries) - 1:
+            sync_entries(batch, source, destination, manifest, stats, options, plan.dst_stats)
+            manifest.flush()
+            batch = []
+            count = 0
+
+    delete_files([rel for rel in plan.deletes if rel not in in_the_way])
+    remove_dirs([rel for rel in plan.rmdirs if not rel.startswith(replaced_dirs)])
+
+
+def mirror_folders(source, destination, manifest_path=MANIFEST_FILE, options=SyncOptions(), dry_run=False):
+
+    """
+    Make destination an exact copy of source: like sync_folders(), but files
+    and folders gone from the source are deleted at the destination, and
+    moved files are renamed rather than copied again. Returns (MirrorPlan,
+    SyncStats); with dry_run the plan is only printed.
+    """
+
+    source = os.fspath(source)
+    destination = os.fspath(destination)
+    manifest_path = manifest_path or os.path.join(destination, MANIFEST_NAME)
+    if not dry_run:
+        os.makedirs(destination, exist_ok=True)
+        manifest = Manifest(manifest_path, source)
+    elif os.path.exists(manifest_path):
+        # a dry run changes nothing, the manifest included
+        manifest = Manifest(manifest_path, source, read_only=True)
+    else:
+        manifest = Manifest(":memory:", source)
+
+    stats = SyncStats()
+
+    def scan_error(path, e):
+        stats.errors += 1
+        print(f"[ERROR] {path}: {e}")
+
+    try:
+        plan = plan_mirror(source, destination, manifest, options, manifest_path, scan_error)
+
+        if stats.errors:
+            # an unreadable folder would look like deleted files
+            print("[ERROR] Scan incomplete; nothing renamed or deleted.")
+            plan.renames = plan.deletes = plan.rmdirs = []
+
+        if dry_run:
+            plan.show()
+            return plan, stats
+
+        run_mirror(plan, source, destination, manifest, stats, options)
+        manifest.flush(full_scan=stats.errors == 0)
+    finally:
+        manifest.close()
+
+    return plan, stats
+
+
+# ==========================================
+# WATCH MODE
+# ==========================================
+
+class DirtySet:
+    """
+    Source paths (relative, "/"-separated) reported changed, with when each
+    was first and last reported. A path is ready once it has been quiet for
+    `settle` seconds, so a burst of writes to one file is synced once, or
+    once it has been dirty for `max_delay` seconds, so a file that never
+    stops changing is still synced now and then. A path ending in "/" is a
+    directory to rescan as a whole.
+    """
+
+    def __init__(self, settle=WATCH_SETTLE, max_delay=WATCH_MAX_DELAY):
+        self.settle = settle
+        self.max_delay = max_delay
+        self.paths = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, rel, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            first, _ = self.paths.get(rel, (now, now))
+            self.paths[rel] = (first, now)
+
+    def pop_ready(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            ready = [rel for rel, (first, last) in self.paths.items()
+                     if now - last >= self.settle or now - first >= self.max_delay]
+            for rel in ready:
+                del self.paths[rel]
+        return sorted(ready)
+
+
+class SourceWatcher:
+    """Feeds watchdog (inotify/FSEvents/ReadDirectoryChangesW) events under source into a DirtySet."""
+
+    def __init__(self, source, dirty, ignore=()):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        source = os.path.abspath(source)
+        ignore = [os.path.abspath(p) for p in ignore]
+
+        def relative(path):
+            path = os.path.abspath(os.fsdecode(path))
+            if any(path == i or path.startswith(i + os.sep) for i in ignore):
+                return None
+            rel = os.path.relpath(path, source)
+            if rel == os.curdir or rel.startswith(os.pardir):
+                return None
+            return rel.replace(os.sep, "/")
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed_no_write", "deleted"):
+                    return
+                dest = getattr(event, "dest_path", None)
+                if event.is_directory:
+                    # a directory created or moved in brings files nobody sent events for
+                    path = (dest or event.src_path) if event.event_type in ("created", "moved") else None
+                    rel = path and relative(path)
+                    if rel:
+                        dirty.add(rel + "/")
+                    return
+                for path in (event.src_path, dest):
+                    rel = path and relative(path)
+                    if rel:
+                        dirty.add(rel)
+
+        self.observer = Observer()
+        self.observer.schedule(Handler(), source, recursive=True)
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+def dirty_entries(source, rels, workers=SCAN_WORKERS, onerror=None):
+    """
+    (relative dir, [(name, stat)]) for the dirty paths `rels`, in the shape
+    scan_tree() yields. Directories are scanned whole; paths that are gone
+    (deleted, or moved away) are dropped.
+    """
+    groups = {}
+
+    for rel in rels:
+        path = os.path.join(source, rel)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            if onerror:
+                onerror(path, e)
+            continue
+
+        if stat.S_ISDIR(st.st_mode):
+            prefix = rel.rstrip("/") + "/"
+            for sub, files in scan_tree(path, workers, onerror):
+                groups.setdefault(prefix + sub, {}).update(files)
+        elif not rel.endswith("/"):
+            rel_dir, _, name = rel.rpartition("/")
+            groups.setdefault(rel_dir + "/" if rel_dir else "", {})[name] = st
+
+    for rel_dir in sorted(groups):
+        yield rel_dir, sorted(groups[rel_dir].items())
+
+
+def sync_dirty(source, destination, manifest, rels, options):
+
+    # a partial pass over the dirty paths only; returns its SyncStats
+    stats = SyncStats()
+
+    def scan_error(path, e):
+        stats.errors += 1
+        print(f"[ERROR] {path}: {e}")
+
+    try:
+        sync_entries(dirty_entries(source, rels, options.scan_workers, scan_error), source, destination,
+                     manifest, stats, options)
+    finally:
+        manifest.flush()
+
+    return stats
+
+
+def watch_folders(source, destination, manifest_path=MANIFEST_FILE, options=SyncOptions(),
+                  settle=WATCH_SETTLE, max_delay=WATCH_MAX_DELAY, audit_interval=AUDIT_INTERVAL, stop=None):
+
+    """
+    Sync source to destination, then keep it in sync until `stop` (a
+    threading.Event) is set: changed files are synced as filesystem events
+    report them, and a full scan every audit_interval seconds, on one thread
+    per stage so it stays in the background, catches missed events. Without
+    watchdog installed only the audits run. The manifest stays open (and in
+    memory) throughout.
+    """
+
+    source = os.fspath(source)
+    destination = os.fspath(destination)
+    os.makedirs(destination, exist_ok=True)
+
+    manifest_path = manifest_path or os.path.join(destination, MANIFEST_NAME)
+    manifest = Manifest(manifest_path, source)
+    audit_options = options._replace(scan_workers=1, hash_workers=1, copy_workers=1)
+    dirty = DirtySet(settle, max_delay)
+    stop = stop or threading.Event()
+
+    try:
+        # started first, so changes made during the initial sync are not lost
+        ignore = [destination] + [manifest_path + suffix for suffix in ("", "-wal", "-shm", "-journal")]
+        watcher = SourceWatcher(source, dirty, ignore)
+    except ImportError:
+        watcher = None
+        print(f"watchdog is not installed; rescanning every {audit_interval:g}s instead.")
+
+    try:
+        stats = full_sync(source, destination, manifest, options)
+        print(f"[INITIAL] {stats.summary()}")
+        next_audit = time.monotonic() + audit_interval
+
+        while not stop.wait(min(settle, 1.0) / 2):
+            ready = dirty.pop_ready()
+            if ready:
+                stats = sync_dirty(source, destination, manifest, ready, options)
+                if stats.copied or stats.errors:
+                    print(f"[WATCH] {stats.summary()}")
+
+            if time.monotonic() >= next_audit:
+                stats = full_sync(source, destination, manifest, audit_options)
+                print(f"[AUDIT] {stats.summary()}")
+                next_audit = time.monotonic() + audit_interval
+
+    finally:
+        if watcher:
+            watcher.stop()
+        manifest.close()
+
 
 # ==========================================
 # RUN
 # ==========================================
 
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Mirror new and changed save files to a backup folder.")
+
+    parser.add_argument("--source", default=SOURCE_FOLDER, help="Folder to sync from")
+    parser.add_argument("--dest", default=DESTINATION_FOLDER, help="Folder to sync to")
+    parser.add_argument("--checksum", action="store_true",
+                        help="Ignore the manifest and compare file contents (full, slow rescan)")
+    parser.add_argument("--manifest", default=MANIFEST_FILE,
+                        help=f"Manifest database (default: <dest>/{MANIFEST_NAME})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Also list skipped files")
+    parser.add_argument("--scan-jobs", type=int, default=SCAN_WORKERS, help="Directory listing threads")
+    parser.add_argument("--hash-jobs", type=int, default=HASH_WORKERS, help="Hashing threads")
+    parser.add_argument("--copy-jobs", type=int, default=COPY_WORKERS, help="Copying threads")
+    parser.add_argument("--delta-threshold", type=int, default=DELTA_THRESHOLD // (1024 * 1024), metavar="MB",
+                        help="Patch changed blocks of existing files at least this big (MB)")
+    parser.add_argument("--no-delta", action="store_true", help="Always copy changed files whole")
+    parser.add_argument("--mirror", action="store_true",
+                        help="Also delete files gone from the source, and rename moved files instead of recopying")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="--mirror: print the plan and the bytes to transfer, change nothing")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running: sync changed files as they are written (needs watchdog)")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE, metavar="SECONDS",
+                        help="--watch: sync a changed file once it has been quiet this long")
+    parser.add_argument("--audit-interval", type=float, default=AUDIT_INTERVAL / 60, metavar="MINUTES",
+                        help="--watch: full rescan interval, to catch missed events")
+
+    args = parser.parse_args()
+
+    if args.dry_run and not args.mirror:
+        parser.error("--dry-run needs --mirror")
+    if args.watch and args.mirror:
+        parser.error("--watch cannot be combined with --mirror")
+
+    return args
+
 if __name__ == "__main__":
 
+    args = parse_args()
+
     print("Starting save data sync...\n")
 
-    sync_folders(SOURCE_FOLDER, DESTINATION_FOLDER)
+    options = SyncOptions(args.checksum, args.verbose, args.scan_jobs, args.hash_jobs, args.copy_jobs,
+                          None if args.no_delta else args.delta_threshold * 1024 * 1024)
+
+    if args.mirror:
+        plan, stats = mirror_folders(args.source, args.dest, args.manifest, options, args.dry_run)
+        if not args.dry_run:
+            print(f"\nMirror complete: {stats.summary()}")
+        sys.exit(1 if stats.errors else 0)
+
+    if args.watch:
+        try:
+            watch_folders(args.source, args.dest, args.manifest, options, args.settle,
+                          max(WATCH_MAX_DELAY, args.settle), args.audit_interval * 60)
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+        sys.exit(0)
+
+    stats = sync_folders(args.source, args.dest, args.checksum, args.manifest, args.verbose,
+                         args.scan_jobs, args.hash_jobs, args.copy_jobs,
+                         None if args.no_delta else args.delta_threshold * 1024 * 1024)
+
+    print(f"\nSync complete: {stats.summary()}")
 
-    print("\nSync complete.")
+    sys.exit(1 if stats.errors else 0)
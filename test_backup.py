@@ -0,0 +1,365 @@
+import io
+import os
+import threading
+import zipfile
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.fernet import Fernet
+
+import decrypt_backup
+import encrypted_backup
+
+import chunk_store
+
+import backup_crypto
+
+from backup_crypto import HEADER, BackupFormatError, KdfParams, decrypt_file, encrypt_stream
+from encrypted_backup import create_encrypted_backup, encrypt_file, generate_key
+
+# cheap scrypt parameters keep the suite fast
+FAST_KDF = KdfParams(log_n=10, r=8, p=1)
+KEY = generate_key("correct horse", FAST_KDF)
+
+def write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("size", [0, 1, 1024 * 1024, 3 * 1024 * 1024 + 17])
+def test_stream_roundtrip(tmp_path, size):
+    data = os.urandom(size)
+    write_bytes(tmp_path / "backup.zip", data)
+
+    encrypted = encrypt_file(str(tmp_path / "backup.zip"), KEY)
+    decrypt_file(encrypted, str(tmp_path / "restored.zip"), KEY)
+
+    assert read_bytes(tmp_path / "restored.zip") == data
+    assert not os.path.exists(tmp_path / "backup.zip")
+
+def test_legacy_fernet_backup_still_decrypts(tmp_path):
+    write_bytes(tmp_path / "old.enc", Fernet(KEY.legacy_key()).encrypt(b"old save data"))
+
+    decrypt_file(str(tmp_path / "old.enc"), str(tmp_path / "restored.zip"), KEY)
+
+    assert read_bytes(tmp_path / "restored.zip") == b"old save data"
+
+def test_truncated_backup_is_rejected(tmp_path):
+    with open(tmp_path / "backup.enc", "wb") as dst, open(__file__, "rb") as src:
+        encrypt_stream(src, dst, KEY, frame_size=256)
+    data = read_bytes(tmp_path / "backup.enc")
+    # drop the final frame entirely
+    write_bytes(tmp_path / "cut.enc", data[:HEADER.size + 3 * (4 + 256 + 16)])
+
+    with pytest.raises(BackupFormatError):
+        decrypt_file(str(tmp_path / "cut.enc"), str(tmp_path / "restored.zip"), KEY)
+    assert not os.path.exists(tmp_path / "restored.zip")
+
+def test_wrong_key_is_rejected(tmp_path):
+    write_bytes(tmp_path / "backup.zip", b"secret")
+    encrypted = encrypt_file(str(tmp_path / "backup.zip"), KEY)
+
+    with pytest.raises(BackupFormatError):
+        decrypt_file(encrypted, str(tmp_path / "restored.zip"), generate_key("wrong", FAST_KDF))
+
+def test_version_1_backup_still_decrypts(tmp_path):
+    salt = os.urandom(16)
+    header = backup_crypto.HEADER_V1.pack(b"GSBK", 1, 0, 1024, salt)
+    cipher = backup_crypto._frame_cipher(KEY.legacy_master(), salt)
+    ct = cipher.encrypt(backup_crypto._nonce(0, True), b"v1 save data", header)
+    write_bytes(tmp_path / "v1.enc", header + backup_crypto.LENGTH.pack(len(ct) | backup_crypto.LAST_FRAME) + ct)
+
+    decrypt_file(str(tmp_path / "v1.enc"), str(tmp_path / "restored.zip"), generate_key("correct horse", FAST_KDF))
+
+    assert read_bytes(tmp_path / "restored.zip") == b"v1 save data"
+
+def test_kdf_parameters_come_from_the_header(tmp_path):
+    write_bytes(tmp_path / "backup.zip", b"data")
+    encrypted = encrypt_file(str(tmp_path / "backup.zip"), generate_key("pw", KdfParams(11, 4, 2)))
+
+    with open(encrypted, "rb") as f:
+        _, kdf_salt, params = backup_crypto.read_header(f)
+
+    assert params == (11, 4, 2) and len(kdf_salt) == 16
+    # a session created with other defaults still reads it
+    decrypt_file(encrypted, str(tmp_path / "restored.zip"), generate_key("pw", FAST_KDF))
+    assert read_bytes(tmp_path / "restored.zip") == b"data"
+
+@pytest.mark.parametrize("log_n,r", [(24, 8), (22, 32), (21, 32)])
+def test_costly_kdf_parameters_are_rejected_before_deriving(tmp_path, monkeypatch, log_n, r):
+    write_bytes(tmp_path / "backup.zip", b"data")
+    encrypted = encrypt_file(str(tmp_path / "backup.zip"), generate_key("pw", FAST_KDF))
+    data = read_bytes(encrypted)
+    fields = list(HEADER.unpack(data[:HEADER.size]))
+    fields[6:8] = [log_n, r]
+    write_bytes(encrypted, HEADER.pack(*fields) + data[HEADER.size:])
+
+    calls = []
+    monkeypatch.setattr(backup_crypto, "scrypt", lambda *a: calls.append(a))
+    with pytest.raises(BackupFormatError, match="out of range"):
+        decrypt_file(encrypted, str(tmp_path / "restored.zip"), generate_key("pw", FAST_KDF))
+    assert calls == []
+
+def test_kdf_runs_once_per_salt(tmp_path, monkeypatch):
+    calls = []
+    real_scrypt = backup_crypto.scrypt
+    monkeypatch.setattr(backup_crypto, "scrypt", lambda *a: calls.append(a) or real_scrypt(*a))
+    writer = generate_key("pw", FAST_KDF)
+    for i in range(5):
+        write_bytes(tmp_path / f"{i}.zip", b"x")
+        encrypt_file(str(tmp_path / f"{i}.zip"), writer)
+    assert len(calls) == 1
+
+    reader = generate_key("pw", FAST_KDF)
+    for i in range(5):
+        decrypt_file(str(tmp_path / f"{i}.zip.enc"), str(tmp_path / "out"), reader)
+    assert len(calls) == 2
+
+def make_save_folder(root):
+    files = {
+        "slot1/save.dat": os.urandom(300 * 1024),
+        "slot2/save.dat": b"level=3\n" * 1000,
+        "settings.ini": b"[video]\nvsync=1\n",
+    }
+    for rel, data in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, rel)) or root, exist_ok=True)
+        write_bytes(os.path.join(root, rel), data)
+    return files
+
+def test_single_pass_backup_leaves_no_plaintext(tmp_path):
+    files = make_save_folder(tmp_path / "saves")
+    os.makedirs(tmp_path / "out")
+
+    encrypted = create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "out" / "b.zip.enc"), KEY)
+
+    assert os.listdir(tmp_path / "out") == ["b.zip.enc"]
+    decrypt_file(encrypted, str(tmp_path / "restored.zip"), KEY)
+    with zipfile.ZipFile(tmp_path / "restored.zip") as z:
+        assert {n: z.read(n) for n in z.namelist()} == files
+
+@pytest.mark.parametrize("codec", ["deflate", "bzip2", "store"])
+def test_parallel_compression_roundtrip(tmp_path, monkeypatch, codec):
+    monkeypatch.setattr(encrypted_backup, "BLOCK_SIZE", 64 * 1024)
+    files = make_save_folder(tmp_path / "saves")
+    files["shot.png"] = os.urandom(1000)
+    write_bytes(tmp_path / "saves" / "shot.png", files["shot.png"])
+
+    encrypted_backup.create_zip_parallel(str(tmp_path / "saves"), str(tmp_path / "b.zip"), codec, 1, 4)
+
+    with zipfile.ZipFile(tmp_path / "b.zip") as z:
+        assert z.testzip() is None
+        assert {n: z.read(n) for n in z.namelist()} == files
+        assert z.getinfo("shot.png").compress_type == zipfile.ZIP_STORED
+
+def read_tree(root):
+    out = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            full = os.path.join(dirpath, name)
+            out[os.path.relpath(full, root).replace(os.sep, "/")] = read_bytes(full)
+    return out
+
+def test_chunking_survives_an_insertion(monkeypatch):
+    monkeypatch.setattr(chunk_store, "MIN_CHUNK", 2048)
+    monkeypatch.setattr(chunk_store, "MAX_CHUNK", 64 * 1024)
+    monkeypatch.setattr(chunk_store, "CUT_MASK", (1 << 12) - 1)
+    data = os.urandom(512 * 1024)
+
+    before = [bytes(c) for c in chunk_store.iter_chunks(io.BytesIO(data))]
+    after = [bytes(c) for c in chunk_store.iter_chunks(io.BytesIO(data[:1000] + b"xyz" + data[1000:]))]
+
+    assert b"".join(before) == data
+    assert len(set(before) & set(after)) >= len(before) - 2
+
+@pytest.mark.parametrize("scan_block", [1000, 16 * 1024])
+def test_chunk_cuts_match_the_byte_by_byte_gear_hash(monkeypatch, scan_block):
+    monkeypatch.setattr(chunk_store, "MIN_CHUNK", 2048)
+    monkeypatch.setattr(chunk_store, "MAX_CHUNK", 64 * 1024)
+    monkeypatch.setattr(chunk_store, "CUT_MASK", (1 << 12) - 1)
+    monkeypatch.setattr(chunk_store, "SCAN_BLOCK", scan_block)
+    data = os.urandom(1024 * 1024)
+
+    def find_cut(buf):
+        h = 0
+        for i in range(len(buf)):
+            h = ((h << 1) + chunk_store.GEAR[buf[i]]) & ((1 << 64) - 1)
+            if i >= chunk_store.MIN_CHUNK and not h & chunk_store.CUT_MASK:
+                return i + 1
+        return len(buf)
+
+    expected = []
+    while len(expected) < 100 and sum(expected) < len(data):
+        expected.append(find_cut(data[sum(expected):sum(expected) + chunk_store.MAX_CHUNK]))
+
+    chunks = [len(c) for c in chunk_store.iter_chunks(io.BytesIO(data))]
+    assert chunks[:len(expected)] == expected
+
+def test_incremental_backup_restore_and_prune(tmp_path):
+    files = make_save_folder(tmp_path / "saves")
+    store = str(tmp_path / "store")
+
+    first, stats = chunk_store.backup_incremental(str(tmp_path / "saves"), store, KEY)
+    assert stats["unchanged"] == 0 and stats["new_chunks"] > 0
+
+    write_bytes(tmp_path / "saves" / "settings.ini", b"[video]\nvsync=0\n")
+    os.remove(tmp_path / "saves" / "slot2" / "save.dat")
+    second, stats = chunk_store.backup_incremental(str(tmp_path / "saves"), store, KEY)
+    assert stats["unchanged"] == 1
+    assert stats["read_bytes"] == len(b"[video]\nvsync=0\n")
+
+    chunk_store.restore_snapshot(store, KEY, first, str(tmp_path / "first"))
+    assert read_tree(tmp_path / "first") == files
+
+    removed, chunks, _ = chunk_store.prune(store, KEY, keep_last=1)
+    assert removed == [first] and chunks == 2
+
+    chunk_store.restore_snapshot(store, KEY, "latest", str(tmp_path / "latest"))
+    assert read_tree(tmp_path / "latest") == {
+        "slot1/save.dat": files["slot1/save.dat"],
+        "settings.ini": b"[video]\nvsync=0\n",
+    }
+
+def test_chunk_store_rejects_wrong_password(tmp_path):
+    chunk_store.ChunkStore(str(tmp_path / "store"), generate_key("correct horse", FAST_KDF))
+
+    with pytest.raises(BackupFormatError):
+        chunk_store.ChunkStore(str(tmp_path / "store"), generate_key("wrong", FAST_KDF))
+
+def test_extract_decrypts_only_the_frames_it_needs(tmp_path, monkeypatch):
+    files = make_save_folder(tmp_path / "saves")
+    files["big/world.dat"] = os.urandom(5 * 1024 * 1024)
+    os.makedirs(tmp_path / "saves" / "big")
+    write_bytes(tmp_path / "saves" / "big" / "world.dat", files["big/world.dat"])
+    encrypted = create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "b.zip.enc"), KEY, "deflate", 1, 1)
+
+    decrypted = []
+    real_frame = backup_crypto.BackupReader.frame
+    monkeypatch.setattr(backup_crypto.BackupReader, "frame", lambda self, i: decrypted.append(i) or real_frame(self, i))
+
+    listing = decrypt_backup.list_backup(encrypted, KEY)
+    assert {e["path"]: e["size"] for e in listing} == {p: len(d) for p, d in files.items()}
+    assert len(set(decrypted)) == 1     # the last frame, to learn the plaintext size
+
+    decrypted.clear()
+    decrypt_backup.extract_files(encrypted, KEY, ["settings.ini"], str(tmp_path / "out"))
+    assert read_bytes(tmp_path / "out" / "settings.ini") == files["settings.ini"]
+    assert len(set(decrypted)) <= 2
+
+    decrypt_backup.extract_files(encrypted, KEY, ["big/world.dat", "slot2/save.dat"], str(tmp_path / "out"))
+    assert read_tree(tmp_path / "out") == {p: files[p] for p in ("settings.ini", "big/world.dat", "slot2/save.dat")}
+
+def test_extract_from_a_backup_without_index(tmp_path):
+    files = make_save_folder(tmp_path / "saves")
+    encrypted_backup.create_zip(str(tmp_path / "saves"), str(tmp_path / "b.zip"))
+    encrypted = encrypt_file(str(tmp_path / "b.zip"), KEY)
+
+    assert sorted(e["path"] for e in decrypt_backup.list_backup(encrypted, KEY)) == sorted(files)
+    decrypt_backup.extract_files(encrypted, KEY, ["slot1/save.dat"], str(tmp_path / "out"))
+    assert read_tree(tmp_path / "out") == {"slot1/save.dat": files["slot1/save.dat"]}
+
+def test_tampered_index_is_rejected(tmp_path):
+    make_save_folder(tmp_path / "saves")
+    encrypted = create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "b.zip.enc"), KEY)
+    data = bytearray(read_bytes(encrypted))
+    data[-backup_crypto.TRAILER.size - 5] ^= 1
+    write_bytes(encrypted, bytes(data))
+
+    with pytest.raises(BackupFormatError):
+        decrypt_backup.list_backup(encrypted, KEY)
+    # the frames themselves are intact, so a full restore still works
+    decrypt_file(encrypted, str(tmp_path / "restored.zip"), KEY)
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_backup_reports_progress(tmp_path, workers):
+    files = make_save_folder(tmp_path / "saves")
+    seen = []
+
+    create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "b.zip.enc"), KEY,
+                            workers=workers, progress=lambda n, f: seen.append((n, f)))
+
+    assert encrypted_backup.scan_source(str(tmp_path / "saves")) == (len(files), sum(map(len, files.values())))
+    assert sum(n for n, _ in seen) == sum(map(len, files.values()))
+    assert sum(f for _, f in seen) == len(files)
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_cancelled_backup_leaves_nothing_behind(tmp_path, workers):
+    make_save_folder(tmp_path / "saves")
+    os.makedirs(tmp_path / "out")
+    cancel = threading.Event()
+
+    with pytest.raises(encrypted_backup.BackupCancelled):
+        create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "out" / "b.zip.enc"), KEY,
+                                workers=workers, progress=lambda n, f: cancel.set(), cancel=cancel)
+
+    assert os.listdir(tmp_path / "out") == []
+
+@pytest.mark.parametrize("workers,codec", [(1, "deflate"), (4, "deflate"), (4, "bzip2")])
+def test_large_file_reports_progress_and_cancels_per_block(tmp_path, monkeypatch, workers, codec):
+    monkeypatch.setattr(encrypted_backup, "BLOCK_SIZE", 64 * 1024)
+    os.makedirs(tmp_path / "saves")
+    write_bytes(tmp_path / "saves" / "world.dat", os.urandom(2 * 1024 * 1024))
+    seen = []
+
+    create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "b.zip.enc"), KEY, codec=codec,
+                            workers=workers, progress=lambda n, f: seen.append((n, f)))
+
+    # the bytes arrive block by block, before the file is counted as done
+    assert len(seen) == 33 and seen[-1] == (0, 1)
+    assert sum(n for n, _ in seen) == 2 * 1024 * 1024
+
+    cancel = threading.Event()
+    seen = []
+
+    def progress(n, f):
+        seen.append(n)
+        cancel.set()
+    with pytest.raises(encrypted_backup.BackupCancelled):
+        create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "c.zip.enc"), KEY, codec=codec,
+                                workers=workers, progress=progress, cancel=cancel)
+    assert len(seen) == 1 and not os.path.exists(tmp_path / "c.zip.enc")
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_verify_checks_every_frame(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(backup_crypto, "VERIFY_BATCH", 2)
+    with open(tmp_path / "b.enc", "wb") as dst, open(__file__, "rb") as src:
+        encrypt_stream(src, dst, KEY, frame_size=512)
+    good = read_bytes(tmp_path / "b.enc")
+
+    frames, size = backup_crypto.verify_backups([str(tmp_path / "b.enc")], KEY, workers)[str(tmp_path / "b.enc")]
+    assert size == os.path.getsize(__file__) and frames == size // 512 + 1
+
+    # flip one byte in a middle frame
+    bad = bytearray(good)
+    bad[HEADER.size + 3 * (4 + 512 + 16) + 100] ^= 1
+    write_bytes(tmp_path / "b.enc", bytes(bad))
+    with pytest.raises(BackupFormatError, match="Frame 3"):
+        backup_crypto.verify_backups([str(tmp_path / "b.enc")], KEY, workers)
+
+def test_verify_a_chunk_store_and_backup_folder(tmp_path):
+    make_save_folder(tmp_path / "saves")
+    chunk_store.backup_incremental(str(tmp_path / "saves"), str(tmp_path / "store"), KEY)
+    create_encrypted_backup(str(tmp_path / "saves"), str(tmp_path / "b.zip.enc"), KEY)
+    write_bytes(tmp_path / "old.enc", Fernet(KEY.legacy_key()).encrypt(b"old"))
+
+    paths = list(encrypted_backup.backup_files([str(tmp_path / "store"), str(tmp_path / "b.zip.enc"),
+                                                str(tmp_path / "old.enc")]))
+    results = backup_crypto.verify_backups(paths, KEY, 1)
+
+    assert len(results) == len(paths) > 3
+    with pytest.raises(BackupFormatError):
+        backup_crypto.verify_backups(paths, generate_key("wrong", FAST_KDF), 1)
+
+def test_backup_benchmark_runs(tmp_path):
+    import bench_backup
+
+    results = bench_backup.main(["--size", "1", "--files", "5", "--repeat", "1", "-j", "2",
+                                 "--workdir", str(tmp_path), "--json", str(tmp_path / "r.json")])
+
+    (case,) = results.values()
+    assert all(case[stage]["mb_per_s"] > 0 for stage in bench_backup.STAGES)
+    assert os.path.exists(tmp_path / "r.json")
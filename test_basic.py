@@ -1,6 +1,11 @@
 import subprocess
 import os
 import sys
+import shutil
+import json
+import time
+
+import pytest
 
 def test_basic_build():
     # Run the build script
@@ -15,3 +20,276 @@ def test_basic_build():
 
     # Check that build directory was created
     assert os.path.isdir("build"), "No build directory created"
+
+BUILD_LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build_lib.py")
+
+def write_sources(root, count):
+    src = os.path.join(root, "src")
+    os.makedirs(src, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(src, f"f{i}.c"), "w") as f:
+            f.write(f"int f{i}(int x) {{ return x + {i}; }}\n")
+    return src
+
+def run_build(cwd, *extra):
+    return subprocess.run(
+        [sys.executable, BUILD_LIB, "--sources", "src", "--output", "mylib", *extra],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+
+def test_parallel_build(tmp_path):
+    write_sources(tmp_path, 8)
+
+    result = run_build(tmp_path, "--type", "static", "-j", "4")
+
+    assert result.returncode == 0, result.stderr
+    assert os.path.isfile(tmp_path / "build" / "libmylib.a")
+
+def test_parallel_build_reports_failure(tmp_path):
+    src = write_sources(tmp_path, 8)
+    with open(os.path.join(src, "broken.c"), "w") as f:
+        f.write("int broken(\n")
+
+    result = run_build(tmp_path, "-j", "4")
+
+    assert result.returncode != 0
+    assert "broken.c" in result.stderr
+
+def test_task_exception_stops_the_remaining_tasks():
+    import build_lib
+
+    started = []
+
+    def task(i):
+        started.append(i)
+        if i == 0:
+            raise FileNotFoundError("no such compiler")
+        time.sleep(0.05)
+        return subprocess.CompletedProcess([str(i)], 0)
+
+    with pytest.raises(FileNotFoundError):
+        build_lib.run_all([lambda i=i: task(i) for i in range(20)], jobs=2)
+    assert len(started) <= 3
+
+def test_incremental_rebuild(tmp_path):
+    src = write_sources(tmp_path, 4)
+
+    assert run_build(tmp_path, "--incremental").returncode == 0
+    result = run_build(tmp_path, "--incremental", "-v")
+    assert "Up to date" in result.stdout
+    assert "+ " not in result.stdout, "No-op rebuild ran a command"
+
+    with open(os.path.join(src, "f1.c"), "a") as f:
+        f.write("int extra(void) { return 0; }\n")
+    result = run_build(tmp_path, "--incremental", "-v")
+    compiles = [line for line in result.stdout.splitlines() if line.startswith("+ ") and " -c " in line]
+    assert len(compiles) == 1 and "f1.c" in compiles[0]
+
+def test_edit_during_compile_is_rebuilt(tmp_path):
+    src = write_sources(tmp_path, 2)
+    gcc = shutil.which("gcc") or shutil.which("cc")
+    # f0.c is saved again while its compile is still running
+    wrapper = tmp_path / "cc-then-save"
+    with open(wrapper, "w") as f:
+        f.write(f'#!/bin/sh\n"{gcc}" "$@" || exit $?\n'
+                f'case "$*" in "-c src/f0.c "*) echo "/* saved during the compile */" >> "{src}/f0.c";; esac\n')
+    os.chmod(wrapper, 0o755)
+
+    cc = ["--incremental", "--compiler", str(wrapper)]
+    assert run_build(tmp_path, *cc).returncode == 0
+    result = run_build(tmp_path, *cc, "-v")
+
+    assert result.returncode == 0, result.stderr
+    assert "Up to date" not in result.stdout
+    compiles = [line for line in result.stdout.splitlines() if line.startswith("+ ") and " -c " in line]
+    assert len(compiles) == 1 and "f0.c" in compiles[0]
+
+def test_cache_hits_after_clean(tmp_path):
+    write_sources(tmp_path, 4)
+    cache = ["--cache", "--cache-dir", str(tmp_path / "cache"), "--cache-stats"]
+
+    assert run_build(tmp_path, *cache).returncode == 0
+    shutil.rmtree(tmp_path / "build")
+    result = run_build(tmp_path, *cache)
+
+    assert result.returncode == 0, result.stderr
+    assert "this build: 4 hits, 0 misses" in result.stdout
+    assert os.path.isfile(tmp_path / "build" / "libmylib.so")
+
+def test_cache_entry_evicted_during_a_hit_is_a_miss(tmp_path, monkeypatch):
+    import build_lib
+    from pathlib import Path
+
+    src = Path(write_sources(tmp_path, 1)) / "f0.c"
+    obj = tmp_path / "f0.o"
+    compiler = build_lib.detect_compiler()
+    cache = build_lib.ObjectCache(tmp_path / "cache", 1 << 30, compiler)
+    cmd = build_lib.compile_command(compiler, src, obj, [], [])
+    pp_cmd = build_lib.compile_command(compiler, src, obj, [], [], preprocess=True)
+    assert cache.compile(cmd, pp_cmd, obj).returncode == 0
+
+    # another build evicts everything between the lookup and the copy
+    real_link_or_copy = build_lib.link_or_copy
+
+    def evicted_first(src, dst):
+        if Path(src).parent.parent == cache.dir:
+            for f in cache.dir.glob("??/*"):
+                f.unlink()
+        real_link_or_copy(src, dst)
+    monkeypatch.setattr(build_lib, "link_or_copy", evicted_first)
+    os.remove(obj)
+
+    assert cache.compile(cmd, pp_cmd, obj).returncode == 0
+    assert os.path.isfile(obj)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert cache.finish()["misses"] == 2
+
+def test_unity_build(tmp_path):
+    write_sources(tmp_path, 5)
+
+    result = run_build(tmp_path, "--type", "static", "--unity", "2", "--unity-exclude", "f4.c")
+
+    assert result.returncode == 0, result.stderr
+    assert "Unity build: 3 TUs from 5 sources" in result.stdout
+    assert len(os.listdir(tmp_path / "build" / "unity")) == 2
+
+def test_unity_batch_size_must_be_positive(tmp_path):
+    write_sources(tmp_path, 2)
+
+    result = run_build(tmp_path, "--unity", "-1")
+
+    assert result.returncode == 2
+    assert "must be at least 1" in result.stderr
+
+def test_cached_build_is_not_a_compile_time_baseline(tmp_path):
+    write_sources(tmp_path, 3)
+    cache = ["--type", "static", "--cache", "--cache-dir", str(tmp_path / "cache")]
+
+    assert run_build(tmp_path, *cache).returncode == 0
+    with open(tmp_path / "build" / ".build_times.json") as f:
+        compiled = json.load(f)
+    # every object now comes from the cache
+    assert run_build(tmp_path, *cache).returncode == 0
+    with open(tmp_path / "build" / ".build_times.json") as f:
+        assert json.load(f) == compiled
+
+def test_pgo_profile(tmp_path):
+    write_sources(tmp_path, 2)
+    train = (f'"{sys.executable}" -c "import ctypes, os; '
+             "lib = ctypes.CDLL(os.environ['BUILD_LIB_OUTPUT']); [lib.f1(i) for i in range(100)]\"")
+
+    result = run_build(tmp_path, "--profile", "pgo", "--pgo-train", train)
+
+    assert result.returncode == 0, result.stderr
+    assert "PGO stage 3/3" in result.stdout
+    assert any(f.endswith((".gcda", ".profraw")) for f in os.listdir(tmp_path / "build" / "pgo-data"))
+
+def test_same_file_name_in_different_directories(tmp_path):
+    for name in ("net", "fs"):
+        os.makedirs(tmp_path / "src" / name)
+        with open(tmp_path / "src" / name / "util.c", "w") as f:
+            f.write(f"int {name}_util(void) {{ return 1; }}\n")
+
+    result = run_build(tmp_path, "--type", "static")
+
+    assert result.returncode == 0, result.stderr
+    assert os.path.isfile(tmp_path / "build" / "obj" / "src" / "net" / "util.c.o")
+    assert os.path.isfile(tmp_path / "build" / "obj" / "src" / "fs" / "util.c.o")
+
+def test_compile_commands_and_trace(tmp_path):
+    write_sources(tmp_path, 3)
+
+    result = run_build(tmp_path, "-j", "2", "--type", "static", "--trace", "build.json")
+
+    assert result.returncode == 0, result.stderr
+    with open(tmp_path / "build" / "compile_commands.json") as f:
+        assert sorted(e["file"] for e in json.load(f)) == ["src/f0.c", "src/f1.c", "src/f2.c"]
+    with open(tmp_path / "build.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert sum(e.get("cat") == "compile" for e in events) == 3
+    assert sum(e.get("cat") == "archive" for e in events) == 1
+
+def test_profiles_are_opt_in(tmp_path):
+    write_sources(tmp_path, 1)
+
+    def compile_args(*extra):
+        result = run_build(tmp_path, "--type", "static", *extra)
+        assert result.returncode == 0, result.stderr
+        with open(tmp_path / "build" / "compile_commands.json") as f:
+            [entry] = json.load(f)
+        return entry["arguments"]
+
+    # a plain build keeps assert(): no NDEBUG behind the user's back
+    assert not {"-O2", "-DNDEBUG"} & set(compile_args())
+    assert {"-O2", "-DNDEBUG"} <= set(compile_args("--profile", "release"))
+
+def test_bench_baseline_comparison():
+    from bench_build import compare
+
+    baseline = {"incremental": {"noop": {"median": 0.10}}}
+    fast = {"incremental": {"noop": {"median": 0.11}}}
+    slow = {"incremental": {"noop": {"median": 0.40}}}
+
+    assert compare(fast, baseline, tolerance=0.25, floor=0.05) == []
+    assert len(compare(slow, baseline, tolerance=0.25, floor=0.05)) == 1
+
+def test_watch_rebuilds_on_change(tmp_path):
+    src = write_sources(tmp_path, 2)
+    proc = subprocess.Popen(
+        [sys.executable, "-u", BUILD_LIB, "--sources", "src", "--output", "mylib", "--watch", "--debounce", "100",
+         "--trace", "build.json"],
+        cwd=tmp_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    try:
+        assert "Watching" in wait_for_line(proc, "Watching")
+        with open(os.path.join(src, "f0.c"), "a") as f:
+            f.write("int broken(void) { return }\n")
+        assert "Rebuilt" in wait_for_line(proc, "Rebuilt")
+
+        # a failed rebuild does not stop the watcher
+        os.remove(tmp_path / "build.json")
+        with open(os.path.join(src, "f0.c"), "w") as f:
+            f.write("int f0(void) { return 2; }\n")
+        assert "Rebuilt" in wait_for_line(proc, "Rebuilt")
+        with open(tmp_path / "build.json") as f:
+            events = json.load(f)["traceEvents"]
+        assert sum(e.get("cat") == "compile" for e in events) == 1
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def test_watch_ignores_its_trace_and_unrelated_files(tmp_path):
+    write_sources(tmp_path, 2)
+    proc = subprocess.Popen(
+        [sys.executable, "-u", BUILD_LIB, "--sources", ".", "--output", "mylib", "--watch", "--debounce", "100",
+         "--trace", "trace.json"],
+        cwd=tmp_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    try:
+        assert "Watching" in wait_for_line(proc, "Watching")
+        with open(tmp_path / ".f0.c.swp", "w") as f:
+            f.write("editor state")
+        time.sleep(1.5)
+    finally:
+        proc.terminate()
+        output, _ = proc.communicate()
+
+    assert os.path.isfile(tmp_path / "trace.json")
+    assert "rebuilding" not in output
+
+def wait_for_line(proc, text, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        line = proc.stdout.readline()
+        if text in line:
+            return line
+    return ""
@@ -0,0 +1,385 @@
+import os
+import threading
+import time
+
+import pytest
+
+import fast_copy
+import sync_data
+
+def write_bytes(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def make_tree(root):
+    files = {"slot1/save.dat": b"a" * 5000, "slot2/save.dat": b"b" * 5000, "settings.ini": b"vsync=1\n"}
+    for rel, data in files.items():
+        write_bytes(os.path.join(root, rel), data)
+    return files
+
+def test_unchanged_files_are_not_opened(tmp_path, monkeypatch):
+    files = make_tree(tmp_path / "src")
+
+    stats = sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+    assert stats.as_dict() == {"copied": 3, "skipped": 0, "errors": 0}
+    assert all(read_bytes(tmp_path / "dst" / rel) == data for rel, data in files.items())
+
+    def fail(*args):
+        raise AssertionError("file contents were read")
+    monkeypatch.setattr(sync_data, "file_hash", fail)
+    monkeypatch.setattr(sync_data, "copy2", fail)
+
+    stats = sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+    assert stats.as_dict() == {"copied": 0, "skipped": 3, "errors": 0}
+
+def test_changes_on_either_side_are_synced(tmp_path):
+    make_tree(tmp_path / "src")
+    sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+
+    write_bytes(tmp_path / "src" / "settings.ini", b"vsync=0\n")            # same size, new content
+    write_bytes(tmp_path / "dst" / "slot1" / "save.dat", b"x" * 5000)       # destination damaged
+    os.remove(tmp_path / "dst" / "slot2" / "save.dat")                      # destination lost
+
+    stats = sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+
+    assert stats.copied == 3
+    assert read_bytes(tmp_path / "dst" / "settings.ini") == b"vsync=0\n"
+    assert read_bytes(tmp_path / "dst" / "slot1" / "save.dat") == b"a" * 5000
+    assert read_bytes(tmp_path / "dst" / "slot2" / "save.dat") == b"b" * 5000
+
+def test_checksum_mode_catches_what_stat_data_hides(tmp_path):
+    make_tree(tmp_path / "src")
+    sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+
+    # same size and timestamps, different bytes: invisible without --checksum
+    dst = tmp_path / "dst" / "settings.ini"
+    st = os.stat(dst)
+    write_bytes(dst, b"vsync=9\n")
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert sync_data.sync_folders(tmp_path / "src", tmp_path / "dst").copied == 0
+    assert sync_data.sync_folders(tmp_path / "src", tmp_path / "dst", checksum=True).copied == 1
+    assert read_bytes(dst) == b"vsync=1\n"
+
+def test_output_is_deterministic_across_concurrency(tmp_path, capsys):
+    for i in range(60):
+        write_bytes(tmp_path / "src" / f"d{i % 7}" / f"sub{i % 3}" / f"f{i}.dat", bytes([i]) * (i * 100))
+
+    logs = []
+    for jobs in (1, 8):
+        dst = tmp_path / f"dst{jobs}"
+        stats = sync_data.sync_folders(tmp_path / "src", dst, verbose=True,
+                                       scan_workers=jobs, hash_workers=jobs, copy_workers=jobs)
+        assert stats.files == stats.copied == 60 and stats.bytes == sum(i * 100 for i in range(60))
+        logs.append(capsys.readouterr().out.replace(str(dst), "DST"))
+
+    assert logs[0] == logs[1]
+    expected = []
+    for root, dirs, files in os.walk(tmp_path / "src"):
+        dirs.sort()
+        expected += [os.path.join(root, f) for f in sorted(files)]
+    assert [line.split()[1] for line in logs[0].splitlines()] == expected
+
+def test_same_size_changes_are_hashed_in_parallel(tmp_path):
+    make_tree(tmp_path / "src")
+    sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+    for rel in ("slot1/save.dat", "slot2/save.dat"):
+        write_bytes(tmp_path / "src" / rel, b"c" * 5000)
+
+    stats = sync_data.sync_folders(tmp_path / "src", tmp_path / "dst", hash_workers=4)
+
+    assert (stats.hashed, stats.copied, stats.skipped) == (2, 2, 1)
+    assert read_bytes(tmp_path / "dst" / "slot2" / "save.dat") == b"c" * 5000
+
+def test_delta_sync_rewrites_only_changed_blocks(tmp_path, monkeypatch):
+    data = bytearray(os.urandom(100 * 1024))
+    write_bytes(tmp_path / "src" / "world.dat", bytes(data))
+    options = dict(delta_threshold=1, block_size=4096)
+    sync_data.sync_folders(tmp_path / "src", tmp_path / "dst", **options)
+
+    for edit in range(2):
+        data[5000 + edit:5004 + edit] = b"EDIT"
+        data[70000] ^= 1
+        write_bytes(tmp_path / "src" / "world.dat", bytes(data))
+
+        stats = sync_data.sync_folders(tmp_path / "src", tmp_path / "dst", **options)
+
+        assert (stats.copied, stats.delta, stats.written_bytes) == (1, 1, 2 * 4096)
+        assert read_bytes(tmp_path / "dst" / "world.dat") == bytes(data)
+        # from now on the stored signatures stand in for reading the destination
+        monkeypatch.setattr(sync_data, "file_signatures", None)
+
+    assert not any(name.endswith(".syncdelta") for name in os.listdir(tmp_path / "dst"))
+
+@pytest.mark.parametrize("size", [0, 4096, 10000, 200000])
+def test_delta_sync_handles_size_changes(tmp_path, size):
+    write_bytes(tmp_path / "src.dat", os.urandom(50000))
+    write_bytes(tmp_path / "dst.dat", read_bytes(tmp_path / "src.dat"))
+    new = read_bytes(tmp_path / "src.dat")[:size] + os.urandom(max(size - 50000, 0))
+    write_bytes(tmp_path / "src.dat", new)
+
+    _, _, written, changed = sync_data.delta_sync(str(tmp_path / "src.dat"), str(tmp_path / "dst.dat"), None, 4096)
+
+    assert read_bytes(tmp_path / "dst.dat") == new
+    assert changed and written <= max(size - 49152, 4096)
+
+def test_interrupted_delta_sync_is_replayed(tmp_path, monkeypatch):
+    write_bytes(tmp_path / "dst.dat", b"a" * 20000)
+    write_bytes(tmp_path / "src.dat", b"a" * 10000 + b"b" * 15000)
+    real_replay = sync_data.replay_journal
+    calls = []
+
+    def crash_after_journal(path):
+        calls.append(path)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return real_replay(path)
+    monkeypatch.setattr(sync_data, "replay_journal", crash_after_journal)
+
+    with pytest.raises(KeyboardInterrupt):
+        sync_data.delta_sync(str(tmp_path / "src.dat"), str(tmp_path / "dst.dat"), None, 4096)
+    assert read_bytes(tmp_path / "dst.dat") == b"a" * 20000
+
+    assert real_replay(str(tmp_path / "dst.dat"))
+    assert read_bytes(tmp_path / "dst.dat") == b"a" * 10000 + b"b" * 15000
+    assert sorted(os.listdir(tmp_path)) == ["dst.dat", "src.dat"]
+
+@pytest.mark.parametrize("method", fast_copy.METHODS)
+def test_copy_engine_keeps_contents_and_holes(tmp_path, method):
+    data = os.urandom(300000)
+    write_bytes(tmp_path / "save.dat", data)
+    with open(tmp_path / "sparse.dat", "wb") as f:
+        f.write(data)
+        f.truncate(64 * 1024 * 1024)        # a trailing 64 MB hole
+        f.seek(32 * 1024 * 1024)
+        f.write(b"middle")
+    copier = fast_copy.Copier([method])
+
+    copier.copy_file(tmp_path / "save.dat", tmp_path / "copy.dat")
+    assert read_bytes(tmp_path / "copy.dat") == data
+
+    copier.copy_file(tmp_path / "sparse.dat", tmp_path / "copy.dat")
+    assert read_bytes(tmp_path / "copy.dat") == read_bytes(tmp_path / "sparse.dat")
+    if os.stat(tmp_path / "sparse.dat").st_blocks * 512 < 16 * 1024 * 1024:
+        assert os.stat(tmp_path / "copy.dat").st_blocks * 512 < 16 * 1024 * 1024
+
+def test_copy_engine_falls_back_when_unsupported(tmp_path, monkeypatch):
+    import errno
+
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, "cross-device")
+    monkeypatch.setattr(fast_copy, "_reflink", lambda src_fd, dst_fd: False)
+    monkeypatch.setattr(fast_copy.os, "copy_file_range", unsupported, raising=False)
+    monkeypatch.setattr(fast_copy.os, "sendfile", unsupported, raising=False)
+    write_bytes(tmp_path / "save.dat", b"x" * 3000000)
+
+    assert fast_copy.Copier().copy_file(tmp_path / "save.dat", tmp_path / "copy.dat") == "readinto"
+    assert read_bytes(tmp_path / "copy.dat") == b"x" * 3000000
+
+def tree_contents(root):
+    return {os.path.relpath(os.path.join(d, f), root): read_bytes(os.path.join(d, f))
+            for d, _, files in os.walk(root) for f in files if not f.startswith(sync_data.MANIFEST_NAME)}
+
+def test_mirror_plans_then_renames_and_deletes(tmp_path, monkeypatch, capsys):
+    make_tree(tmp_path / "src")
+    write_bytes(tmp_path / "src" / "slot1" / "world.dat", os.urandom(200000))
+    sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+
+    os.makedirs(tmp_path / "src" / "archive")
+    os.rename(tmp_path / "src" / "slot1" / "world.dat", tmp_path / "src" / "archive" / "world.dat")   # moved
+    write_bytes(tmp_path / "src" / "slot3" / "save.dat", read_bytes(tmp_path / "src" / "slot2" / "save.dat"))
+    os.remove(tmp_path / "src" / "slot2" / "save.dat")                                               # copied
+    os.rmdir(tmp_path / "src" / "slot2")
+    write_bytes(tmp_path / "src" / "settings.ini", b"vsync=0, fov=90\n")
+    write_bytes(tmp_path / "dst" / "junk.txt", b"not in the source")
+    before = tree_contents(tmp_path / "dst")
+
+    plan, _ = sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst", dry_run=True)
+    assert [(old, new) for old, new, *_ in plan.renames] == [("slot1/world.dat", "archive/world.dat"),
+                                                             ("slot2/save.dat", "slot3/save.dat")]
+    assert (plan.changes, plan.deletes, plan.rmdirs) == ([("update", "settings.ini", 16)], ["junk.txt"], ["slot2/"])
+    assert "up to 0.0 MB to transfer" in capsys.readouterr().out
+    assert tree_contents(tmp_path / "dst") == before
+
+    copied = []
+    monkeypatch.setattr(sync_data, "copy2", lambda src, dst: copied.append(src) or sync_data.shutil.copy2(src, dst))
+    _, stats = sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+
+    assert (stats.copied, stats.renamed, stats.deleted, stats.errors) == (1, 2, 1, 0)
+    assert copied == [os.path.join(tmp_path / "src", "settings.ini")]
+    assert tree_contents(tmp_path / "dst") == tree_contents(tmp_path / "src")
+    assert not os.path.exists(tmp_path / "dst" / "slot2")
+
+    # the renamed files are recorded under their new paths
+    stats = sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+    assert stats.as_dict() == {"copied": 0, "skipped": 4, "errors": 0}
+
+def test_mirror_dry_run_leaves_the_manifest_untouched(tmp_path):
+    make_tree(tmp_path / "src")
+    sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+    manifest = tmp_path / "dst" / sync_data.MANIFEST_NAME
+    before = (read_bytes(manifest), os.stat(manifest).st_mtime_ns)
+    write_bytes(tmp_path / "src" / "settings.ini", b"vsync=0\n")
+
+    # from another source folder the manifest would be cleared on open
+    os.rename(tmp_path / "src", tmp_path / "moved")
+    plan, _ = sync_data.mirror_folders(tmp_path / "moved", tmp_path / "dst", dry_run=True)
+
+    assert plan.changes
+    assert (read_bytes(manifest), os.stat(manifest).st_mtime_ns) == before
+    # and no -wal / -shm files are left next to it
+    assert set(os.listdir(tmp_path / "dst")) == set(os.listdir(tmp_path / "moved")) | {sync_data.MANIFEST_NAME}
+
+def test_mirror_replaces_files_and_folders_that_changed_type(tmp_path):
+    make_tree(tmp_path / "src")
+    write_bytes(tmp_path / "src" / "notes", b"a file, later a folder")
+    os.makedirs(tmp_path / "src" / "maps" / "old")
+    write_bytes(tmp_path / "src" / "maps" / "old" / "a.map", b"a folder, later a file")
+    write_bytes(tmp_path / "src" / "maps" / "b.map", os.urandom(5000))
+    sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+
+    os.remove(tmp_path / "src" / "notes")
+    os.makedirs(tmp_path / "src" / "notes")
+    write_bytes(tmp_path / "src" / "notes" / "todo.txt", b"now inside a folder")
+    os.rename(tmp_path / "src" / "maps" / "b.map", tmp_path / "src" / "b.map")
+    sync_data.shutil.rmtree(tmp_path / "src" / "maps")
+    write_bytes(tmp_path / "src" / "maps", b"now a file")
+
+    _, stats = sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+
+    assert stats.errors == 0 and stats.renamed == 1
+    assert tree_contents(tmp_path / "dst") == tree_contents(tmp_path / "src")
+    assert os.path.isfile(tmp_path / "dst" / "maps") and os.path.isdir(tmp_path / "dst" / "notes")
+
+    # and nothing is left to do
+    plan, _ = sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst", dry_run=True)
+    assert (plan.changes, plan.renames, plan.deletes, plan.rmdirs, plan.replaced) == ([], [], [], [], [])
+
+def test_mirror_deletes_nothing_after_a_scan_error(tmp_path, monkeypatch):
+    make_tree(tmp_path / "src")
+    sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+    real_scan_dir = sync_data.scan_dir
+
+    def scan_dir(path):
+        if path.endswith(os.path.join("src", "slot1")):
+            raise PermissionError("denied")
+        return real_scan_dir(path)
+    monkeypatch.setattr(sync_data, "scan_dir", scan_dir)
+
+    _, stats = sync_data.mirror_folders(tmp_path / "src", tmp_path / "dst")
+    assert (stats.deleted, stats.errors) == (0, 1)
+    assert os.path.exists(tmp_path / "dst" / "slot1" / "save.dat")
+
+def test_copy_engine_resumes_after_short_and_failed_kernel_copies(tmp_path, monkeypatch):
+    import errno
+
+    data = os.urandom(3000000)
+    write_bytes(tmp_path / "save.dat", data)
+    calls = {"copy_file_range": 0, "sendfile": 0}
+    real_sendfile = os.sendfile
+
+    def copy_file_range(src_fd, dst_fd, count, offset_src, offset_dst):
+        # copies a little, then reports end of file early
+        calls["copy_file_range"] += 1
+        if calls["copy_file_range"] > 2:
+            return 0
+        chunk = os.pread(src_fd, 100000, offset_src)
+        return os.pwrite(dst_fd, chunk, offset_dst)
+
+    def sendfile(out_fd, in_fd, offset, count):
+        calls["sendfile"] += 1
+        if calls["sendfile"] > 3:
+            raise OSError(errno.EINVAL, "unsupported")
+        return real_sendfile(out_fd, in_fd, offset, min(count, 50000))
+    monkeypatch.setattr(fast_copy, "_reflink", lambda src_fd, dst_fd: False)
+    monkeypatch.setattr(fast_copy.os, "copy_file_range", copy_file_range, raising=False)
+    monkeypatch.setattr(fast_copy.os, "sendfile", sendfile, raising=False)
+
+    assert fast_copy.Copier().copy_file(tmp_path / "save.dat", tmp_path / "copy.dat") == "readinto"
+    assert read_bytes(tmp_path / "copy.dat") == data
+    assert calls == {"copy_file_range": 3, "sendfile": 4}
+
+    # nothing left to fall back to: a short copy is an error, not a truncated file
+    with open(tmp_path / "save.dat", "rb") as src, open(tmp_path / "copy.dat", "wb") as dst:
+        with pytest.raises(OSError):
+            fast_copy.Copier(["readinto"]).copy_range(src.fileno(), dst.fileno(), 0, len(data) + 1)
+
+def test_dirty_paths_are_coalesced_until_quiet():
+    dirty = sync_data.DirtySet(settle=2, max_delay=10)
+    for t in (0, 0.5, 1):
+        dirty.add("slot1/save.dat", now=t)         # one file written in bursts
+    dirty.add("settings.ini", now=0.5)
+
+    assert dirty.pop_ready(now=2.4) == []
+    assert dirty.pop_ready(now=2.6) == ["settings.ini"]
+    assert dirty.pop_ready(now=3.0) == ["slot1/save.dat"]
+
+    # a file that never goes quiet is still synced after max_delay
+    for t in range(11):
+        dirty.add("live.log", now=t)
+    assert dirty.pop_ready(now=10) == ["live.log"]
+    assert len(dirty) == 0
+
+def test_watch_syncs_only_dirty_paths(tmp_path):
+    make_tree(tmp_path / "src")
+    sync_data.sync_folders(tmp_path / "src", tmp_path / "dst")
+
+    write_bytes(tmp_path / "src" / "settings.ini", b"vsync=0\n")
+    write_bytes(tmp_path / "src" / "slot1" / "save.dat", b"c" * 6000)        # changed, but no event
+    write_bytes(tmp_path / "src" / "slot3" / "a.dat", b"new")                # a new folder
+    write_bytes(tmp_path / "src" / "slot3" / "deep" / "b.dat", b"new")
+
+    manifest = sync_data.Manifest(tmp_path / "dst" / sync_data.MANIFEST_NAME, tmp_path / "src")
+    try:
+        stats = sync_data.sync_dirty(str(tmp_path / "src"), str(tmp_path / "dst"), manifest,
+                                     ["gone.dat", "settings.ini", "slot3/"], sync_data.SyncOptions())
+        assert stats.as_dict() == {"copied": 3, "skipped": 0, "errors": 0}
+        assert read_bytes(tmp_path / "dst" / "slot1" / "save.dat") == b"a" * 5000
+        assert read_bytes(tmp_path / "dst" / "slot3" / "deep" / "b.dat") == b"new"
+        # a partial pass keeps the manifest entries of files it did not look at
+        assert "slot2/save.dat" in manifest.entries
+
+        # the audit scan catches the change no event was seen for
+        stats = sync_data.full_sync(str(tmp_path / "src"), str(tmp_path / "dst"), manifest,
+                                    sync_data.SyncOptions())
+        assert stats.as_dict() == {"copied": 1, "skipped": 4, "errors": 0}
+    finally:
+        manifest.close()
+
+def test_watch_mode_syncs_new_writes(tmp_path):
+    pytest.importorskip("watchdog")
+    make_tree(tmp_path / "src")
+    stop = threading.Event()
+    watcher = threading.Thread(target=sync_data.watch_folders, args=(tmp_path / "src", tmp_path / "dst"),
+                               kwargs=dict(settle=0.1, stop=stop))
+    watcher.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(tmp_path / "dst" / "settings.ini") and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        for i in range(5):
+            write_bytes(tmp_path / "src" / "slot1" / "save.dat", b"%d" % i * 5000)
+        while read_bytes(tmp_path / "dst" / "slot1" / "save.dat") != b"4" * 5000 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        watcher.join()
+
+    assert read_bytes(tmp_path / "dst" / "slot1" / "save.dat") == b"4" * 5000
+
+def test_sync_benchmark_runs(tmp_path):
+    import bench_sync
+
+    results = bench_sync.main(["--size", "2", "--edits", "3", "--block-size", "16", "--repeat", "1",
+                               "--workdir", str(tmp_path)])
+
+    assert set(results["copies"]["world.dat"]) == set(bench_sync.ENGINES)
+    case = results["delta"]["3 edits"]
+    assert case["copy"]["written_mb"] > 2
+    assert 0 < case["delta"]["written_mb"] <= 3 * 16 * 1024 / 1e6
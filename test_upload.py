@@ -0,0 +1,162 @@
+import os
+import socket
+import time
+
+import upload_files
+from upload_server import UploadServer
+
+def make_files(folder, count, size=1000):
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"save{i}.dat")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_burst_is_uploaded_over_kept_alive_connections(tmp_path):
+    paths = make_files(tmp_path, 30)
+
+    with UploadServer() as server:
+        uploader = upload_files.Uploader(server.url, workers=4, queue_size=5, verbose=False)
+        for path in paths:
+            uploader.submit(path)
+        uploader.close()
+
+    assert sorted(r["name"] for r in server.received) == sorted(os.path.basename(p) for p in paths)
+    assert all(r["bytes"] > 1000 for r in server.received)
+    assert len(server.connections) <= 4
+    m = uploader.metrics.as_dict()
+    assert (m["uploaded"], m["failed"], m["bytes"], m["statuses"]) == (30, 0, 30000, {200: 30})
+
+def test_busy_server_is_retried_with_backoff(tmp_path):
+    [path] = make_files(tmp_path, 1)
+
+    with UploadServer(fail=3) as server:
+        uploader = upload_files.Uploader(server.url, workers=1, backoff_base=0.01, verbose=False)
+        assert uploader.upload(path)
+        uploader.close()
+
+    m = uploader.metrics.as_dict()
+    assert (m["uploaded"], m["attempts"], m["retries"], m["statuses"]) == (1, 4, 3, {503: 3, 200: 1})
+    assert len(server.received) == 1
+
+def test_unreachable_server_gives_up_after_retries(tmp_path):
+    [path] = make_files(tmp_path, 1)
+    uploader = upload_files.Uploader(f"http://127.0.0.1:{free_port()}/upload", workers=1, max_retries=2,
+                                     backoff_base=0.01, verbose=False)
+
+    assert not uploader.upload(path)
+    uploader.close()
+
+    m = uploader.metrics.as_dict()
+    assert (m["uploaded"], m["failed"], m["attempts"], m["errors"]) == (0, 1, 3, {"ConnectionError": 3})
+
+def test_close_without_wait_drops_the_backlog(tmp_path):
+    paths = make_files(tmp_path, 10)
+    done = []
+
+    with UploadServer(latency=0.2) as server:
+        uploader = upload_files.Uploader(server.url, workers=1, queue_size=10, verbose=False,
+                                         on_done=lambda path, ok: done.append((path, ok)))
+        for path in paths:
+            uploader.submit(path)
+        start = time.perf_counter()
+        uploader.close(wait=False)
+        elapsed = time.perf_counter() - start
+
+    # at most the upload already in flight finishes; the rest are not sent
+    assert elapsed < 1.0
+    assert len(server.received) <= 1
+    assert sorted(path for path, _ in done) == sorted(paths)
+    assert sum(ok for _, ok in done) == len(server.received)
+
+def test_events_are_debounced_until_the_file_settles(tmp_path):
+    [path] = make_files(tmp_path, 1)
+    pending = upload_files.PendingFiles(settle=2, closed_settle=0.25)
+
+    for t in (0, 0.5, 1):
+        pending.touch(path, now=t)                     # one file, written in bursts
+    assert pending.ready(now=2.5) == []                # not quiet long enough
+    assert pending.ready(now=3.1) == []                # first look at its size and mtime
+    with open(path, "ab") as f:                        # still growing, events or not
+        f.write(b"more")
+    assert pending.ready(now=5.2) == []
+    assert [p for p, _ in pending.ready(now=7.3)] == [path]
+    assert len(pending) == 0
+
+    # a close after writing settles it at once, unless writing resumes
+    pending.touch(path, closed=True, now=0)
+    assert [p for p, _ in pending.ready(now=0.3)] == [path]
+    pending.touch(path, closed=True, now=0)
+    pending.touch(path, now=0.1)
+    assert pending.ready(now=0.5) == []
+
+def test_unchanged_content_is_not_uploaded_again(tmp_path, monkeypatch):
+    [path] = make_files(tmp_path, 1)
+    uploaded = upload_files.UploadedFiles()
+
+    assert uploaded.changed(path, os.stat(path))
+    real_digest = upload_files.file_digest
+    monkeypatch.setattr(upload_files, "file_digest", None)
+    assert not uploaded.changed(path, os.stat(path))   # same stat data: not even read
+
+    monkeypatch.setattr(upload_files, "file_digest", real_digest)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert not uploaded.changed(path, os.stat(path))   # touched only
+    with open(path, "r+b") as f:
+        f.write(b"new")
+    assert uploaded.changed(path, os.stat(path))
+
+    uploaded.on_done(path, False)                       # a failed upload is retried on the next event
+    assert uploaded.changed(path, os.stat(path))
+    assert uploaded.unchanged == 2
+
+def test_file_written_in_pieces_is_uploaded_once(tmp_path):
+    from watchdog.observers import Observer
+
+    folder = tmp_path / "files"
+    folder.mkdir()
+    pending = upload_files.PendingFiles(settle=0.3)
+    uploaded = upload_files.UploadedFiles()
+    observer = Observer()
+    observer.schedule(upload_files.UploadHandler(pending), str(folder), recursive=False)
+    observer.start()
+
+    with UploadServer() as server:
+        uploader = upload_files.Uploader(server.url, workers=2, verbose=False, on_done=uploaded.on_done)
+        try:
+            with open(folder / "save.dat", "wb") as f:
+                for _ in range(5):
+                    f.write(os.urandom(100000))
+                    f.flush()
+                    time.sleep(0.05)
+            os.utime(folder / "save.dat")                  # touched again: content unchanged
+
+            deadline = time.monotonic() + 10
+            while (len(pending) or not server.received) and time.monotonic() < deadline:
+                time.sleep(0.05)
+                upload_files.enqueue_settled(pending, uploaded, uploader)
+            time.sleep(0.5)
+            upload_files.enqueue_settled(pending, uploaded, uploader)
+        finally:
+            observer.stop()
+            observer.join()
+            uploader.close()
+
+    assert [(r["name"], r["bytes"] > 500000) for r in server.received] == [("save.dat", True)]
+
+def test_upload_benchmark_runs(tmp_path):
+    import bench_upload
+
+    results = bench_upload.main(["--files", "6", "--size", "4", "--workers", "3", "--latency", "0",
+                                 "--repeat", "1", "--workdir", str(tmp_path)])
+
+    assert results["serial"]["connections"] == 6
+    assert results["pool-3"]["connections"] <= 3
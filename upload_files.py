@@ -1,33 +1,432 @@
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import requests
+from requests.adapters import HTTPAdapter
+import os
+import sys
 import time
+import queue
+import hashlib
+import random
+import argparse
+import threading
+from collections import Counter
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
 
 UPLOAD_URL = "https://example.com/upload"
 
+WATCH_FOLDER = "files"
+
+# Uploads in flight at once; they share one keep-alive session
+UPLOAD_WORKERS = 4
+
+# Files waiting for a worker; when full, new events wait (back-pressure)
+QUEUE_SIZE = 1000
+
+# Retries per file after a connection error, timeout or retryable status,
+# waiting BACKOFF_BASE * 2^attempt seconds (with jitter, at most BACKOFF_MAX)
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (10, 120)
+
+# A file is uploaded once it has had no events for SETTLE seconds and its
+# size and mtime have stopped changing, or CLOSED_SETTLE seconds after the
+# writer closed it (where the platform reports that)
+SETTLE = 2.0
+CLOSED_SETTLE = 0.25
+CHECK_INTERVAL = 0.1
+
+HASH_BUFFER = 1024 * 1024
+
+# ==========================================
+# METRICS
+# ==========================================
+
+class UploadMetrics:
+    """Thread-safe counters for an Uploader: outcomes, HTTP statuses, retries and bytes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.statuses = Counter()       # HTTP status -> responses
+        self.errors = Counter()         # exception type -> attempts
+        self.attempts = 0
+        self.retries = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0              # summed request time of successful uploads
+
+    def attempt(self, status=None, error=None):
+        with self._lock:
+            self.attempts += 1
+            if status is not None:
+                self.statuses[status] += 1
+            if error is not None:
+                self.errors[type(error).__name__] += 1
+
+    def retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def done(self, ok, size=0, seconds=0.0):
+        with self._lock:
+            if ok:
+                self.uploaded += 1
+                self.bytes += size
+                self.seconds += seconds
+            else:
+                self.failed += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {"uploaded": self.uploaded, "failed": self.failed, "attempts": self.attempts,
+                    "retries": self.retries, "bytes": self.bytes, "statuses": dict(self.statuses),
+                    "errors": dict(self.errors)}
+
+    def summary(self):
+        m = self.as_dict()
+        seconds = max(time.monotonic() - self.started, 1e-9)
+        statuses = ", ".join(f"{code}: {n}" for code, n in sorted(m["statuses"].items())) or "none"
+        errors = ", ".join(f"{name}: {n}" for name, n in sorted(m["errors"].items())) or "none"
+        return (f"{m['uploaded']} uploaded ({m['bytes'] / 1e6:.1f} MB, {m['bytes'] / 1e6 / seconds:.1f} MB/s), "
+                f"{m['failed']} failed, {m['retries']} retries; statuses {statuses}; errors {errors}")
+
+# ==========================================
+# UPLOADER
+# ==========================================
+
+class Uploader:
+    """
+    Bounded queue of files to upload, served by a pool of worker threads.
+    The workers share one requests.Session, so connections are kept alive
+    and reused instead of opened per file.
+    """
+
+    def __init__(self, url=UPLOAD_URL, workers=UPLOAD_WORKERS, queue_size=QUEUE_SIZE,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 timeout=TIMEOUT, verbose=True, on_done=None):
+        self.url = url
+        # called with (path, accepted?) after each file
+        self.on_done = on_done
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.verbose = verbose
+        self.metrics = UploadMetrics()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopping = threading.Event()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.workers = [threading.Thread(target=self._work, name=f"upload-{i}", daemon=True)
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, path):
+        # blocks while the queue is full
+        self.queue.put(path)
+
+    def _work(self):
+        while True:
+            path = self.queue.get()
+            ok = False
+            try:
+                if path is None:
+                    return
+                # close(wait=False): what is still queued is dropped, not sent
+                if not self.stopping.is_set():
+                    ok = self.upload(path)
+            except Exception as e:
+                # a worker must survive anything one file throws at it
+                self.metrics.done(False)
+                print(f"Failed: {path}: {e}", file=sys.stderr)
+            finally:
+                if path is not None and self.on_done:
+                    self.on_done(path, ok)
+                self.queue.task_done()
+
+    def backoff(self, attempt, response=None):
+        # a server's Retry-After (in seconds) wins over our own schedule
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def upload(self, path):
+        """Upload one file, retrying transient failures; returns whether it was accepted."""
+        name = os.path.basename(path)
+
+        for attempt in range(self.max_retries + 1):
+            if self.verbose:
+                print("Uploading:", path)
+            response = None
+            start = time.perf_counter()
+
+            try:
+                size = os.path.getsize(path)
+                with open(path, "rb") as f:
+                    response = self.session.post(self.url, files={"file": (name, f)}, timeout=self.timeout)
+            except FileNotFoundError:
+                # deleted before we got to it: nothing left to upload
+                self.metrics.done(False)
+                print(f"Gone: {path}", file=sys.stderr)
+                return False
+            except requests.RequestException as e:
+                self.metrics.attempt(error=e)
+                error = e
+            else:
+                self.metrics.attempt(status=response.status_code)
+                if response.ok:
+                    self.metrics.done(True, size, time.perf_counter() - start)
+                    if self.verbose:
+                        print("Done:", response.status_code)
+                    return True
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                error = f"HTTP {response.status_code}"
+
+            if attempt == self.max_retries or self.stopping.is_set():
+                break
+            delay = self.backoff(attempt, response)
+            print(f"Retrying {path} in {delay:.1f}s ({error})", file=sys.stderr)
+            self.metrics.retry()
+            if self.stopping.wait(delay):
+                break
+
+        self.metrics.done(False)
+        status = response.status_code if response is not None else "no response"
+        print(f"Failed: {path} ({status})", file=sys.stderr)
+        return False
+
+    def close(self, wait=True):
+        """
+        Stop the workers. With wait, every queued file is uploaded first;
+        without, the files still queued are dropped (reported to on_done as
+        not accepted) and retries in progress are cut short.
+        """
+        if not wait:
+            self.stopping.set()
+            # the sentinels must not wait behind the backlog, nor block on a full queue
+            while True:
+                try:
+                    path = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if path is not None and self.on_done:
+                    self.on_done(path, False)
+                self.queue.task_done()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.session.close()
+
+# ==========================================
+# WATCHER
+# ==========================================
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    buffer = bytearray(HASH_BUFFER)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buffer):
+            sha256.update(view[:n])
+    return sha256.hexdigest()
+
+class PendingFiles:
+    """
+    Files with recent events, held back until they look complete. Events
+    for a path only push its deadline back, so a file written in many
+    pieces is looked at once. A file is complete when it has been quiet for
+    `settle` seconds and its size and mtime are the same as at the previous
+    look, or `closed_settle` seconds after a close-after-write event.
+    """
+
+    def __init__(self, settle=SETTLE, closed_settle=CLOSED_SETTLE):
+        self.settle = settle
+        self.closed_settle = closed_settle
+        self._lock = threading.Lock()
+        self.paths = {}                 # path -> [last event, closed?, (size, mtime_ns) at last look]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def touch(self, path, closed=False, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self.paths.setdefault(path, [now, False, None])
+            state[0] = now
+            # a later write reopens what a close had finished
+            state[1] = closed
+
+    def discard(self, path):
+        with self._lock:
+            self.paths.pop(path, None)
+
+    def ready(self, now=None):
+        """Pop and return the paths that are complete, as [(path, stat)]."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = [(path, state, state[0]) for path, state in self.paths.items()
+                   if now - state[0] >= (self.closed_settle if state[1] else self.settle)]
+
+        complete = []
+        for path, state, last_event in due:
+            try:
+                st = os.stat(path)
+            except OSError:
+                # gone (or moved away) before it settled
+                self.discard(path)
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            with self._lock:
+                if self.paths.get(path) is not state or state[0] != last_event:
+                    # another event came in meanwhile
+                    continue
+                if state[1] or state[2] == key:
+                    del self.paths[path]
+                    complete.append((path, st))
+                else:
+                    # still growing, or first look: look again after another quiet spell
+                    state[0] = now
+                    state[2] = key
+
+        return sorted(complete)
+
+class UploadedFiles:
+    """
+    What was last sent for each path: size, mtime and SHA-256. A settled
+    file whose stat data is unchanged is skipped without being read; one
+    whose content hashes the same (touched, or rewritten identically) is
+    skipped too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = {}
+        self.unchanged = 0
+
+    def changed(self, path, st):
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            last = self.files.get(path)
+        if last and last[:2] == key:
+            self.unchanged += 1
+            return False
+        digest = file_digest(path)
+        with self._lock:
+            self.files[path] = key + (digest,)
+        if last and last[2] == digest:
+            self.unchanged += 1
+            return False
+        return True
+
+    def forget(self, path):
+        with self._lock:
+            self.files.pop(path, None)
+
+    def on_done(self, path, ok):
+        # a failed upload must not look sent: the next event retries it
+        if not ok:
+            self.forget(path)
+
 class UploadHandler(FileSystemEventHandler):
 
+    # runs on watchdog's observer thread: only notes the path
+    def __init__(self, pending):
+        self.pending = pending
+
     def on_created(self, event):
         if not event.is_directory:
-            print("Uploading:", event.src_path)
+            self.pending.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.pending.touch(event.src_path)
+
+    def on_closed(self, event):
+        # close after write (inotify IN_CLOSE_WRITE)
+        if not event.is_directory:
+            self.pending.touch(event.src_path, closed=True)
+
+    def on_moved(self, event):
+        # e.g. a downloader renaming its .part file once complete
+        if not event.is_directory:
+            self.pending.discard(event.src_path)
+            self.pending.touch(event.dest_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.pending.discard(event.src_path)
+
+def enqueue_settled(pending, uploaded, uploader, now=None):
+    """Hand complete, changed files over to the uploader; returns how many."""
+    count = 0
+    for path, st in pending.ready(now):
+        try:
+            if not uploaded.changed(path, st):
+                continue
+        except OSError:
+            continue
+        uploader.submit(path)
+        count += 1
+    return count
+
+# ==========================================
+# RUN
+# ==========================================
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Upload files as they appear in a folder.")
+
+    parser.add_argument("--url", default=UPLOAD_URL, help="Upload endpoint")
+    parser.add_argument("--folder", default=WATCH_FOLDER, help="Folder to watch")
+    parser.add_argument("-j", "--workers", type=int, default=UPLOAD_WORKERS, help="Concurrent uploads")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Files waiting for a worker")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="Retries per file")
+    parser.add_argument("--settle", type=float, default=SETTLE, metavar="SECONDS",
+                        help="Upload a file once it has been unchanged this long")
+
+    return parser.parse_args()
+
+def main():
+
+    args = parse_args()
 
-            with open(event.src_path, "rb") as f:
-                response = requests.post(
-                    UPLOAD_URL,
-                    files={"file": f}
-                )
+    pending = PendingFiles(args.settle)
+    uploaded = UploadedFiles()
+    uploader = Uploader(args.url, args.workers, args.queue_size, args.retries, on_done=uploaded.on_done)
 
-            print("Done:", response.status_code)
+    observer = Observer()
+    observer.schedule(UploadHandler(pending), path=args.folder, recursive=False)
 
-observer = Observer()
-observer.schedule(UploadHandler(), path="files", recursive=False)
+    observer.start()
 
-observer.start()
+    try:
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            enqueue_settled(pending, uploaded, uploader)
+    except KeyboardInterrupt:
+        observer.stop()
 
-try:
-    while True:
-        time.sleep(1)
-except KeyboardInterrupt:
-    observer.stop()
+    observer.join()
+    uploader.close(wait=False)
+    print(f"{uploader.metrics.summary()}; {uploaded.unchanged} unchanged files skipped")
 
-observer.join()
+if __name__ == "__main__":
+    main()
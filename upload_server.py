@@ -0,0 +1,125 @@
+"""
+upload_server.py
+
+Local stand-in for the upload endpoint of upload_files.py, for tests and
+benchmarks.
+
+It accepts multipart POSTs on any path over HTTP/1.1 keep-alive and
+records, for every upload, the file name, the size of the body and the
+connection it came in on, so connection reuse can be checked. Faults can
+be injected: a fixed latency per request, and a number of requests to
+answer with 503 (and Retry-After: 0) before accepting any.
+
+Usage examples:
+  python upload_server.py --port 8000
+  python upload_server.py --port 8000 --latency 50 --fail 3
+"""
+
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILENAME = re.compile(rb'filename="([^"]*)"')
+
+
+class UploadRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes; Nagle would hold the
+    # second one back for the client's delayed ACK (40 ms per request)
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            fail = server.fail_next > 0
+            if fail:
+                server.fail_next -= 1
+            else:
+                match = FILENAME.search(body[:4096])
+                server.received.append({"name": match.group(1).decode() if match else None,
+                                        "bytes": len(body), "connection": self.client_address})
+            server.connections.add(self.client_address)
+
+        if fail:
+            self.reply(503, b"busy", {"Retry-After": "0"})
+        else:
+            self.reply(200, b"ok")
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UploadServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that records uploads; start() serves it on a background thread."""
+
+    daemon_threads = True
+    # the default backlog of 5 resets connections from a burst of workers
+    request_queue_size = 128
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, fail=0):
+        super().__init__((host, port), UploadRequestHandler)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.fail_next = fail
+        self.received = []
+        self.connections = set()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/upload"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local stand-in for the upload endpoint.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--latency", type=float, default=0, help="Delay per request in ms.")
+    ap.add_argument("--fail", type=int, default=0, help="Answer this many requests with 503 first.")
+    args = ap.parse_args(argv)
+
+    server = UploadServer(args.host, args.port, args.latency / 1000, args.fail)
+    print(f"Accepting uploads at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"{len(server.received)} uploads over {len(server.connections)} connections")
+
+if __name__ == "__main__":
+    main()